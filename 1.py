@@ -1,9 +1,17 @@
 import streamlit as st
 import rasterio
 import pandas as pd
+import os
 import tempfile
 import re
 from simplekml import Kml
+from ingest import NUMERIC, TEXT, MissingColumnsError, read_workbooks
+from instrumentation import count, diagnostics_options, render_diagnostics, stage, track_run
+from interpolation import DESIGN_PROPERTIES, INTERPOLATION_METHODS, interpolate_to_raster
+from jobs import current_job, recent_jobs_sidebar, render_job, submit_job
+from quicklook import quicklook
+
+BOREHOLE_LOCATION_COLUMNS = {"sr.no": None, "Test_location_2": TEXT, "Northing": NUMERIC, "Easting": NUMERIC}
 
 def check_tiff_files(file_paths):
     results = []
@@ -11,7 +19,8 @@ def check_tiff_files(file_paths):
 
     for i, file in enumerate(file_paths, start=1):
         try:
-            with rasterio.open(file) as src:
+            count("bytes read", file.size)
+            with stage("header read"), rasterio.open(file) as src:
                 crs = src.crs
                 epsg = crs.to_epsg() if crs else "Unknown"
                 resolution = src.res
@@ -29,9 +38,29 @@ def check_tiff_files(file_paths):
     df = pd.DataFrame(results)
     return df, crs_set
 
+def quicklook_panel(files):
+    """Band thumbnails and approximate statistics of each raster, kept per upload across reruns."""
+    st.subheader("Quick Look")
+    previews = st.session_state.setdefault("quicklooks", {})
+    for file in files:
+        with st.expander(file.name, expanded=len(files) == 1):
+            if file.file_id not in previews:
+                try:
+                    with rasterio.open(file) as src:
+                        previews[file.file_id] = quicklook(src)
+                except Exception as e:
+                    st.error(f"Error previewing file {file.name}: {e}")
+                    continue
+            images, stats = previews[file.file_id]
+            columns = st.columns(min(4, len(images)))
+            for i, (name, image) in enumerate(images.items()):
+                columns[i % len(columns)].image(image, caption=name)
+            st.dataframe(stats, hide_index=True)
+
 def create_multiband_raster(file_paths, output_path):
     try:
-        sources = [rasterio.open(f) for f in file_paths]
+        with stage("raster open"):
+            sources = [rasterio.open(f) for f in file_paths]
 
         with rasterio.open(
             output_path, 'w',
@@ -44,7 +73,11 @@ def create_multiband_raster(file_paths, output_path):
             dtype=sources[0].dtypes[0]
         ) as dst:
             for idx, src in enumerate(sources):
-                dst.write(src.read(1), idx + 1)
+                with stage("raster read"):
+                    band = src.read(1)
+                count("raster bytes decoded", band.nbytes)
+                with stage("raster write"):
+                    dst.write(band, idx + 1)
                 band_name = file_paths[idx].name.replace('.tif', '')
                 dst.set_band_description(idx + 1, band_name)
 
@@ -65,79 +98,152 @@ def dms_to_dd(dms_str):
 
 def generate_kmz_from_excel(excel_file, kmz_file):
     try:
-        df = pd.read_excel(excel_file)
-
-        # Check required columns
-        required_columns = ["sr.no", "Test_location_2", "Northing", "Easting"]
-        if not all(col in df.columns for col in required_columns):
-            st.error(f"Input file must contain columns: {required_columns}")
+        # Only the required columns, from every sheet that has them
+        try:
+            df = read_workbooks([excel_file], BOREHOLE_LOCATION_COLUMNS)
+        except MissingColumnsError:
+            st.error(f"Input file must contain columns: {list(BOREHOLE_LOCATION_COLUMNS)}")
             return
+        count("rows processed", len(df))
 
         # Create KMZ file
         kml = Kml()
-        for _, row in df.iterrows():
-            kml.newpoint(
-                name=str(row['Test_location_2']),
-                coords=[(row['Northing'], row['Easting'])],  # Assuming Easting and Northing are in the correct order
-                description=f"Sr.No: {row['sr.no']}"
-            )
-        kml.savekmz(kmz_file)
+        with stage("KML build"):
+            for _, row in df.iterrows():
+                kml.newpoint(
+                    name=str(row['Test_location_2']),
+                    coords=[(row['Northing'], row['Easting'])],  # Assuming Easting and Northing are in the correct order
+                    description=f"Sr.No: {row['sr.no']}"
+                )
+        with stage("KMZ write"):
+            kml.savekmz(kmz_file)
 
         st.success("KMZ file has been successfully created!")
     except Exception as e:
         st.error(f"An error occurred: {e}")
 
+def interpolation_job(job, boreholes, columns, reference_name, reference_bytes, method, k, power, max_distance):
+    """Background job: interpolate borehole properties onto the reference raster's grid; returns the GeoTIFF bytes."""
+    with tempfile.TemporaryDirectory() as work_dir:
+        reference_path = os.path.join(work_dir, "reference" + os.path.splitext(reference_name)[1])
+        with open(reference_path, "wb") as f:
+            f.write(reference_bytes)
+        output_path = os.path.join(work_dir, "interpolated.tif")
+        interpolate_to_raster(boreholes, columns, reference_path, output_path, method, k, power,
+                              max_distance, progress=job.report)
+        with open(output_path, "rb") as f:
+            return f.read()
+
+
+def read_boreholes(uploaded_file):
+    """Processed borehole table from the soil processor, in any of its download formats."""
+    if uploaded_file.name.endswith(".parquet"):
+        return pd.read_parquet(uploaded_file)
+    if uploaded_file.name.endswith((".csv", ".csv.gz")):
+        return pd.read_csv(uploaded_file, compression="infer")
+    return pd.read_excel(uploaded_file)
+
+
 # Streamlit application
 st.title("TIFF File CRS Checker and Multi-band Raster Creator")
 
 # Navigation
-page = st.sidebar.selectbox("Select Page", ["Home", "Calculate Design Properties"])
+page = st.sidebar.selectbox("Select Page", ["Home", "Calculate Design Properties", "Interpolate Site Maps"])
+show_diagnostics, profile_run = diagnostics_options()
 
 if page == "Home":
     # File uploader for TIFF files
     uploaded_files = st.file_uploader("Select TIFF Files", type=["tif"], accept_multiple_files=True)
 
     if uploaded_files:
-        # Check the TIFF files and get results
-        df, crs_set = check_tiff_files(uploaded_files)
+        with track_run("tiff_processor", profile=profile_run) as run_stats:
+            # Check the TIFF files and get results
+            df, crs_set = check_tiff_files(uploaded_files)
 
-        if df is not None and not df.empty:
-            st.subheader("TIFF File Metadata")
-            st.dataframe(df)
+            if df is not None and not df.empty:
+                st.subheader("TIFF File Metadata")
+                st.dataframe(df)
 
-            if len(crs_set) == 1:
-                st.success("<<ALL THE FILES CARRY THE SAME CRS VALUES>>")
-            else:
-                differing_files = [r["File Name"] for r in df.to_dict(orient='records') if r["CRS"] != list(crs_set)[0]]
-                st.warning(f"Files with differing CRS values: {', '.join(differing_files)}")
-
-            # Option to create multi-band raster
-            output_file = st.text_input("Enter output file name (with .tif extension):", "merged_output.tif")
-            if st.button("Create Multi-band Raster"):
-                if output_file:
-                    # Create a temporary file to save the raster
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.tif') as temp_file:
-                        temp_output_path = temp_file.name
-                    success, error_message = create_multiband_raster(uploaded_files, temp_output_path)
-                    if success:
-                        # Provide a download link for the user
-                        with open(temp_output_path, "rb") as f:
-                            st.download_button("Download Multi-band Raster", f, file_name=output_file)
-                    else:
-                        st.error(f"Error creating multi-band raster: {error_message}")
+                if len(crs_set) == 1:
+                    st.success("<<ALL THE FILES CARRY THE SAME CRS VALUES>>")
                 else:
-                    st.error("Please provide a valid output file name.")
+                    differing_files = [r["File Name"] for r in df.to_dict(orient='records') if r["CRS"] != list(crs_set)[0]]
+                    st.warning(f"Files with differing CRS values: {', '.join(differing_files)}")
+
+                if st.checkbox("Show quick-look previews", value=True):
+                    quicklook_panel(uploaded_files)
+
+                # Option to create multi-band raster
+                output_file = st.text_input("Enter output file name (with .tif extension):", "merged_output.tif")
+                if st.button("Create Multi-band Raster"):
+                    if output_file:
+                        # Create a temporary file to save the raster
+                        with tempfile.NamedTemporaryFile(delete=False, suffix='.tif') as temp_file:
+                            temp_output_path = temp_file.name
+                        success, error_message = create_multiband_raster(uploaded_files, temp_output_path)
+                        if success:
+                            # Provide a download link for the user
+                            with open(temp_output_path, "rb") as f:
+                                st.download_button("Download Multi-band Raster", f, file_name=output_file)
+                        else:
+                            st.error(f"Error creating multi-band raster: {error_message}")
+                    else:
+                        st.error("Please provide a valid output file name.")
+        if show_diagnostics:
+            render_diagnostics(run_stats)
 
 elif page == "Calculate Design Properties":
     st.subheader("Generate KMZ from Excel File")
-    excel_file = st.file_uploader("Upload Excel File", type=["xlsx"])
+    excel_file = st.file_uploader("Upload Excel File", type=["xlsx", "xls"])
     
     if excel_file:
         kmz_file = st.text_input("Enter output KMZ file name (with .kmz extension):", "output.kmz")
         if st.button("Generate KMZ"):
             if kmz_file:
-                generate_kmz_from_excel(excel_file, kmz_file)
+                with track_run("tiff_processor", profile=profile_run) as run_stats:
+                    generate_kmz_from_excel(excel_file, kmz_file)
+                if show_diagnostics:
+                    render_diagnostics(run_stats)
             else:
                 st.error("Please provide a valid KMZ file name.")
 
+elif page == "Interpolate Site Maps":
+    st.subheader("Interpolate Design Properties Between Boreholes")
+    borehole_file = st.file_uploader("Upload processed soil data (with Longitude/Latitude)",
+                                     type=["xlsx", "csv", "gz", "parquet"])
+    reference_file = st.file_uploader("Upload reference raster (output grid)", type=["tif", "tiff"])
+    recent_jobs_sidebar("tiff_interpolation")
+
+    if borehole_file and reference_file:
+        boreholes = read_boreholes(borehole_file)
+        if not {"Longitude", "Latitude"}.issubset(boreholes.columns):
+            st.error("The borehole table needs Longitude and Latitude columns.")
+            st.stop()
+        numeric = [c for c in boreholes.columns if c not in ("Longitude", "Latitude")
+                   and pd.to_numeric(boreholes[c], errors="coerce").notna().any()]
+        columns = st.multiselect("Properties", numeric, default=[c for c in DESIGN_PROPERTIES if c in numeric])
+        method = st.selectbox("Method", INTERPOLATION_METHODS)
+        k = st.number_input("Neighbours (k)", min_value=1, max_value=64, value=8)
+        power = st.number_input("IDW power", min_value=0.5, max_value=6.0, value=2.0, step=0.5)
+        max_distance = st.number_input("Search radius in raster CRS units (0 = unlimited)", min_value=0.0, value=0.0)
+
+        if st.button("Interpolate"):
+            if columns:
+                submit_job("tiff_interpolation", f"Interpolation of {len(columns)} properties", interpolation_job,
+                           boreholes[["Longitude", "Latitude"] + columns], columns, reference_file.name,
+                           reference_file.getvalue(), method, int(k), float(power), max_distance or None,
+                           profile=profile_run)
+            else:
+                st.error("Please select at least one property.")
+
+    def show_interpolated_raster(job):
+        st.success("Interpolated raster is ready.")
+        st.download_button("Download Interpolated Raster", job.result, file_name="interpolated_properties.tif")
+        if show_diagnostics:
+            render_diagnostics(job.stats)
+
+    job = current_job("tiff_interpolation")
+    if job is not None:
+        render_job(job, show_interpolated_raster)
+
 "python -m streamlit run 1.py"
\ No newline at end of file
@@ -3,6 +3,10 @@ import pandas as pd
 import math
 import io
 import simplekml
+from export import download_frame, export_format_option
+from ingest import NUMERIC, TEXT, MissingColumnsError, read_workbooks
+from instrumentation import count, diagnostics_options, render_diagnostics, stage, track_run
+from superoverlay import regionated_kmz
 
 # Constants
 C12 = 6378137  # Semi-major axis of the ellipsoid (meters)
@@ -10,6 +14,11 @@ C13 = 6356752.314  # Semi-minor axis of the ellipsoid (meters)
 C17 = 0.006739497  # Eccentricity squared of the ellipsoid
 C18 = (C12**2) / C13  # Derived constant for calculations
 
+KMZ_LAYOUTS = ["Single document", "Regionated (loads visible tiles only)"]
+REGIONATE_ABOVE = 10000  # points; larger sets default to the regionated layout
+COORDINATE_COLUMNS = {"Northing": NUMERIC, "Easting": NUMERIC}
+NAME_COLUMNS = {"Name": TEXT}  # typed where present, to name the placemarks
+
 # Function to convert UTM to Decimal Degrees
 def utm_to_decimal_degrees(easting, northing, zone, hemisphere="N"):
     # Calculate N5 (central meridian of the zone)
@@ -51,15 +60,22 @@ def utm_to_decimal_degrees(easting, northing, zone, hemisphere="N"):
 
 
 # Function to generate a KMZ file
-def generate_kmz(data, filename="output.kmz"):
+def generate_kmz(data, filename="output.kmz", regionated=False):
+    if regionated:
+        # Quadtree of tile KMLs behind Regions/NetworkLinks, for point sets Google Earth can't show at once
+        return regionated_kmz(data)
     kml = simplekml.Kml()
-    for _, row in data.iterrows():
-        latitude = row["Latitude"]
-        longitude = row["Longitude"]
-        name = row.get("Name", f"Point {_+1}")
-        kml.newpoint(name=name, coords=[(longitude, latitude)])
+    with stage("KML build"):
+        for _, row in data.iterrows():
+            latitude = row["Latitude"]
+            longitude = row["Longitude"]
+            name = row.get("Name")
+            name = name if pd.notna(name) else f"Point {_+1}"
+            kml.newpoint(name=name, coords=[(longitude, latitude)])
     kmz_data = io.BytesIO()
-    kml.savekmz(kmz_data)
+    with stage("KMZ write"):
+        kml.savekmz(kmz_data)
+    count("placemarks written", len(data))
     kmz_data.seek(0)
     return kmz_data
 
@@ -67,66 +83,69 @@ def generate_kmz(data, filename="output.kmz"):
 # Streamlit Application
 def main():
     st.title("UTM to Decimal Degrees Converter with KMZ Generation")
-    st.write("Upload an Excel file containing `Northing` and `Easting` columns, and the app will calculate Latitude and Longitude in Decimal Degrees. It will also generate a KMZ file for visualization in Google Earth.")
-
-    uploaded_file = st.file_uploader("Upload Excel File", type=["xlsx"])
-    if uploaded_file is not None:
-        try:
-            # Load Excel file
-            data = pd.read_excel(uploaded_file)
-
-            # Check for necessary columns
-            if "Northing" not in data.columns or "Easting" not in data.columns:
-                st.error("The uploaded file must contain 'Northing' and 'Easting' columns.")
-                return
-
-            # Add a sidebar for additional parameters
-            st.sidebar.title("Settings")
-            zone = st.sidebar.number_input("Enter UTM Zone", min_value=1, max_value=60, value=33)
-            hemisphere = st.sidebar.selectbox("Select Hemisphere", ["N", "S"])
-
-            # Process data
-            latitude_list = []
-            longitude_list = []
-            for _, row in data.iterrows():
-                northing = row["Northing"]
-                easting = row["Easting"]
-                latitude, longitude = utm_to_decimal_degrees(easting, northing, zone, hemisphere)
-                latitude_list.append(latitude)
-                longitude_list.append(longitude)
-
-            # Add results to the DataFrame
-            data["Latitude"] = latitude_list
-            data["Longitude"] = longitude_list
-
-            # Display the processed data
-            st.write("Processed Data:")
-            st.dataframe(data)
-
-            # Provide download link for the results as Excel
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-                data.to_excel(writer, index=False)
-            processed_file = output.getvalue()
-
-            st.download_button(
-                label="Download Results as Excel",
-                data=processed_file,
-                file_name="converted_coordinates.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            )
-
-            # Generate and download KMZ file
-            kmz_file = generate_kmz(data)
-            st.download_button(
-                label="Download KMZ File",
-                data=kmz_file,
-                file_name="converted_coordinates.kmz",
-                mime="application/vnd.google-earth.kmz",
-            )
-
-        except Exception as e:
-            st.error(f"An error occurred: {e}")
+    st.write("Upload Excel files containing `Northing` and `Easting` columns, and the app will calculate Latitude and Longitude in Decimal Degrees. It will also generate a KMZ file for visualization in Google Earth. Every sheet with those columns is read.")
+
+    uploaded_files = st.file_uploader("Upload Excel Files", type=["xlsx"], accept_multiple_files=True)
+    export_format = export_format_option()
+    show_diagnostics, profile_run = diagnostics_options()
+    if uploaded_files:
+        with track_run("kmz_generator", profile=profile_run) as run_stats:
+            try:
+                # Load every sheet with coordinates, only the columns used here
+                count("bytes read", sum(f.size for f in uploaded_files))
+                try:
+                    data = read_workbooks(uploaded_files, COORDINATE_COLUMNS, NAME_COLUMNS, keep_other=True)
+                except MissingColumnsError:
+                    st.error("The uploaded files must contain 'Northing' and 'Easting' columns.")
+                    return
+                count("rows processed", len(data))
+                invalid = data.attrs["invalid_values"]
+                if invalid:
+                    st.warning("Non-numeric values were left empty: "
+                               + ", ".join(f"{column} ({n})" for column, n in invalid.items()))
+
+                # Add a sidebar for additional parameters
+                st.sidebar.title("Settings")
+                zone = st.sidebar.number_input("Enter UTM Zone", min_value=1, max_value=60, value=33)
+                hemisphere = st.sidebar.selectbox("Select Hemisphere", ["N", "S"])
+                kmz_layout = st.sidebar.selectbox("KMZ layout", KMZ_LAYOUTS,
+                                                  index=1 if len(data) > REGIONATE_ABOVE else 0)
+
+                # Process data
+                latitude_list = []
+                longitude_list = []
+                with stage("CRS transform"):
+                    for _, row in data.iterrows():
+                        northing = row["Northing"]
+                        easting = row["Easting"]
+                        latitude, longitude = utm_to_decimal_degrees(easting, northing, zone, hemisphere)
+                        latitude_list.append(latitude)
+                        longitude_list.append(longitude)
+
+                # Add results to the DataFrame
+                data["Latitude"] = latitude_list
+                data["Longitude"] = longitude_list
+
+                # Display the processed data
+                st.write("Processed Data:")
+                st.dataframe(data)
+
+                # Provide download link for the results
+                download_frame(data, export_format, "converted_coordinates", "Download Results")
+
+                # Generate and download KMZ file
+                kmz_file = generate_kmz(data, regionated=kmz_layout == KMZ_LAYOUTS[1])
+                st.download_button(
+                    label="Download KMZ File",
+                    data=kmz_file,
+                    file_name="converted_coordinates.kmz",
+                    mime="application/vnd.google-earth.kmz",
+                )
+
+            except Exception as e:
+                st.error(f"An error occurred: {e}")
+        if show_diagnostics:
+            render_diagnostics(run_stats)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,6 @@
 import io
+import os
+import tempfile
 import zipfile
 import pandas as pd
 import rasterio
@@ -6,10 +8,20 @@ from rasterio.crs import CRS
 from rasterio.warp import transform
 import streamlit as st
 from xml.etree import ElementTree as ET
+from batch_extract import extract_sites, site_outputs_zip
+from export import cached_export, download_frame, export_format_option
+from raster_catalog import RasterCatalog
+from results_store import store_option
+from sampling import SAMPLING_MODES, sample_points
+from instrumentation import count, diagnostics_options, render_diagnostics, stage
+from jobs import current_job, recent_jobs_sidebar, render_job, submit_job
 
 
-def extract_kml_from_kmz(kmz_buffer):
-    """Extract KML file from KMZ or parse it directly if it's raw KML."""
+def extract_kml_from_kmz(kmz_buffer, raise_errors=False):
+    """Extract KML file from KMZ or parse it directly if it's raw KML.
+
+    Errors are shown with st.error, or raised when ``raise_errors`` is set (background jobs).
+    """
     try:
         # Try to open the file as a ZIP (KMZ)
         with zipfile.ZipFile(io.BytesIO(kmz_buffer), 'r') as kmz:
@@ -22,17 +34,20 @@ def extract_kml_from_kmz(kmz_buffer):
         if kmz_buffer.startswith(b"<?xml") or b"<kml" in kmz_buffer[:100].lower():
             return io.BytesIO(kmz_buffer)  # Treat buffer as raw KML
     except Exception as e:
+        if raise_errors:
+            raise ValueError(f"Unexpected error while extracting KML: {e}") from e
         st.error(f"Unexpected error while extracting KML: {e}")
     
     return None
 
 
-def parse_kml(kml_file):
-    """Parse KML file to extract coordinates."""
+def parse_kml(kml_file, raise_errors=False):
+    """Parse KML file to extract coordinates; errors are raised instead of shown when ``raise_errors`` is set."""
     try:
         namespace = {'kml': 'http://www.opengis.net/kml/2.2'}
-        tree = ET.parse(kml_file)
-        root = tree.getroot()
+        with stage("KML parse"):
+            tree = ET.parse(kml_file)
+            root = tree.getroot()
 
         coordinates = []
         for placemark in root.findall(".//kml:Placemark", namespace):
@@ -46,104 +61,214 @@ def parse_kml(kml_file):
                     "Latitude": float(lat)
                 })
 
+        count("placemarks parsed", len(coordinates))
         return pd.DataFrame(coordinates)
     except Exception as e:
+        if raise_errors:
+            raise ValueError(f"Error parsing KML: {e}") from e
         st.error(f"Error parsing KML: {e}")
         return pd.DataFrame()
 
 
-def extract_tiff_data(tiff_buffer, coordinates_df):
-    """Extract data from TIFF file based on coordinates."""
+def extract_tiff_data(tiff_buffer, coordinates_df, mode="nearest", window_size=3, progress=None, raise_errors=False):
+    """Extract data from TIFF file based on coordinates.
+
+    ``progress`` receives the fraction of points done; without it a progress bar is shown.
+    Errors are raised instead of shown when ``raise_errors`` is set.
+    """
     try:
-        with rasterio.open(io.BytesIO(tiff_buffer)) as src:
-            band_names = src.descriptions  # Dynamically fetch band descriptions
-            if not band_names:
-                band_names = [f"Band_{i+1}" for i in range(src.count)]
-
-            extracted_data = []
-            progress = st.progress(0)  # Initialize progress bar
-            for i, row in coordinates_df.iterrows():
-                try:
-                    lon, lat = row["Longitude"], row["Latitude"]
-
-                    # Transform coordinates to TIFF CRS
-                    lon_transformed, lat_transformed = transform(
-                        CRS.from_epsg(4326), src.crs, [lon], [lat]
-                    )
-
-                    # Ensure the transformed arrays have values
-                    if len(lon_transformed) > 0 and len(lat_transformed) > 0:
-                        row_idx, col_idx = src.index(lon_transformed[0], lat_transformed[0])
-
-                        # Read all band values at the location
-                        values = src.read()[:, row_idx, col_idx]
-                        extracted_data.append(values.tolist())  # Convert array to list for easier handling
-                    else:
-                        extracted_data.append([None] * src.count)  # Append None if transformation fails
-                except Exception as e:
-                    extracted_data.append([None] * src.count)  # Append None for failed lookups
-
-                progress.progress((i + 1) / len(coordinates_df))  # Update progress bar
-
-            progress.empty()  # Clear progress bar
+        count("bytes read", len(tiff_buffer))
+        with stage("raster open"):
+            src = rasterio.open(io.BytesIO(tiff_buffer))
+        with src:
+            # Dynamically fetch band descriptions, numbering the unnamed ones
+            band_names = [name or f"Band_{i+1}" for i, name in enumerate(src.descriptions)]
+
+            # Transform all coordinates to the TIFF CRS at once
+            with stage("CRS transform"):
+                xs, ys = transform(
+                    CRS.from_epsg(4326), src.crs,
+                    coordinates_df["Longitude"].tolist(), coordinates_df["Latitude"].tolist()
+                )
+
+            if progress is None:
+                progress_bar = st.progress(0)  # Initialize progress bar
+                values = sample_points(src, xs, ys, mode, window_size, progress=progress_bar.progress)
+                progress_bar.empty()  # Clear progress bar
+            else:
+                values = sample_points(src, xs, ys, mode, window_size, progress=progress)
+            count("rows processed", len(coordinates_df))
 
         # Add extracted data to DataFrame
         for i, band_name in enumerate(band_names):
-            coordinates_df[band_name] = [data[i] if data else None for data in extracted_data]
+            coordinates_df[band_name] = values[i]
 
         return coordinates_df
     except Exception as e:
+        if raise_errors:
+            raise ValueError(f"Error extracting TIFF data: {e}") from e
         st.error(f"Error extracting TIFF data: {e}")
         return pd.DataFrame()
 
 
+def load_sites(site_files):
+    """Parse each uploaded KMZ/KML into a coordinates frame keyed by a unique site name."""
+    sites = {}
+    for site_file in site_files:
+        kml_buffer = extract_kml_from_kmz(site_file.getvalue())
+        coordinates_df = parse_kml(kml_buffer) if kml_buffer else pd.DataFrame()
+        if coordinates_df.empty:
+            st.warning(f"Skipping {site_file.name}: no valid coordinates found.")
+            continue
+
+        site = base = os.path.splitext(site_file.name)[0]
+        suffix = 2
+        while site in sites:
+            site = f"{base}_{suffix}"
+            suffix += 1
+        sites[site] = coordinates_df
+    return sites
+
+
+def extraction_job(job, kmz_buffer, tiff_buffer, mode="nearest", window_size=3, site=None, store=None):
+    """Background job: extract one site's boreholes from one TIFF; appended to ``store`` as ``site`` when given."""
+    with stage("KMZ unpack"):
+        kml_buffer = extract_kml_from_kmz(kmz_buffer, raise_errors=True)
+    if not kml_buffer:
+        raise ValueError("No KML file found in the KMZ.")
+
+    coordinates_df = parse_kml(kml_buffer, raise_errors=True)
+    if coordinates_df.empty:
+        raise ValueError("No valid coordinates found in the KML.")
+
+    extracted_data_df = extract_tiff_data(tiff_buffer, coordinates_df, mode, window_size, progress=job.report,
+                                          raise_errors=True)
+    if extracted_data_df.empty:
+        raise ValueError("No data extracted from TIFF.")
+    if store is not None:
+        store.append(extracted_data_df, site, job.id, job.tool)
+    return extracted_data_df
+
+
+def batch_job(job, sites, raster_uploads, raster_folder, mode, window_size, max_workers, store=None):
+    """Background job: extract many sites against the uploaded rasters and/or a raster folder."""
+    with tempfile.TemporaryDirectory() as upload_dir:
+        # Worker processes read rasters by path, so uploads go to disk first
+        raster_paths = []
+        for name, data in raster_uploads:
+            path = os.path.join(upload_dir, name)
+            with open(path, "wb") as f:
+                f.write(data)
+            raster_paths.append(path)
+
+        # A folder keeps its catalog on disk, so only new or changed rasters are re-read
+        catalog = RasterCatalog.for_folder(raster_folder) if raster_folder else RasterCatalog([])
+        catalog = RasterCatalog(RasterCatalog.build(raster_paths).entries + catalog.entries)
+        job.report(0, "Reading tiles")
+        results = extract_sites(sites, catalog, mode, window_size, max_workers=max_workers, progress=job.report)
+    if store is not None:
+        for site, df in results.items():
+            store.append(df, site, job.id, job.tool)
+    return catalog.to_frame(), results
+
+
+def batch_extraction_page(sampling_mode, window_size, export_format, show_diagnostics, profile_run, store):
+    """Extract many sites' boreholes against a catalog of rasters in one run."""
+    st.subheader("Batch Extraction")
+    site_files = st.file_uploader("Upload site KMZ/KML files", type=["kmz", "kml"], accept_multiple_files=True)
+    raster_files = st.file_uploader("Upload raster catalog TIFF files", type=["tif", "tiff"], accept_multiple_files=True)
+    raster_folder = st.text_input("...or a folder of TIFF files on this machine", "")
+    max_workers = st.number_input("Worker processes", min_value=1, max_value=os.cpu_count() or 1,
+                                  value=min(4, os.cpu_count() or 1))
+
+    if st.button("Run Batch Extraction"):
+        if not site_files or not (raster_files or raster_folder):
+            st.error("Please upload site files and a raster catalog.")
+            return
+
+        sites = load_sites(site_files)
+        if not sites:
+            st.error("No valid coordinates found in the site files.")
+            return
+
+        raster_uploads = [(raster_file.name, raster_file.getvalue()) for raster_file in raster_files or []]
+        submit_job("kmz_extractor_batch", f"Batch extraction of {len(sites)} sites", batch_job,
+                   sites, raster_uploads, raster_folder, sampling_mode, window_size, int(max_workers), store,
+                   profile=profile_run)
+
+    def show_results(job):
+        catalog_frame, results = job.result
+        with st.expander(f"Raster catalog ({len(catalog_frame)} rasters)"):
+            st.dataframe(catalog_frame)
+
+        summary = pd.DataFrame([
+            {"Site": site, "Points": len(df), "Points with data": int(df.iloc[:, 3:].notna().any(axis=1).sum())}
+            for site, df in results.items()
+        ])
+        st.dataframe(summary)
+
+        fmt, _ = export_format
+        st.download_button(
+            label="Download per-site results (ZIP)",
+            data=cached_export((job.id, "batch_extracted_data", fmt), lambda: site_outputs_zip(results, fmt)),
+            file_name="batch_extracted_data.zip",
+            mime="application/zip"
+        )
+        if show_diagnostics:
+            render_diagnostics(job.stats)
+
+    recent_jobs_sidebar("kmz_extractor_batch")
+    job = current_job("kmz_extractor_batch")
+    if job is not None:
+        render_job(job, show_results)
+
+
 # Streamlit UI
 st.title("KMZ to TIFF Data Extractor")
 
+mode = st.sidebar.radio("Mode", ["Single site", "Batch (many sites)"])
+sampling_mode = st.sidebar.selectbox("Sampling", SAMPLING_MODES)
+window_size = 3
+if sampling_mode.startswith("window"):
+    window_size = st.sidebar.number_input("Window size (k x k pixels)", min_value=3, max_value=15, value=3, step=2)
+export_format = export_format_option()
+show_diagnostics, profile_run = diagnostics_options()
+store = store_option()
+
+if mode == "Batch (many sites)":
+    batch_extraction_page(sampling_mode, int(window_size), export_format, show_diagnostics, profile_run, store)
+    st.stop()
+
 # File upload for KMZ and TIFF files
 kmz_file = st.file_uploader("Upload KMZ File", type=["kmz"])
 tiff_file = st.file_uploader("Upload TIFF File", type=["tif"])
 
 if st.button("Extract Data"):
     if kmz_file and tiff_file:
-        try:
-            # Extract KML from KMZ in memory
-            kml_buffer = extract_kml_from_kmz(kmz_file.getvalue())
-            if not kml_buffer:
-                st.error("No KML file found in the KMZ.")
-                st.stop()
-
-            # Parse coordinates from KML
-            coordinates_df = parse_kml(kml_buffer)
-            if coordinates_df.empty:
-                st.error("No valid coordinates found in the KML.")
-                st.stop()
-
-            # Extract data from TIFF
-            extracted_data_df = extract_tiff_data(tiff_file.getvalue(), coordinates_df)
-            if not extracted_data_df.empty:
-                # Display the extracted data
-                st.subheader("Extracted Data")
-                st.dataframe(extracted_data_df)
-
-                # Generate an Excel file in memory
-                excel_buffer = io.BytesIO()
-                with pd.ExcelWriter(excel_buffer, engine='xlsxwriter') as writer:
-                    extracted_data_df.to_excel(writer, index=False, sheet_name='Extracted Data')
-
-                # Allow users to download the Excel file
-                st.download_button(
-                    label="Download Extracted Data as XLSX",
-                    data=excel_buffer.getvalue(),
-                    file_name="extracted_data.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-            else:
-                st.error("No data extracted from TIFF.")
-        except Exception as e:
-            st.error(f"An unexpected error occurred: {e}")
+        # Runs in the background; the job ID in the URL brings the result back after a reload
+        submit_job("kmz_extractor", f"Extraction of {kmz_file.name}", extraction_job,
+                   kmz_file.getvalue(), tiff_file.getvalue(), sampling_mode, int(window_size),
+                   os.path.splitext(kmz_file.name)[0], store, profile=profile_run)
     else:
         st.error("Please upload both KMZ and TIFF files.")
 
+
+def show_extracted_data(job):
+    # Display the extracted data
+    st.subheader("Extracted Data")
+    st.dataframe(job.result)
+
+    # Allow users to download the extracted data
+    download_frame(job.result, export_format, "extracted_data", "Download Extracted Data",
+                   sheet_name="Extracted Data", key=job.id)
+    if show_diagnostics:
+        render_diagnostics(job.stats)
+
+
+recent_jobs_sidebar("kmz_extractor")
+job = current_job("kmz_extractor")
+if job is not None:
+    render_job(job, show_extracted_data)
+
 # To run the Streamlit app, use the command:
 # python -m streamlit run 3.py
\ No newline at end of file
@@ -0,0 +1,87 @@
+import pandas as pd
+import streamlit as st
+from export import download_frame, export_format_option
+from instrumentation import diagnostics_options, render_diagnostics, track_run
+from results_store import AGGREGATIONS, STORE_DIR, shared_store
+
+OPERATORS = ["<", "<=", ">", ">=", "==", "!="]
+PREVIEW_ROWS = 1000  # rows shown on the page; downloads hold every match
+
+
+def filter_options(store):
+    """Sidebar filters; returns the keyword arguments of ResultsStore.scan."""
+    filters = {}
+    runs = store.runs()
+    with st.sidebar.expander("Filters", expanded=True):
+        filters["sites"] = st.multiselect("Sites", store.values("site"))
+        tool = st.selectbox("Tool", ["Any"] + sorted(runs["tool"].unique().tolist()))
+        filters["tool"] = None if tool == "Any" else tool
+        filters["textures"] = st.multiselect("Soil texture", store.values("textures"))
+        filters["cohesiveness"] = st.multiselect("Cohesiveness", store.values("cohesiveness"))
+
+        if st.checkbox("Bounding box", value=False):
+            west, east = st.columns(2)
+            south, north = st.columns(2)
+            filters["bbox"] = (
+                west.number_input("West", value=-180.0, format="%.6f"),
+                south.number_input("South", value=-90.0, format="%.6f"),
+                east.number_input("East", value=180.0, format="%.6f"),
+                north.number_input("North", value=90.0, format="%.6f"),
+            )
+
+        numeric = sorted({column for entry in store.entries for column in entry["ranges"]})
+        column = st.selectbox("Condition on", ["None"] + numeric)
+        if column != "None":
+            op, value = st.columns(2)
+            filters["where"] = [(column, op.selectbox("Operator", OPERATORS), value.number_input("Value", value=0.0))]
+    return filters
+
+
+# Streamlit UI
+st.title("Results Explorer")
+
+store = shared_store(STORE_DIR)
+store.refresh()
+if not store.entries:
+    st.info("The results store is empty. Enable 'Save results to the local results store' in a tool to fill it.")
+    st.stop()
+
+export_format = export_format_option()
+show_diagnostics, profile_run = diagnostics_options()
+filters = filter_options(store)
+
+with st.expander(f"Stored runs ({len(store.entries)} files, {sum(e['rows'] for e in store.entries):,} rows)"):
+    st.dataframe(store.runs(), hide_index=True)
+
+rows_tab, aggregate_tab = st.tabs(["Rows", "Aggregate"])
+
+with rows_tab:
+    with track_run("results_explorer", profile=profile_run) as run_stats:
+        n_matches = store.count_rows(**filters)
+        preview = store.query(limit=PREVIEW_ROWS, **filters)
+    st.write(f"{n_matches:,} matching rows in {run_stats.wall_seconds * 1000:.1f} ms")
+    st.dataframe(preview)
+    # Gathering every match can be large, so the export is built only on request
+    if n_matches and st.checkbox(f"Prepare a download of all {n_matches:,} rows", value=False):
+        download_frame(store.query(**filters), export_format, "stored_results", "Download Matching Rows",
+                       sheet_name="Results")
+    if show_diagnostics:
+        render_diagnostics(run_stats)
+
+with aggregate_tab:
+    columns = sorted({column for entry in store.entries for column in entry["columns"]})
+    numeric = sorted({column for entry in store.entries for column in entry["ranges"]})
+    by = st.multiselect("Group by", columns, default=[c for c in ["Soil_Texture"] if c in columns])
+    values = st.multiselect("Values", numeric, default=[c for c in ["Adjusted_Cohesion"] if c in numeric])
+    aggregations = st.multiselect("Aggregations", AGGREGATIONS, default=["mean", "min", "max", "count"])
+
+    if by and values and aggregations:
+        with track_run("results_explorer", profile=profile_run) as run_stats:
+            summary = store.aggregate(by, values, aggregations, **filters)
+        st.write(f"{len(summary):,} groups in {run_stats.wall_seconds * 1000:.1f} ms")
+        st.dataframe(summary, hide_index=True)
+        download_frame(summary, export_format, "stored_results_summary", "Download Summary", sheet_name="Summary")
+        if show_diagnostics:
+            render_diagnostics(run_stats)
+    else:
+        st.info("Pick at least one group-by column, value column and aggregation.")
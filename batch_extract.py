@@ -0,0 +1,148 @@
+"""Multi-site point extraction against a set of rasters.
+
+Points from every site are deduplicated first, routed to the covering rasters
+through the raster catalog, then grouped by the raster block (tile) they fall
+in. Each block is read once, in a worker process, and
+its values are scattered back to every site that has a point in it.
+"""
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.crs import CRS
+from rasterio.warp import transform
+
+from export import export_frame
+from instrumentation import count, stage
+from parallel import chunk_size, process_pool
+from raster_catalog import RasterCatalog
+from sampling import block_groups, pixel_coords, sample_window
+
+# Raster handles kept open per worker process, keyed by path
+_open_rasters = {}
+
+
+def _open_raster(path):
+    if path not in _open_rasters:
+        _open_rasters[path] = rasterio.open(path)
+    return _open_rasters[path]
+
+
+def _close_rasters():
+    """Close the cached handles; the in-process path must not keep rasters (e.g. in a temporary folder) open."""
+    while _open_rasters:
+        _open_rasters.popitem()[1].close()
+
+
+def dedupe_points(sites, decimals=7):
+    """Stack all sites' points and collapse identical coordinates.
+
+    Returns the unique (Longitude, Latitude) frame, the stacked site frame and,
+    for each stacked row, the index of its unique point.
+    """
+    stacked = pd.concat(
+        [df.assign(Site=site) for site, df in sites.items()], ignore_index=True
+    )
+    coords = stacked[["Longitude", "Latitude"]].to_numpy(dtype=float)
+    # Rounded coordinates only decide what counts as a duplicate; sampling uses the originals
+    _, first, inverse = np.unique(np.round(coords, decimals), axis=0, return_index=True, return_inverse=True)
+    unique = pd.DataFrame(coords[first], columns=["Longitude", "Latitude"])
+    count("points submitted", len(stacked))
+    count("unique points", len(unique))
+    return unique, stacked, inverse.ravel()
+
+
+def plan_tiles(catalog, lon, lat, mode="nearest", window_size=3):
+    """Group point indices by (raster, block) for every raster whose footprint covers them."""
+    tasks = []
+    for path, candidates in catalog.route(lon, lat).items():
+        with rasterio.open(path) as src:
+            if src.crs is None or src.crs == CRS.from_epsg(4326):
+                xs, ys = lon[candidates], lat[candidates]
+            else:
+                xs, ys = transform(CRS.from_epsg(4326), src.crs, lon[candidates].tolist(), lat[candidates].tolist())
+            row_f, col_f = pixel_coords(src, xs, ys)
+            for group in block_groups(src, row_f, col_f):
+                tasks.append((path, candidates[group], row_f[group], col_f[group], mode, window_size))
+    count("tiles planned", len(tasks))
+    return tasks
+
+
+def _sample_tile(task):
+    """Sample one raster block (all bands) at the points that fall in it."""
+    path, point_idx, row_f, col_f, mode, window_size = task
+    return path, point_idx, sample_window(_open_raster(path), row_f, col_f, mode, window_size)
+
+
+def extract_sites(sites, catalog, mode="nearest", window_size=3, max_workers=None, progress=None):
+    """Extract band values for every site's points from the rasters covering them.
+
+    ``sites`` maps a site name to a frame with Name/Longitude/Latitude columns,
+    as returned by parse_kml in 3.py. ``catalog`` is a RasterCatalog or a list
+    of raster paths. Returns a dict of site name to that frame with one column
+    per band, sampled with one of sampling.SAMPLING_MODES; where several
+    rasters cover a point the first in the catalog with data wins. ``progress``
+    is called with the fraction of tiles read as results come in.
+    """
+    if not isinstance(catalog, RasterCatalog):
+        catalog = RasterCatalog.build(catalog)
+    raster_paths = catalog.paths
+
+    with stage("batch planning"):
+        unique, stacked, inverse = dedupe_points(sites)
+        tasks = plan_tiles(catalog, unique["Longitude"].to_numpy(), unique["Latitude"].to_numpy(), mode, window_size)
+
+    columns = {}
+    raster_bands = {entry["path"]: entry["bands"] for entry in catalog.entries}
+    for path in raster_paths:
+        for name in raster_bands[path]:
+            columns.setdefault(name, np.full(len(unique), np.nan))
+    filled = {name: np.zeros(len(unique), dtype=bool) for name in columns}
+
+    with stage("tile reads"):
+        if max_workers == 1 or len(tasks) < 2:
+            results = map(_sample_tile, tasks)
+            executor = None
+        else:
+            executor = process_pool(max_workers, preload=[__name__])
+            results = executor.map(_sample_tile, tasks, chunksize=chunk_size(len(tasks), max_workers))
+        try:
+            # Scatter in raster order so the first listed raster takes precedence
+            by_raster = {path: [] for path in raster_paths}
+            for done, (path, point_idx, values) in enumerate(results, start=1):
+                by_raster[path].append((point_idx, values))
+                if progress is not None:
+                    progress(done / len(tasks))
+        finally:
+            if executor is None:
+                _close_rasters()
+            else:
+                # Drops queued tiles if the loop stopped early, e.g. a cancelled job
+                executor.shutdown(cancel_futures=True)
+    if executor is not None:
+        # sample_window counts the tiles it decodes, but counters in worker processes are not collected
+        count("tiles decoded", sum(len(raster_bands[path]) for path, *_ in tasks))
+
+    for path in raster_paths:
+        for point_idx, values in by_raster[path]:
+            for band, name in enumerate(raster_bands[path]):
+                free = ~filled[name][point_idx] & ~np.isnan(values[band])
+                columns[name][point_idx[free]] = values[band][free]
+                filled[name][point_idx[free]] = True
+
+    values = pd.DataFrame(columns).iloc[inverse].reset_index(drop=True)
+    combined = pd.concat([stacked, values], axis=1)
+    count("rows processed", len(combined))
+    return {site: frame.drop(columns="Site").reset_index(drop=True)
+            for site, frame in combined.groupby("Site", sort=False)}
+
+
+def site_outputs_zip(results, fmt="xlsx"):
+    """One export file per site, bundled in a ZIP archive."""
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as archive:
+        for site, frame in results.items():
+            archive.writestr(f"{site}.{fmt}", export_frame(frame, fmt, sheet_name="Extracted Data"))
+    return output.getvalue()
@@ -0,0 +1,400 @@
+"""Benchmark harness for the hot paths of the soil feasibility tools.
+
+Examples:
+    python benchmark.py                                   # default sizes, all cases
+    python benchmark.py --cases parse_kml generate_kmz --sizes 100 10000
+    python benchmark.py --save-baseline                   # record benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --threshold 0.25
+
+Each case is warmed up, timed ``--repeat`` times per size and then run once
+more under tracemalloc to record peak Python-level memory. Results are written
+as JSON; when a baseline is given, any case/size whose median latency or peak memory
+grew by more than ``--threshold`` is reported and the exit code is 1.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from functools import partial
+
+import pandas as pd
+import rasterio
+
+import depth_layers
+import export
+import ingest
+import interpolation
+import partitioned
+import quicklook
+import results_store
+import soil_memo
+import synthetic_data
+import uncertainty
+from instrumentation import track_run
+from tools import load_tool
+
+DEFAULT_SIZES = [10**2, 10**3, 10**4]
+DEFAULT_RESULTS = "benchmark_results.json"
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+
+# Each case has a setup(size, workdir) that builds inputs outside the timed region
+# and a run(inputs) that exercises the hot path and returns the items processed.
+
+def setup_process_soil_data(size, workdir):
+    input_path = os.path.join(workdir, f"soil_{size}.xlsx")
+    if not os.path.exists(input_path):
+        synthetic_data.soil_table(size).to_excel(input_path, index=False)
+    return {"input_path": input_path, "output_path": os.path.join(workdir, "processed.xlsx"), "size": size}
+
+
+def run_process_soil_data(inputs):
+    load_tool("soil_processor").process_soil_data(inputs["input_path"], inputs["output_path"])
+    return inputs["size"]
+
+
+def setup_process_soil_data_memo(size, workdir):
+    inputs = setup_process_soil_data(size, workdir)
+    inputs["memo"] = soil_memo.SoilMemo(os.path.join(workdir, f"soil_memo_{size}"))
+    # Warm: every raw tuple is already in the memo, as on a rerun of the same extract
+    load_tool("soil_processor").process_soil_data(inputs["input_path"], memo=inputs["memo"])
+    return inputs
+
+
+def run_process_soil_data_memo(inputs):
+    load_tool("soil_processor").process_soil_data(inputs["input_path"], inputs["output_path"], memo=inputs["memo"])
+    return inputs["size"]
+
+
+def setup_read_workbooks(size, workdir):
+    # Two workbooks of two soil sheets each, with text columns the reader should skip
+    paths = []
+    for book in range(2):
+        path = os.path.join(workdir, f"soil_sheets_{size}_{book}.xlsx")
+        if not os.path.exists(path):
+            with pd.ExcelWriter(path) as writer:
+                for sheet in range(2):
+                    table = synthetic_data.soil_table(size, seed=book * 2 + sheet)
+                    table.assign(**{f"Notes_{i}": "field note" for i in range(6)}).to_excel(
+                        writer, sheet_name=f"Boreholes {sheet + 1}", index=False)
+        paths.append(path)
+    return {"paths": paths, "size": size * 4}
+
+
+def run_read_workbooks(inputs):
+    ingest.read_workbooks(inputs["paths"], {name: ingest.NUMERIC for name in synthetic_data.SOIL_COLUMNS})
+    return inputs["size"]
+
+
+def setup_extract_tiff_data(size, workdir):
+    tiff_path = os.path.join(workdir, "extract_stack.tif")
+    if not os.path.exists(tiff_path):
+        synthetic_data.geotiff(tiff_path, 512 * 512, bands=len(synthetic_data.SOIL_COLUMNS),
+                               descriptions=synthetic_data.SOIL_COLUMNS)
+    with open(tiff_path, "rb") as f:
+        tiff_buffer = f.read()
+    return {"tiff_buffer": tiff_buffer, "points": synthetic_data.lonlat_points(size), "size": size}
+
+
+def run_extract_tiff_data(inputs, mode="nearest"):
+    load_tool("kmz_extractor").extract_tiff_data(inputs["tiff_buffer"], inputs["points"].copy(), mode)
+    return inputs["size"]
+
+
+def setup_utm_to_decimal_degrees(size, workdir):
+    return {"boreholes": synthetic_data.borehole_coordinates(size), "size": size}
+
+
+def run_utm_to_decimal_degrees(inputs):
+    convert = load_tool("kmz_generator").utm_to_decimal_degrees
+    boreholes = inputs["boreholes"]
+    for easting, northing in zip(boreholes["Easting"], boreholes["Northing"]):
+        convert(easting, northing, synthetic_data.DEFAULT_UTM_ZONE)
+    return inputs["size"]
+
+
+def setup_create_multiband_raster(size, workdir):
+    stack_dir = os.path.join(workdir, f"stack_{size}")
+    if not os.path.isdir(stack_dir):
+        os.makedirs(stack_dir)
+        synthetic_data.geotiff_stack(stack_dir, size, count=4)
+    paths = sorted(os.path.join(stack_dir, f) for f in os.listdir(stack_dir))
+    return {"paths": paths, "output_path": os.path.join(workdir, "multiband.tif"), "size": size}
+
+
+def run_create_multiband_raster(inputs):
+    # The tool expects uploaded file objects, so hand it open files (they carry .name)
+    files = [open(p, "rb") for p in inputs["paths"]]
+    try:
+        success, error = load_tool("tiff_processor").create_multiband_raster(files, inputs["output_path"])
+    finally:
+        for f in files:
+            f.close()
+    if not success:
+        raise RuntimeError(error)
+    return inputs["size"] * len(inputs["paths"])
+
+
+def setup_generate_kmz(size, workdir):
+    return {"points": synthetic_data.lonlat_points(size), "size": size}
+
+
+def run_generate_kmz(inputs):
+    load_tool("kmz_generator").generate_kmz(inputs["points"])
+    return inputs["size"]
+
+
+def run_generate_kmz_regionated(inputs):
+    load_tool("kmz_generator").generate_kmz(inputs["points"], regionated=True)
+    return inputs["size"]
+
+
+def setup_parse_kml(size, workdir):
+    return {"kml": synthetic_data.kml_document(size), "size": size}
+
+
+def run_parse_kml(inputs):
+    load_tool("kmz_extractor").parse_kml(io.BytesIO(inputs["kml"]))
+    return inputs["size"]
+
+
+def setup_export_frame(size, workdir):
+    frame = load_tool("soil_processor").process_soil_data(setup_process_soil_data(size, workdir)["input_path"])
+    return {"frame": frame, "size": size}
+
+
+def run_export_frame(inputs):
+    export.export_frame(inputs["frame"], "xlsx")
+    return inputs["size"]
+
+
+def setup_monte_carlo(size, workdir):
+    return setup_export_frame(size, workdir)
+
+
+def run_monte_carlo(inputs):
+    uncertainty.monte_carlo(inputs["frame"], 1000, seed=0)
+    return inputs["size"]
+
+
+def setup_interpolate_to_raster(size, workdir):
+    reference_path = os.path.join(workdir, "interpolation_grid.tif")
+    if not os.path.exists(reference_path):
+        synthetic_data.geotiff(reference_path, 1024 * 1024, bands=1)
+    boreholes = synthetic_data.lonlat_points(size)
+    boreholes["Adjusted_Cohesion"] = synthetic_data.soil_table(size)["clay_content"].to_numpy(dtype=float)
+    return {"boreholes": boreholes, "reference_path": reference_path,
+            "output_path": os.path.join(workdir, "interpolated.tif"), "size": size}
+
+
+def run_interpolate_to_raster(inputs):
+    interpolation.interpolate_to_raster(inputs["boreholes"], ["Adjusted_Cohesion"], inputs["reference_path"],
+                                        inputs["output_path"])
+    return 1024 * 1024
+
+
+def setup_process_layered_soil_data(size, workdir):
+    return {"table": synthetic_data.layered_soil_table(size), "size": size}
+
+
+def run_process_layered_soil_data(inputs):
+    depth_layers.process_layered_soil_data(inputs["table"])
+    return inputs["size"] * len(depth_layers.SOILGRIDS_DEPTHS)
+
+
+def setup_quicklook(size, workdir):
+    # size * 1000 pixels, so the largest default size is a 10-megapixel raster
+    raster_path = os.path.join(workdir, f"quicklook_{size}.tif")
+    if not os.path.exists(raster_path):
+        synthetic_data.geotiff(raster_path, size * 1000, bands=3)
+    return {"raster_path": raster_path, "size": size}
+
+
+def run_quicklook(inputs):
+    with rasterio.open(inputs["raster_path"]) as src:
+        quicklook.quicklook(src)
+    return inputs["size"] * 1000
+
+
+def setup_results_store_query(size, workdir):
+    store = results_store.ResultsStore(os.path.join(workdir, f"results_store_{size}"))
+    if not store.entries:
+        frame = setup_export_frame(size, workdir)["frame"]
+        frame = synthetic_data.lonlat_points(size).join(frame.drop(columns=["Name"], errors="ignore"))
+        for site in range(10):
+            store.append(frame, f"Site {site}", "benchmark", "soil_processor")
+    store.count_rows()  # Queries run against a warm store, as in the explorer
+    return {"store": store, "size": size * 10}
+
+
+def run_results_store_query(inputs):
+    store = inputs["store"]
+    store.query(textures=["Clay", "Clay Loam"], where=[("Adjusted_Cohesion", "<", 10)],
+                columns=["Name", "Site", "Adjusted_Cohesion"])
+    store.aggregate(["Site", "Soil_Texture"], ["Adjusted_Cohesion"])
+    return inputs["size"]
+
+
+def setup_partitioned_derive(size, workdir):
+    # size * 100 pixels per raw soil raster, split into 256-pixel partitions
+    stack_dir = os.path.join(workdir, f"partitioned_{size}")
+    if not os.path.isdir(stack_dir):
+        os.makedirs(stack_dir)
+        synthetic_data.geotiff_stack(stack_dir, size * 100, len(synthetic_data.SOIL_COLUMNS))
+    return {"paths": partitioned.raster_paths([stack_dir]), "workdir": workdir, "size": size * 100}
+
+
+def run_partitioned_derive(inputs):
+    # Every run plans a fresh job, since a finished one would be skipped
+    job_dir = tempfile.mkdtemp(dir=inputs["workdir"])
+    partitioned.plan(job_dir, inputs["paths"], tile_size=256)
+    partitioned.work(job_dir)
+    partitioned.merge(job_dir)
+    return inputs["size"]
+
+
+CASES = {
+    "process_soil_data": (setup_process_soil_data, run_process_soil_data),
+    "process_soil_data_memo": (setup_process_soil_data_memo, run_process_soil_data_memo),
+    "read_workbooks": (setup_read_workbooks, run_read_workbooks),
+    "process_layered_soil_data": (setup_process_layered_soil_data, run_process_layered_soil_data),
+    "extract_tiff_data": (setup_extract_tiff_data, run_extract_tiff_data),
+    "extract_tiff_data_bilinear": (setup_extract_tiff_data, partial(run_extract_tiff_data, mode="bilinear")),
+    "extract_tiff_data_window_median": (setup_extract_tiff_data, partial(run_extract_tiff_data, mode="window median")),
+    "utm_to_decimal_degrees": (setup_utm_to_decimal_degrees, run_utm_to_decimal_degrees),
+    "create_multiband_raster": (setup_create_multiband_raster, run_create_multiband_raster),
+    "generate_kmz": (setup_generate_kmz, run_generate_kmz),
+    "generate_kmz_regionated": (setup_generate_kmz, run_generate_kmz_regionated),
+    "parse_kml": (setup_parse_kml, run_parse_kml),
+    "export_frame": (setup_export_frame, run_export_frame),
+    "monte_carlo": (setup_monte_carlo, run_monte_carlo),
+    "interpolate_to_raster": (setup_interpolate_to_raster, run_interpolate_to_raster),
+    "results_store_query": (setup_results_store_query, run_results_store_query),
+    "quicklook": (setup_quicklook, run_quicklook),
+    "partitioned_derive": (setup_partitioned_derive, run_partitioned_derive),
+}
+
+
+def measure(name, run, inputs, repeat):
+    """Time ``run`` ``repeat`` times after a warm-up, then once more under tracemalloc."""
+    # Warm-up keeps one-off costs (tool import, GDAL driver setup) out of the timings
+    run(inputs)
+
+    latencies = []
+    items = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = run(inputs)
+        latencies.append(time.perf_counter() - start)
+
+    # The memory pass also collects the per-stage breakdown from instrumentation
+    tracemalloc.start()
+    try:
+        with track_run(name) as stats:
+            run(inputs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(latencies)
+    return {
+        "items": items,
+        "latency_s": {"min": min(latencies), "median": median, "max": max(latencies)},
+        "throughput_per_s": items / median if median > 0 else None,
+        "peak_memory_bytes": peak,
+        "stages": stats.to_dict()["stages"],
+        "counters": stats.counters,
+    }
+
+
+def run_benchmarks(cases, sizes, repeat=3, max_seconds=60.0, workdir=None):
+    """Run every case at every size; larger sizes of a case are skipped once it gets too slow."""
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for name in cases:
+            setup, run = CASES[name]
+            for size in sorted(sizes):
+                inputs = setup(size, tmp)
+                record = {"case": name, "size": size, "repeat": repeat}
+                record.update(measure(name, run, inputs, repeat))
+                results.append(record)
+                print(f"{name:<32} {size:>10}  median {record['latency_s']['median']:.4f}s  "
+                      f"{record['throughput_per_s']:.1f}/s  peak {record['peak_memory_bytes'] / 2**20:.1f} MiB")
+                if record["latency_s"]["median"] > max_seconds:
+                    print(f"{name}: skipping sizes above {size} (over {max_seconds}s)")
+                    break
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare_to_baseline(report, baseline, threshold):
+    """List the results whose latency or peak memory regressed past ``threshold``."""
+    previous = {(r["case"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for record in report["results"]:
+        before = previous.get((record["case"], record["size"]))
+        if before is None:
+            continue
+        checks = [
+            ("median latency", before["latency_s"]["median"], record["latency_s"]["median"]),
+            ("peak memory", before["peak_memory_bytes"], record["peak_memory_bytes"]),
+        ]
+        for metric, old, new in checks:
+            if old and new > old * (1 + threshold):
+                regressions.append({
+                    "case": record["case"], "size": record["size"], "metric": metric,
+                    "baseline": old, "current": new, "ratio": new / old,
+                })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the soil feasibility hot paths.")
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES,
+                        help="rows/points per run, e.g. 100 1000 ... 10000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=60.0,
+                        help="stop growing a case once one run takes longer than this")
+    parser.add_argument("--output", default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"also write the results to {DEFAULT_BASELINE}")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative slowdown / memory growth before flagging")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.cases, args.sizes, args.repeat, args.max_seconds)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["regressions"] = compare_to_baseline(report, baseline, args.threshold)
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['case']} size={r['size']} {r['metric']}: "
+                  f"{r['baseline']:.4g} -> {r['current']:.4g} ({r['ratio']:.2f}x)")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""Depth-layered soil processing for SoilGrids depth intervals.
+
+A layered workbook has one row per point and one column per raw property and
+depth, named like SoilGrids layers, e.g. ``clay_content_0-5cm`` (a trailing
+``_mean`` is accepted). All depths are derived together as (points x depths)
+arrays by soil_model, and thickness-weighted averages are taken over each
+foundation depth range in the same pass.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+import soil_model as sm
+from instrumentation import count, stage
+
+SOILGRIDS_DEPTHS = [(0, 5), (5, 15), (15, 30), (30, 60), (60, 100), (100, 200)]
+FOUNDATION_DEPTH_RANGES = [(0, 30), (30, 100), (100, 200)]
+
+_LAYER_COLUMN = re.compile(r"^(?P<name>.+)_(?P<top>\d+)-(?P<bottom>\d+)cm(?:_mean)?$")
+_DEPTH_RANGE = re.compile(r"^(?P<top>\d+)\s*-\s*(?P<bottom>\d+)\s*(?:cm)?$")
+
+
+def depth_label(top, bottom):
+    return f"{top}-{bottom}cm"
+
+
+def parse_depth_ranges(text):
+    """Depth ranges from text like "0-30, 30-100" (cm); raises ValueError when none or a malformed one is given."""
+    ranges = []
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        match = _DEPTH_RANGE.match(part)
+        if match is None:
+            raise ValueError(f"'{part}' is not a depth range like 0-30")
+        top, bottom = int(match["top"]), int(match["bottom"])
+        if bottom <= top:
+            raise ValueError(f"Depth range {part} must go downwards")
+        ranges.append((top, bottom))
+    if not ranges:
+        raise ValueError("Enter at least one depth range, e.g. 0-30")
+    return ranges
+
+
+def layer_columns(columns):
+    """Map each (top, bottom) depth among ``columns`` (frame columns, band names) to its {raw column name: column}."""
+    layers = {}
+    for column in columns:
+        match = _LAYER_COLUMN.match(str(column))
+        if match and match["name"] in sm.RAW_COLUMNS:
+            depth = (int(match["top"]), int(match["bottom"]))
+            layers.setdefault(depth, {})[match["name"]] = column
+    for depth, columns in layers.items():
+        missing = [name for name in sm.RAW_COLUMNS if name not in columns]
+        if missing:
+            raise ValueError(f"Depth {depth_label(*depth)} is missing columns: {', '.join(missing)}")
+    return dict(sorted(layers.items()))
+
+
+def is_layer_column(column):
+    """Whether ``column`` names a raw soil property at a depth, e.g. clay_content_0-5cm."""
+    match = _LAYER_COLUMN.match(str(column))
+    return match is not None and match["name"] in sm.RAW_COLUMNS
+
+
+def is_layered(columns):
+    """Whether any of ``columns`` (frame columns, a sheet header) is a raw soil property at a depth."""
+    return any(is_layer_column(column) for column in columns)
+
+
+def _overlap(depths, ranges):
+    """Thickness (cm) of every depth interval inside every range, shape (ranges, depths)."""
+    tops, bottoms = np.array(depths, dtype=float).T
+    range_tops, range_bottoms = np.array(ranges, dtype=float).reshape(-1, 2).T
+    return np.clip(np.minimum(bottoms, range_bottoms[:, None]) - np.maximum(tops, range_tops[:, None]), 0, None)
+
+
+def _dominant(categories, weights):
+    """Category covering the most thickness per point; categories (points, depths), weights (depths,)."""
+    labels, inverse = np.unique(categories.astype(str), return_inverse=True)
+    inverse = inverse.reshape(categories.shape)
+    totals = np.zeros((categories.shape[0], len(labels)))
+    np.add.at(totals, (np.arange(categories.shape[0])[:, None], inverse), np.broadcast_to(weights, categories.shape))
+    return np.where(totals.max(axis=1) > 0, labels[totals.argmax(axis=1)], None).astype(object)
+
+
+def process_layered_soil_data(df, ranges=FOUNDATION_DEPTH_RANGES):
+    """Derive every property for every point and depth, plus thickness-weighted range averages.
+
+    Returns two frames: ``layers`` with one row per point and depth (the
+    process_soil_data columns plus Depth/Top_cm/Bottom_cm), and ``aggregates``
+    with one row per point and range. Numeric properties are averaged by the
+    thickness each depth interval has inside the range, skipping NaN; text
+    properties take the value covering the most thickness, and Friction_Bounds
+    follows the range's Soil_Texture.
+    """
+    layers = layer_columns(df.columns)
+    if not layers:
+        raise ValueError("No layered columns like 'clay_content_0-5cm' found.")
+    if not len(ranges):
+        raise ValueError("No foundation depth ranges given.")
+    depths = list(layers)
+    layered = {column for columns in layers.values() for column in columns.values()}
+    id_columns = [c for c in df.columns if c not in layered]
+    n_points, n_depths = len(df), len(depths)
+
+    with stage("layered derivation"):
+        raw = {name: np.column_stack([df[layers[depth][name]].to_numpy(dtype=float) for depth in depths])
+               for name in sm.RAW_COLUMNS}
+        derived = sm.derive_properties(raw)
+    count("rows processed", n_points)
+    count("layers processed", n_points * n_depths)
+
+    ids = df[id_columns].iloc[np.repeat(np.arange(n_points), n_depths)].reset_index(drop=True)
+    tops, bottoms = np.array(depths).T
+    layer_frame = pd.concat([ids, pd.DataFrame({
+        "Depth": np.tile([depth_label(*d) for d in depths], n_points),
+        "Top_cm": np.tile(tops, n_points),
+        "Bottom_cm": np.tile(bottoms, n_points),
+        **{name: values.ravel() for name, values in raw.items()},
+        **sm.with_friction_bounds({name: values.ravel() for name, values in derived.items()}),
+    })], axis=1)
+
+    with stage("depth aggregation"):
+        weights = _overlap(depths, ranges)  # (ranges, depths)
+        aggregated = {}
+        for name, values in derived.items():
+            if values.dtype == object:
+                aggregated[name] = np.column_stack([_dominant(values, w) for w in weights]).ravel()
+                continue
+            valid = ~np.isnan(values)
+            total = valid @ weights.T
+            with np.errstate(invalid="ignore", divide="ignore"):
+                aggregated[name] = np.where(total > 0, np.where(valid, values, 0) @ weights.T / total, np.nan).ravel()
+        aggregated = sm.with_friction_bounds(aggregated)
+    aggregate_frame = pd.concat([
+        df[id_columns].iloc[np.repeat(np.arange(n_points), len(ranges))].reset_index(drop=True),
+        pd.DataFrame({"Depth_Range": np.tile([depth_label(*r) for r in ranges], n_points), **aggregated}),
+    ], axis=1)
+    return layer_frame, aggregate_frame
@@ -0,0 +1,143 @@
+"""Single export path for result frames: streamed xlsx, gzipped CSV or Parquet.
+
+The xlsx writer uses xlsxwriter's constant_memory mode, writing rows in order
+with one typed number/date format per column instead of pandas' per-cell
+styling, and continues on a new sheet whenever Excel's row limit is reached.
+Rows are converted to Python values CHUNK_ROWS at a time, as they are written.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import xlsxwriter
+from instrumentation import count, stage
+
+EXCEL_MAX_ROWS = 1048576  # rows per sheet, header included
+CHUNK_ROWS = 10000  # rows converted to Python values at a time
+CACHED_EXPORTS = 8  # keyed exports kept per session for reruns
+
+EXPORT_FORMATS = {
+    "Excel (.xlsx)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Compressed CSV (.csv.gz)": ("csv.gz", "application/gzip"),
+    "Parquet (.parquet)": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def scalar_columns(df):
+    """Stringify values Excel/Parquet cannot hold, e.g. the Friction_Bounds tuples."""
+    df = df.copy(deep=False)
+    for col in df.columns[df.dtypes == object]:
+        if df[col].map(lambda v: isinstance(v, (tuple, list, dict, set))).any():
+            df[col] = df[col].map(lambda v: str(v) if isinstance(v, (tuple, list, dict, set)) else v)
+    return df
+
+
+def _column_format(workbook, series):
+    # Floats keep Excel's General format, which shows the full value (coordinates, small ratios)
+    if pd.api.types.is_bool_dtype(series):
+        return None
+    if pd.api.types.is_integer_dtype(series):
+        return workbook.add_format({"num_format": "0"})
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+    return None
+
+
+def _column_values(series):
+    """Plain Python values for one column, with missing values as None (blank cell)."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.tz_localize(None) if series.dt.tz is not None else series
+        values = values.astype(object)
+    elif pd.api.types.is_float_dtype(series):
+        values = series.astype(object)
+        # inf has no xlsx representation either; write it as a blank like NaN
+        return values.where(np.isfinite(series.to_numpy(dtype=float, na_value=np.nan)), None).tolist()
+    else:
+        values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def _rows(df, start, stop):
+    """Rows ``start:stop`` of ``df`` as tuples of plain Python values, converted CHUNK_ROWS at a time."""
+    for chunk_start in range(start, stop, CHUNK_ROWS):
+        chunk = scalar_columns(df.iloc[chunk_start:min(chunk_start + CHUNK_ROWS, stop)])
+        yield from zip(*(_column_values(chunk[col]) for col in chunk.columns))
+
+
+def write_xlsx(df, output, sheet_name="Sheet1"):
+    """Stream ``df`` into an xlsx workbook at ``output`` (path or binary file object)."""
+    rows_per_sheet = EXCEL_MAX_ROWS - 1
+
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True, "strings_to_urls": False})
+    header_format = workbook.add_format({"bold": True})
+    formats = [_column_format(workbook, df[col]) for col in df.columns]
+    header = [str(col) for col in df.columns]
+
+    n_sheets = max(1, -(-len(df) // rows_per_sheet))
+    for sheet in range(n_sheets):
+        name = sheet_name if sheet == 0 else f"{sheet_name[:25]} ({sheet + 1})"
+        worksheet = workbook.add_worksheet(name)
+        for col, fmt in enumerate(formats):
+            if fmt is not None:
+                worksheet.set_column(col, col, None, fmt)
+        worksheet.write_row(0, 0, header, header_format)
+
+        start = sheet * rows_per_sheet
+        stop = min(start + rows_per_sheet, len(df))
+        for row, values in enumerate(_rows(df, start, stop), start=1):
+            worksheet.write_row(row, 0, values)
+
+    workbook.close()
+    count("sheets written", n_sheets)
+
+
+def export_frame(df, fmt="xlsx", sheet_name="Sheet1"):
+    """Serialize ``df`` to bytes in one of the EXPORT_FORMATS extensions."""
+    output = io.BytesIO()
+    with stage(f"{fmt} write"):
+        if fmt == "xlsx":
+            write_xlsx(df, output, sheet_name)
+        elif fmt == "csv.gz":
+            df.to_csv(output, index=False, compression={"method": "gzip", "compresslevel": 6})
+        elif fmt == "parquet":
+            scalar_columns(df).to_parquet(output, index=False)
+        else:
+            raise ValueError(f"Unsupported export format: {fmt}")
+    count("bytes written", output.tell())
+    return output.getvalue()
+
+
+def export_format_option():
+    """Sidebar picker for the download format; returns (extension, mime type)."""
+    label = st.sidebar.selectbox("Download format", list(EXPORT_FORMATS))
+    return EXPORT_FORMATS[label]
+
+
+def cached_export(key, build):
+    """Bytes of ``build()``, made once per ``key`` in this session and reused on reruns."""
+    cache = st.session_state.setdefault("export_cache", {})
+    if key not in cache:
+        cache[key] = build()
+        while len(cache) > CACHED_EXPORTS:
+            cache.pop(next(iter(cache)))
+    return cache[key]
+
+
+def download_frame(df, export_format, base_name, label, sheet_name="Sheet1", key=None):
+    """Export ``df`` in ``export_format`` and offer it as a download.
+
+    With a ``key`` (e.g. the job ID, for a job's result) the export is made once
+    per key, format and sheet and reused on reruns; without, on every run.
+    """
+    fmt, mime = export_format
+    if key is None:
+        data = export_frame(df, fmt, sheet_name)
+    else:
+        data = cached_export((key, base_name, fmt, sheet_name), lambda: export_frame(df, fmt, sheet_name))
+    st.download_button(
+        label=label,
+        data=data,
+        file_name=f"{base_name}.{fmt}",
+        mime=mime,
+    )
@@ -0,0 +1,159 @@
+"""Column-pruned, typed ingestion of every sheet of one or many workbooks.
+
+Each (workbook, sheet) pair is a task for a worker process: it reads only the
+columns a tool uses (``usecols`` keeps pandas from converting the rest), or
+every column for tools whose output carries the user's columns along, and
+coerces the declared ones to their types in the same pass, so the parent only
+concatenates ready frames. Sheets missing a required column, such as notes
+or legends, are skipped. Values that fail coercion become missing and are
+counted per column in the frame's ``attrs["invalid_values"]``.
+"""
+import io
+import os
+
+import openpyxl
+import pandas as pd
+
+from instrumentation import count, stage
+from parallel import chunk_size, process_pool, worker_count
+
+NUMERIC = "numeric"  # pd.to_numeric: integer columns stay integer
+TEXT = "text"  # str, missing values kept
+XLS_SIGNATURE = b"\xd0\xcf\x11\xe0"  # legacy .xls (OLE2) workbooks, read with xlrd
+
+
+class MissingColumnsError(ValueError):
+    """No sheet of the workbooks has the columns to read."""
+
+
+def workbook_bytes(workbook):
+    """(name, bytes) of a path, an uploaded file, a (name, bytes) pair or a binary buffer."""
+    if isinstance(workbook, tuple):
+        return workbook
+    if isinstance(workbook, (str, os.PathLike)):
+        with open(workbook, "rb") as f:
+            return os.path.basename(workbook), f.read()
+    if hasattr(workbook, "getvalue"):
+        return getattr(workbook, "name", "workbook.xlsx"), workbook.getvalue()
+    return getattr(workbook, "name", "workbook.xlsx"), workbook.read()
+
+
+def sheet_names(data):
+    """Sheet names of an xlsx or xls workbook, without parsing any sheet."""
+    if data.startswith(XLS_SIGNATURE):
+        with pd.ExcelFile(io.BytesIO(data), engine="xlrd") as workbook:
+            return workbook.sheet_names
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def sheet_headers(data):
+    """Header row (column names) of every sheet of an xlsx or xls workbook, by sheet name."""
+    if data.startswith(XLS_SIGNATURE):
+        sheets = pd.read_excel(io.BytesIO(data), sheet_name=None, nrows=0, engine="xlrd")
+        return {sheet: list(df.columns) for sheet, df in sheets.items()}
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    try:
+        return {sheet.title: [value for value in next(sheet.iter_rows(max_row=1, values_only=True), ())
+                              if value is not None]
+                for sheet in workbook.worksheets}
+    finally:
+        workbook.close()
+
+
+def coerce(df, types):
+    """``df`` with each column of ``types`` converted in place; returns it and the invalid value count per column."""
+    invalid = {}
+    for column in df.columns:
+        kind = types.get(column)
+        if kind == NUMERIC:
+            values = pd.to_numeric(df[column], errors="coerce")
+            lost = int((values.isna() & df[column].notna()).sum())
+            if lost:
+                invalid[column] = lost
+            df[column] = values
+        elif kind == TEXT:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df, invalid
+
+
+def _read_sheet(task):
+    """Typed frame (or None when a required column, or every ``match`` column, is missing) and invalid counts of one sheet."""
+    name, data, sheet, required, types, match, keep_other = task
+
+    def wanted(column):
+        return keep_other or column in types or (match is not None and match(str(column)))
+
+    df = pd.read_excel(io.BytesIO(data), sheet_name=sheet, usecols=wanted)
+    if df.columns.empty or any(column not in df for column in required):
+        return name, sheet, None, {}
+    if match is not None and not any(match(str(column)) for column in df.columns):
+        return name, sheet, None, {}
+    # Columns kept through ``match`` are numeric; other columns stay as read
+    matched = {column: NUMERIC for column in df.columns if match is not None and match(str(column))}
+    df, invalid = coerce(df, {**matched, **types})
+    return name, sheet, df.assign(Source=name, Sheet=sheet), invalid
+
+
+def _read_sheets(tasks):
+    return [_read_sheet(task) for task in tasks]
+
+
+def read_workbooks(workbooks, columns, optional=None, match=None, keep_other=False, max_workers=None, progress=None):
+    """One typed frame from every sheet of ``workbooks`` that has all of ``columns``.
+
+    ``columns`` and ``optional`` map column names to NUMERIC, TEXT or None (kept
+    as read); optional columns are kept where a sheet has them. ``match`` is a
+    predicate on column names for further columns to keep, coerced as NUMERIC;
+    with it, sheets without any such column are skipped. With ``keep_other``
+    every other column of a sheet is kept too, as read.
+    Rows carry their workbook name and sheet in Source and Sheet columns.
+    ``progress`` gets the fraction of sheets read. Raises MissingColumnsError when no
+    sheet has the columns.
+    """
+    types = {**(optional or {}), **columns}
+    workbooks = [workbook_bytes(workbook) for workbook in workbooks]
+    with stage("sheet listing"):
+        tasks = [(name, data, sheet, list(columns), types, match, keep_other)
+                 for name, data in workbooks for sheet in sheet_names(data)]
+
+    with stage("Excel parse"):
+        size = chunk_size(len(tasks), max_workers)
+        batches = [tasks[start:start + size] for start in range(0, len(tasks), size)]
+        if len(tasks) < 2 or worker_count(max_workers) == 1:
+            results = map(_read_sheets, batches)
+            executor = None
+        else:
+            executor = process_pool(max_workers, preload=[__name__])
+            results = executor.map(_read_sheets, batches)
+        frames, invalid, read = [], {}, 0
+        try:
+            for batch in results:
+                for name, sheet, df, sheet_invalid in batch:
+                    if df is None:
+                        count("sheets skipped")
+                    else:
+                        frames.append(df)
+                        for column, n in sheet_invalid.items():
+                            invalid[column] = invalid.get(column, 0) + n
+                read += len(batch)
+                if progress is not None:
+                    progress(read / len(tasks))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    if not frames:
+        names = ", ".join(name for name, _ in workbooks)
+        if columns:
+            raise MissingColumnsError(f"No sheet of {names} has the columns: {', '.join(columns)}")
+        raise MissingColumnsError(f"No sheet of {names} has any of the columns to read")
+    with stage("concatenate"):
+        df = pd.concat(frames, ignore_index=True)
+    count("sheets read", len(frames))
+    count("invalid values", sum(invalid.values()))
+    df.attrs["invalid_values"] = invalid
+    return df
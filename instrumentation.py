@@ -0,0 +1,152 @@
+"""Stage timers, counters and optional cProfile traces for the tool scripts.
+
+A tool wraps one run in ``track_run``; code underneath marks its stages with
+``stage`` and its work with ``count``. Both are no-ops when no run is being
+tracked, so the helpers can be called from anywhere without extra arguments.
+"""
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+import streamlit as st
+
+_current_run = contextvars.ContextVar("current_run", default=None)
+
+
+class RunStats:
+    """Timings and counters collected during one run of a tool."""
+
+    def __init__(self, tool):
+        self.tool = tool
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.wall_seconds = 0.0
+        self.stages = {}
+        self.counters = {}
+        self.profile_text = None
+        self.profile_bytes = None
+
+    def add_time(self, name, seconds):
+        calls, total = self.stages.get(name, (0, 0.0))
+        self.stages[name] = (calls + 1, total + seconds)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        return {
+            "tool": self.tool,
+            "started_at": self.started_at,
+            "wall_seconds": self.wall_seconds,
+            "stages": [
+                {"stage": name, "calls": calls, "seconds": seconds}
+                for name, (calls, seconds) in self.stages.items()
+            ],
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+
+def current_stats():
+    """The RunStats being collected in this context, or None."""
+    return _current_run.get()
+
+
+@contextmanager
+def track_run(tool, profile=False):
+    """Collect stage timings for the enclosed block, optionally under cProfile."""
+    stats = RunStats(tool)
+    token = _current_run.set(stats)
+    profiler = cProfile.Profile() if profile else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield stats
+    finally:
+        if profiler:
+            profiler.disable()
+            _store_profile(stats, profiler)
+        stats.wall_seconds = time.perf_counter() - start
+        _current_run.reset(token)
+
+
+def _store_profile(stats, profiler):
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(30)
+    stats.profile_text = text.getvalue()
+
+    # pstats only dumps to a path; keep the binary trace for snakeviz/pstats users
+    fd, path = tempfile.mkstemp(suffix=".prof")
+    os.close(fd)
+    try:
+        profiler.dump_stats(path)
+        with open(path, "rb") as f:
+            stats.profile_bytes = f.read()
+    finally:
+        os.remove(path)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage ``name`` of the current run."""
+    stats = _current_run.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_time(name, time.perf_counter() - start)
+
+
+def count(name, amount=1):
+    """Add ``amount`` to counter ``name`` of the current run."""
+    stats = _current_run.get()
+    if stats is not None:
+        stats.count(name, amount)
+
+
+def diagnostics_options():
+    """Sidebar switches for the diagnostics panel and profiling."""
+    with st.sidebar.expander("Diagnostics"):
+        show = st.checkbox("Show timing diagnostics", value=False)
+        profile = st.checkbox("Profile runs (cProfile)", value=False)
+    return show, profile
+
+
+def render_diagnostics(stats):
+    """Show the stage breakdown and counters of a run with JSON/profile downloads."""
+    with st.expander("Diagnostics", expanded=True):
+        st.write(f"Total run time: {stats.wall_seconds:.3f} s")
+        if stats.stages:
+            stages = pd.DataFrame(stats.to_dict()["stages"])
+            stages["share_%"] = (stages["seconds"] / stats.wall_seconds * 100).round(1) if stats.wall_seconds else 0
+            st.dataframe(stages.sort_values("seconds", ascending=False), hide_index=True)
+        if stats.counters:
+            st.dataframe(pd.DataFrame(list(stats.counters.items()), columns=["counter", "value"]), hide_index=True)
+
+        st.download_button(
+            label="Download diagnostics as JSON",
+            data=stats.to_json(),
+            file_name=f"{stats.tool}_diagnostics.json",
+            mime="application/json",
+        )
+        if stats.profile_bytes is not None:
+            st.text(stats.profile_text)
+            st.download_button(
+                label="Download cProfile trace",
+                data=stats.profile_bytes,
+                file_name=f"{stats.tool}.prof",
+                mime="application/octet-stream",
+            )
@@ -0,0 +1,140 @@
+"""Interpolation of borehole properties onto a raster grid.
+
+Boreholes are indexed once per property in a KD-tree (in the reference
+raster's CRS), leaving out those without finite coordinates or a value for
+that property. The grid is then evaluated in strips of whole tile rows: each strip's cell
+centres are one vectorized k-nearest query, spread over cores by the tree,
+and the result is written straight into a tiled GeoTIFF that shares the
+reference raster's transform, CRS and size.
+"""
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.crs import CRS
+from rasterio.warp import transform
+from rasterio.windows import Window
+from scipy.spatial import cKDTree
+
+from instrumentation import count, stage
+
+INTERPOLATION_METHODS = ["idw", "nearest-k"]
+DESIGN_PROPERTIES = ["Adjusted_Cohesion", "phi", "SPT_N_Values", "Relative_Density"]
+
+TILE_SIZE = 256
+CHUNK_CELLS = 512 * 1024  # grid cells evaluated per query
+
+
+def project_points(lon, lat, crs):
+    """(points, 2) x/y of finite ``lon``/``lat`` arrays in ``crs``."""
+    with stage("CRS transform"):
+        if crs is None or crs == CRS.from_epsg(4326):
+            xs, ys = lon, lat
+        else:
+            xs, ys = transform(CRS.from_epsg(4326), crs, lon.tolist(), lat.tolist())
+    return np.column_stack([xs, ys])
+
+
+def build_trees(df, columns, crs):
+    """One (KD-tree, values (points, 1)) pair per column, over the boreholes with coordinates and a value.
+
+    Raises ValueError when no borehole has finite coordinates, or none of those has a value for a column.
+    """
+    lon = pd.to_numeric(df["Longitude"], errors="coerce").to_numpy(dtype=float)
+    lat = pd.to_numeric(df["Latitude"], errors="coerce").to_numpy(dtype=float)
+    values = df[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    located = np.isfinite(lon) & np.isfinite(lat)
+    if not located.any():
+        raise ValueError("No borehole has finite Longitude and Latitude.")
+    points = project_points(lon[located], lat[located], crs)
+    values = values[located]
+
+    trees = []
+    with stage("KD-tree build"):
+        for band, column in enumerate(columns):
+            keep = np.isfinite(values[:, band])
+            if not keep.any():
+                raise ValueError(f"No borehole with coordinates has a value for {column}.")
+            trees.append((cKDTree(points[keep]), values[keep, band:band + 1]))
+    count("boreholes indexed", int(located.sum()))
+    return trees
+
+
+def _cell_centres(src_transform, row_off, n_rows, width):
+    rows, cols = np.mgrid[row_off:row_off + n_rows, 0:width]
+    xs, ys = src_transform * (cols.ravel() + 0.5, rows.ravel() + 0.5)
+    return np.column_stack([xs, ys])
+
+
+def interpolate(tree, values, cells, method="idw", k=8, power=2.0, max_distance=None, workers=-1):
+    """Values at ``cells`` (n, 2) from the tree's points carrying ``values`` (points, properties).
+
+    Returns (properties, n). NaN values at a point, and neighbours beyond
+    ``max_distance``, do not contribute; a cell with no contributing neighbour is NaN.
+    """
+    k = min(k, tree.n)
+    distances, idx = tree.query(cells, k=k, workers=workers,
+                                distance_upper_bound=np.inf if max_distance is None else max_distance)
+    distances, idx = distances.reshape(len(cells), k), idx.reshape(len(cells), k)
+    # Missing neighbours come back as index tree.n; point them at a row of NaN
+    values = np.vstack([values, np.full((1, values.shape[1]), np.nan)])
+
+    if method == "idw":
+        with np.errstate(divide="ignore"):
+            weights = 1.0 / distances ** power
+        # A cell sitting on a borehole takes that borehole's value
+        exact = distances[:, 0] == 0
+        weights[exact] = 0.0
+        weights[exact, 0] = 1.0
+    elif method == "nearest-k":
+        weights = np.ones_like(distances)
+    else:
+        raise ValueError(f"Unknown interpolation method: {method}")
+
+    result = np.empty((values.shape[1], len(cells)))
+    for band in range(values.shape[1]):
+        neighbour_values = values[idx, band]
+        w = np.where(np.isnan(neighbour_values), 0.0, weights)
+        total = w.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[band] = np.where(total > 0, np.nansum(neighbour_values * w, axis=1) / total, np.nan)
+    return result
+
+
+def interpolate_to_raster(df, columns, reference_path, output_path, method="idw", k=8, power=2.0,
+                          max_distance=None, workers=-1, progress=None):
+    """Write one band per column of ``df`` on the grid of the raster at ``reference_path``.
+
+    ``max_distance`` is in the reference CRS units; ``progress`` gets the fraction of rows written.
+    """
+    with rasterio.open(reference_path) as ref:
+        profile = ref.profile
+    height, width = profile["height"], profile["width"]
+    profile.update(
+        driver="GTiff", count=len(columns), dtype="float32", nodata=np.nan,
+        tiled=True, blockxsize=TILE_SIZE, blockysize=TILE_SIZE, compress="deflate",
+        BIGTIFF="IF_SAFER",
+    )
+    profile.pop("photometric", None)
+
+    trees = build_trees(df, columns, profile["crs"])
+    # Writes cover whole tile rows; queries within a strip are capped at CHUNK_CELLS cells
+    strip = TILE_SIZE
+
+    with rasterio.open(output_path, "w", **profile) as dst:
+        dst.descriptions = tuple(columns)
+        for row_off in range(0, height, strip):
+            n_rows = min(strip, height - row_off)
+            grid = np.empty((len(columns), n_rows * width), dtype=np.float32)
+            with stage("grid interpolation"):
+                cells = _cell_centres(profile["transform"], row_off, n_rows, width)
+                for start in range(0, len(cells), CHUNK_CELLS):
+                    chunk = cells[start:start + CHUNK_CELLS]
+                    for band, (tree, values) in enumerate(trees):
+                        grid[band, start:start + len(chunk)] = interpolate(
+                            tree, values, chunk, method, k, power, max_distance, workers)[0]
+            with stage("raster write"):
+                dst.write(grid.reshape(len(columns), n_rows, width),
+                          window=Window(0, row_off, width, n_rows))
+            count("cells interpolated", n_rows * width)
+            if progress is not None:
+                progress((row_off + n_rows) / height)
@@ -0,0 +1,175 @@
+"""Background jobs for long tool runs.
+
+Jobs run on a small thread pool owned by the Streamlit server process, so a
+run keeps going when the browser disconnects and its result can be picked up
+again by job ID (kept in the page URL). Workers report progress through
+``Job.report``, which stores at most a few updates per second and raises
+``JobCancelled`` once a cancel was requested; the page polls the job at a
+fixed interval instead of being pushed every update.
+"""
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from instrumentation import track_run
+
+MAX_WORKERS = 2
+MAX_FINISHED_JOBS = 20
+PROGRESS_INTERVAL = 0.25  # seconds between stored progress updates
+POLL_INTERVAL = 1.0  # seconds between page refreshes while a job runs
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class JobCancelled(BaseException):
+    """Raised inside a job when the user cancelled it.
+
+    Not an Exception, so the tools' ``except Exception`` error reporting lets it through.
+    """
+
+
+class Job:
+    def __init__(self, tool, label):
+        self.id = uuid.uuid4().hex[:12]
+        self.tool = tool
+        self.label = label
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Waiting for a worker"
+        self.result = None
+        self.error = None
+        self.stats = None
+        self.created = time.time()
+        self.finished = None
+        self._cancel = threading.Event()
+        self._last_report = 0.0
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def report(self, fraction, message=None):
+        """Record progress, dropping updates that arrive faster than PROGRESS_INTERVAL."""
+        self.check_cancelled()
+        now = time.monotonic()
+        if fraction >= 1 or now - self._last_report >= PROGRESS_INTERVAL:
+            self.progress = min(max(float(fraction), 0.0), 1.0)
+            if message is not None:
+                self.message = message
+            self._last_report = now
+
+
+class JobManager:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="soil-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, tool, label, fn, *args, profile=False, **kwargs):
+        """Run ``fn(job, *args, **kwargs)`` in the background and return the Job."""
+        job = Job(tool, label)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        self._executor.submit(self._run, job, fn, args, kwargs, profile)
+        return job
+
+    def _run(self, job, fn, args, kwargs, profile):
+        if job._cancel.is_set():
+            job.status, job.finished = CANCELLED, time.time()
+            return
+        job.status, job.message = RUNNING, "Running"
+        try:
+            with track_run(job.tool, profile=profile) as stats:
+                job.stats = stats
+                job.result = fn(job, *args, **kwargs)
+            job.status, job.progress, job.message = DONE, 1.0, "Finished"
+        except JobCancelled:
+            job.status, job.message = CANCELLED, "Cancelled"
+        except Exception as e:
+            job.status, job.error, job.message = FAILED, f"{e}\n{traceback.format_exc()}", str(e)
+        finally:
+            job.finished = time.time()
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self, tool=None):
+        return [job for job in reversed(self._jobs.values()) if tool is None or job.tool == tool]
+
+
+@st.cache_resource
+def get_job_manager():
+    """The server-wide JobManager, shared by every session and surviving reruns."""
+    return JobManager()
+
+
+def submit_job(tool, label, fn, *args, profile=False, **kwargs):
+    """Start a job and remember its ID in the page URL so a reload finds it again."""
+    job = get_job_manager().submit(tool, label, fn, *args, profile=profile, **kwargs)
+    st.query_params["job"] = job.id
+    return job
+
+
+def current_job(tool):
+    """The job named in the page URL, if it belongs to ``tool``."""
+    job = get_job_manager().get(st.query_params.get("job", ""))
+    return job if job is not None and job.tool == tool else None
+
+
+def recent_jobs_sidebar(tool):
+    """Sidebar list of this tool's recent jobs; picking one reopens it."""
+    jobs = get_job_manager().jobs(tool)
+    if not jobs:
+        return
+    with st.sidebar.expander("Recent jobs"):
+        for job in jobs[:10]:
+            if st.button(f"{job.label} - {job.status}", key=f"job_{job.id}"):
+                st.query_params["job"] = job.id
+                st.rerun()
+
+
+def render_job(job, render_result):
+    """Show a job's progress while it runs, then its outcome.
+
+    ``render_result(job)`` draws the finished job's output.
+    """
+    if job.active:
+        _poll_job(job.id)
+        return
+    if job.status == DONE:
+        render_result(job)
+    elif job.status == CANCELLED:
+        st.warning(f"{job.label} was cancelled.")
+    else:
+        st.error(f"{job.label} failed: {job.message}")
+        with st.expander("Details"):
+            st.code(job.error)
+
+
+@st.fragment(run_every=POLL_INTERVAL)
+def _poll_job(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None or not job.active:
+        st.rerun()  # Full rerun renders the outcome
+    st.progress(job.progress, text=f"{job.label}: {job.message} ({job.progress:.0%})")
+    if st.button("Cancel", key=f"cancel_{job.id}"):
+        job.cancel()
+        job.message = "Cancelling"
@@ -0,0 +1,126 @@
+"""Load test for the extraction service: latency percentiles under concurrent clients.
+
+Examples:
+    python loadtest.py --url http://127.0.0.1:8765 --concurrency 16 --requests 2000
+    python loadtest.py --synthetic --points 50 --endpoint soil
+
+Each client thread sends requests back to back with ``--points`` random
+points inside the served rasters' footprints (or random raw soil rows for
+the soil endpoint). ``--synthetic`` first starts a service in this process
+on a generated raster stack, so the test runs without any data at hand.
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+import service
+import synthetic_data
+from raster_catalog import RasterCatalog
+
+
+def _post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def _get(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+def _payloads(endpoint, bounds, points, seed):
+    """Endless request bodies of random points (extract) or raw soil rows (soil)."""
+    rng = np.random.default_rng(seed)
+    while True:
+        if endpoint == "soil":
+            rows = synthetic_data.soil_table(points, seed=int(rng.integers(2**31)))
+            yield {"rows": rows.to_dict(orient="records")}
+        else:
+            west, south, east, north = bounds
+            lon, lat = rng.uniform(west, east, points), rng.uniform(south, north, points)
+            yield {"points": [{"Longitude": x, "Latitude": y} for x, y in zip(lon.tolist(), lat.tolist())],
+                   "mode": "bilinear"}
+
+
+def run_load(url, endpoint="extract", concurrency=8, requests=1000, points=10, bounds=None):
+    """Latency (seconds) of every request and the wall time, for ``requests`` spread over ``concurrency`` clients."""
+    if bounds is None and endpoint == "extract":
+        footprints = np.array([entry["footprint"] for entry in _get(f"{url}/rasters")])
+        bounds = (footprints[:, 0].min(), footprints[:, 1].min(), footprints[:, 2].max(), footprints[:, 3].max())
+    latencies, errors = [], []
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+
+    def client(seed):
+        bodies = _payloads(endpoint, bounds, points, seed)
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            body = next(bodies)
+            start = time.perf_counter()
+            try:
+                _post(f"{url}/{endpoint}", body)
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, wall_seconds):
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies), "errors": len(errors),
+        "throughput_per_s": len(latencies) / wall_seconds if wall_seconds else 0.0,
+        "mean_ms": statistics.fmean(ms) if len(ms) else None,
+        **{f"p{q}_ms": float(np.percentile(ms, q)) if len(ms) else None for q in (50, 90, 99)},
+        "max_ms": float(ms.max()) if len(ms) else None,
+    }
+
+
+def start_synthetic_service(workdir):
+    """Serve a generated raster stack of the raw soil columns from a background thread; returns its URL."""
+    paths = synthetic_data.geotiff_stack(workdir, 2048 * 2048, len(synthetic_data.SOIL_COLUMNS))
+    server = service.make_server(RasterCatalog.build(paths), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--synthetic", action="store_true", help="start a service on generated rasters first")
+    parser.add_argument("--endpoint", choices=["extract", "soil"], default="extract")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=10, help="points (or soil rows) per request")
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        url = start_synthetic_service(workdir) if args.synthetic else args.url.rstrip("/")
+        run_load(url, args.endpoint, 1, args.warmup, args.points)
+        report = summarize(*run_load(url, args.endpoint, args.concurrency, args.requests, args.points))
+        report["service"] = _get(f"{url}/health")
+        print(json.dumps(report, indent=2))
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
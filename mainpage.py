@@ -38,7 +38,8 @@ apps = {
     "TIFF File Processor": "1.py",
     "Borehole KMZ Generator": "2.py",
     "KMZ to TIFF Data Extractor": "3.py",
-    "Advanced Soil Data Processor": "4.py"
+    "Advanced Soil Data Processor": "4.py",
+    "Results Explorer": "5.py"
 }
 
 # Create columns for a centered layout
@@ -78,6 +79,11 @@ with col2:
         st.success("Launching Advanced Soil Data Processor...")
         subprocess.Popen(["streamlit", "run", apps["Advanced Soil Data Processor"]])
 
+# Stored results of all tools, below the grid
+if st.button("Results Explorer"):
+    st.success("Launching Results Explorer...")
+    subprocess.Popen(["streamlit", "run", apps["Results Explorer"]])
+
 # Footer
 st.markdown("<hr style='margin-top: 30px;'>", unsafe_allow_html=True)
 st.info("Once an application is launched, it will run in a new process.")
@@ -0,0 +1,29 @@
+"""Process pools shared by the batch tools.
+
+Workers are started from a fork server where the platform has one, so the
+heavy imports (rasterio, pandas) happen once instead of once per worker, and
+fall back to spawn elsewhere. Plain fork is avoided because the Streamlit
+server process is multi-threaded.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def worker_count(max_workers=None):
+    return max(1, max_workers or os.cpu_count() or 1)
+
+
+def process_pool(max_workers=None, preload=()):
+    """A ProcessPoolExecutor whose workers have ``preload`` modules already imported."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(list(preload))
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=worker_count(max_workers), mp_context=context)
+
+
+def chunk_size(n_tasks, max_workers=None, chunks_per_worker=4):
+    """Chunksize for Executor.map that gives each worker a few chunks."""
+    return max(1, n_tasks // (chunks_per_worker * worker_count(max_workers)))
@@ -0,0 +1,452 @@
+"""Partitioned execution of the soil derivations over whole raster stacks.
+
+    python partitioned.py plan   JOB_DIR --rasters /data/soilgrids --tile-size 1024
+    python partitioned.py work   JOB_DIR --wait    # on every machine that shares JOB_DIR
+    python partitioned.py status JOB_DIR
+    python partitioned.py merge  JOB_DIR
+    python partitioned.py run    JOB_DIR --workers 4   # local worker processes, then merge
+
+The input stack is a set of aligned rasters (same CRS, transform and size)
+whose bands are named after the raw SoilGrids columns, either plainly
+(``clay_content``) or per depth (``clay_content_0-5cm``); a band without a
+description is named after its file. ``plan`` splits the grid into square tile
+partitions and writes manifest.json to the job directory. A worker claims a
+partition by creating ``claims/<id>`` with O_EXCL, derives the requested
+properties for every depth of the tile as one array pass through
+soil_model.derive_properties, writes ``parts/<id>.tif`` through a temporary
+file and os.replace, and then marks it ``done/<id>.json``. The job directory
+is the only coordination, so workers can run on any machines that mount it.
+
+Work is resumable: done partitions are skipped, and a claim whose lease has
+not been renewed for ``LEASE_SECONDS`` (its worker died) is taken over. It is
+also idempotent: a partition's output depends only on the manifest, so
+redoing one, even by two workers at once, writes the same file. ``merge``
+assembles the parts into one GeoTIFF per property with a band per depth. Text
+properties (Soil_Texture, Cohesiveness) are written as indices into
+CATEGORIES, and pixels missing any raw input are nodata.
+"""
+import argparse
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import rasterio
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
+
+import soil_model as sm
+from depth_layers import depth_label, layer_columns
+from instrumentation import count, stage
+from parallel import worker_count
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+CLAIM_DIR, PART_DIR, DONE_DIR, OUTPUT_DIR = "claims", "parts", "done", "output"
+TILE_SIZE = 1024  # pixels along a partition side; a multiple of BLOCK_SIZE
+BLOCK_SIZE = 256  # GeoTIFF tile side of parts and outputs
+DERIVE_CHUNK = 262_144  # pixel-depth values derived at a time; derive_properties holds ~60 arrays of them
+LEASE_SECONDS = 600  # a claim not renewed for this long belongs to a worker that stopped
+POLL_SECONDS = 5  # how often a waiting worker looks for claims to take over
+DEFAULT_PROPERTIES = ["Soil_Texture", "Cohesiveness", "Adjusted_Cohesion", "phi", "SPT_N_Values",
+                      "Plasticity_Index", "Void_Ratio", "Relative_Density"]
+CATEGORIES = {
+    "Soil_Texture": sm.TEXTURES + ["Unclassified"],
+    "Cohesiveness": ["Gravelly, Non-Cohesive", "Non-Gravelly, Cohesive", "Non-Gravelly, Non-Cohesive",
+                     "Unclassified"],
+}
+OUTPUT_PROFILE = {"driver": "GTiff", "dtype": "float32", "nodata": np.nan, "tiled": True,
+                  "blockxsize": BLOCK_SIZE, "blockysize": BLOCK_SIZE, "compress": "deflate", "predictor": 3,
+                  "BIGTIFF": "IF_SAFER"}
+
+# Raster handles kept open per worker process, keyed by path
+_open_rasters = {}
+
+
+def _open_raster(path):
+    if path not in _open_rasters:
+        _open_rasters[path] = rasterio.open(path)
+    return _open_rasters[path]
+
+
+def _temporary(path):
+    """A sibling of ``path`` no other process or machine writes to."""
+    return f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+
+
+def _write_atomic(path, data):
+    temporary = _temporary(path)
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def raster_paths(sources):
+    """GeoTIFF paths from a mix of files and folders."""
+    paths = []
+    for source in sources:
+        paths.extend(sorted(glob.glob(os.path.join(source, "*.tif*"))) if os.path.isdir(source) else [source])
+    return [os.path.abspath(path) for path in paths]
+
+
+def stack_layers(paths):
+    """Common grid of an aligned raster stack and its depth layers, each {"depth", "bands": {raw: [path, band]}}."""
+    grid, bands = None, {}
+    for path in paths:
+        with rasterio.open(path) as src:
+            this = {"crs": src.crs.to_wkt() if src.crs else None, "transform": list(src.transform)[:6],
+                    "width": src.width, "height": src.height}
+            if grid is None:
+                grid = this
+            elif this != grid:
+                raise ValueError(f"{os.path.basename(path)} is not on the grid of {os.path.basename(paths[0])}; "
+                                 "a partitioned run needs aligned rasters")
+            stem = os.path.splitext(os.path.basename(path))[0]
+            for band, name in enumerate(src.descriptions, start=1):
+                bands[name or (stem if src.count == 1 else f"{stem}_{band}")] = [path, band]
+    if grid is None:
+        raise ValueError("No rasters to plan over")
+
+    layers = [{"depth": depth_label(*depth), "bands": {raw: bands[name] for raw, name in columns.items()}}
+              for depth, columns in layer_columns(bands).items()]
+    if not layers:
+        missing = [name for name in sm.RAW_COLUMNS if name not in bands]
+        if missing:
+            raise ValueError(f"No bands for the raw soil columns: {', '.join(missing)}")
+        layers = [{"depth": "", "bands": {name: bands[name] for name in sm.RAW_COLUMNS}}]
+    return grid, layers
+
+
+def plan(job_dir, paths, properties=DEFAULT_PROPERTIES, tile_size=TILE_SIZE):
+    """Write the job's manifest; returns it, or the existing one if the job directory already plans the same job."""
+    if tile_size <= 0 or tile_size % BLOCK_SIZE:
+        raise ValueError(f"The tile size must be a multiple of {BLOCK_SIZE}")
+    derived = sm.derive_properties({name: np.ones(1) for name in sm.RAW_COLUMNS})
+    unknown = [name for name in properties
+               if name not in derived or (derived[name].dtype == object and name not in CATEGORIES)]
+    if unknown:
+        raise ValueError(f"Cannot write these properties as rasters: {', '.join(unknown)}")
+
+    paths = [os.path.abspath(path) for path in paths]
+    with stage("plan"):
+        grid, layers = stack_layers(paths)
+        partitions = [
+            {"id": f"r{row_off // tile_size:05d}_c{col_off // tile_size:05d}",
+             "window": [col_off, row_off, min(tile_size, grid["width"] - col_off),
+                        min(tile_size, grid["height"] - row_off)]}
+            for row_off in range(0, grid["height"], tile_size)
+            for col_off in range(0, grid["width"], tile_size)
+        ]
+        manifest = {"version": MANIFEST_VERSION, "rasters": list(paths), "grid": grid, "layers": layers,
+                    "properties": list(properties), "tile_size": tile_size, "partitions": partitions}
+
+        manifest_path = os.path.join(job_dir, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            existing = load_manifest(job_dir)
+            if existing != manifest:
+                raise ValueError(f"{job_dir} already holds a different plan; use a new job directory")
+            return existing
+        os.makedirs(job_dir, exist_ok=True)
+        _write_atomic(manifest_path, json.dumps(manifest, indent=1).encode("utf-8"))
+    count("partitions planned", len(partitions))
+    return manifest
+
+
+def load_manifest(job_dir):
+    with open(os.path.join(job_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"{job_dir} was planned by an incompatible version")
+    return manifest
+
+
+def _read(path_band, window):
+    path, band = path_band
+    values = _open_raster(path).read(band, window=window, masked=True).astype(float)
+    return np.ma.filled(values, np.nan)
+
+
+def _codes(labels, categories):
+    codes = np.full(labels.shape, len(categories) - 1, dtype=float)
+    for code, category in enumerate(categories):
+        codes[labels == category] = code
+    return codes
+
+
+def derive_partition(manifest, partition):
+    """Property -> (depths, rows, cols) float32 array for one partition, or None when it holds no data."""
+    window = Window(*partition["window"])
+    with stage("partition read"):
+        raw = {name: np.stack([_read(layer["bands"][name], window) for layer in manifest["layers"]])
+               for name in sm.RAW_COLUMNS}
+    valid = ~np.logical_or.reduce([np.isnan(values) for values in raw.values()])
+    count("pixels read", valid.size)
+    if not valid.any():
+        return None
+
+    # Only pixels with every raw input are derived, a chunk at a time to bound memory
+    raw = {name: values[valid] for name, values in raw.items()}
+    n_valid = len(raw["sand"])
+    outputs = {name: np.empty(n_valid, dtype=np.float32) for name in manifest["properties"]}
+    with stage("derive"):
+        for start in range(0, n_valid, DERIVE_CHUNK):
+            chunk = slice(start, start + DERIVE_CHUNK)
+            derived = sm.derive_properties({name: values[chunk] for name, values in raw.items()})
+            for name, output in outputs.items():
+                values = derived[name]
+                output[chunk] = _codes(values, CATEGORIES[name]) if name in CATEGORIES else values
+    count("pixels derived", n_valid)
+
+    for name, values in outputs.items():
+        full = np.full(valid.shape, np.nan, dtype=np.float32)
+        full[valid] = values
+        outputs[name] = full
+    return outputs
+
+
+def _create(path, grid, width, height, bands, transform):
+    return rasterio.open(path, "w", **OUTPUT_PROFILE, width=width, height=height, count=bands,
+                         crs=grid["crs"], transform=transform)
+
+
+def _write_part(path, manifest, partition, outputs):
+    """Every property's depth bands of one partition, in manifest order, as one GeoTIFF."""
+    col_off, row_off, width, height = partition["window"]
+    data = np.concatenate([outputs[name] for name in manifest["properties"]])
+    transform = window_transform(Window(col_off, row_off, width, height), Affine(*manifest["grid"]["transform"]))
+    temporary = _temporary(path)
+    with stage("partition write"):
+        with _create(temporary, manifest["grid"], width, height, len(data), transform) as dst:
+            dst.write(data)
+        os.replace(temporary, path)
+
+
+def _claim(claim_path, worker_id, lease):
+    """Create the claim file for a partition; None if another live worker holds it."""
+    try:
+        if time.time() - os.path.getmtime(claim_path) > lease:
+            os.remove(claim_path)
+            count("stale claims taken over")
+    except FileNotFoundError:
+        pass
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, "w") as f:
+        f.write(worker_id)
+    return claim_path
+
+
+@contextmanager
+def _leased(claim_path, lease):
+    """Renew a claim while its partition is worked on, and release it afterwards, done or not."""
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(lease / 4):
+            try:
+                os.utime(claim_path)
+            except FileNotFoundError:
+                return
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        try:
+            os.remove(claim_path)
+        except FileNotFoundError:
+            pass
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def work(job_dir, worker_id=None, lease=LEASE_SECONDS, wait=False, progress=None):
+    """Claim and process partitions until none is left to claim; returns the ids this worker processed.
+
+    With ``wait``, a worker that finds every remaining partition claimed keeps
+    polling until all are done, so it takes over the claims of workers that
+    stop. ``progress`` gets the fraction of the job's partitions done.
+    """
+    manifest = load_manifest(job_dir)
+    worker_id = worker_id or default_worker_id()
+    for name in (CLAIM_DIR, PART_DIR, DONE_DIR):
+        os.makedirs(os.path.join(job_dir, name), exist_ok=True)
+    partitions = manifest["partitions"]
+
+    def done_path(partition):
+        return os.path.join(job_dir, DONE_DIR, f"{partition['id']}.json")
+
+    processed = []
+    while True:
+        pending = [partition for partition in partitions if not os.path.exists(done_path(partition))]
+        if progress is not None:
+            progress(1 - len(pending) / len(partitions))
+        if not pending:
+            break
+        claimed = False
+        for partition in pending:
+            claim = _claim(os.path.join(job_dir, CLAIM_DIR, partition["id"]), worker_id, lease)
+            if claim is None:
+                continue
+            claimed = True
+            with _leased(claim, lease):
+                # Another worker may have finished it between the listing and the claim
+                if os.path.exists(done_path(partition)):
+                    continue
+                start = time.perf_counter()
+                outputs = derive_partition(manifest, partition)
+                if outputs is not None:
+                    _write_part(os.path.join(job_dir, PART_DIR, f"{partition['id']}.tif"), manifest, partition,
+                                outputs)
+                record = {"worker": worker_id, "seconds": time.perf_counter() - start, "empty": outputs is None,
+                          "finished": time.time()}
+                _write_atomic(done_path(partition), json.dumps(record).encode("utf-8"))
+            processed.append(partition["id"])
+            count("partitions processed")
+        if not claimed:
+            if not wait:
+                break
+            time.sleep(POLL_SECONDS)
+    return processed
+
+
+def status(job_dir, lease=LEASE_SECONDS):
+    """Partition counts by state, plus the live claims' workers."""
+    manifest = load_manifest(job_dir)
+    summary = {"partitions": len(manifest["partitions"]), "done": 0, "empty": 0, "claimed": 0, "stale": 0,
+               "pending": 0, "workers": {}}
+    for partition in manifest["partitions"]:
+        done = os.path.join(job_dir, DONE_DIR, f"{partition['id']}.json")
+        claim = os.path.join(job_dir, CLAIM_DIR, partition["id"])
+        if os.path.exists(done):
+            with open(done) as f:
+                record = json.load(f)
+            summary["done"] += 1
+            summary["empty"] += record["empty"]
+            continue
+        try:
+            age = time.time() - os.path.getmtime(claim)
+            with open(claim) as f:
+                holder = f.read()
+        except FileNotFoundError:
+            summary["pending"] += 1
+            continue
+        if age > lease:
+            summary["stale"] += 1
+        else:
+            summary["claimed"] += 1
+            summary["workers"][holder] = summary["workers"].get(holder, 0) + 1
+    return summary
+
+
+def merge(job_dir, progress=None):
+    """Assemble the parts into one GeoTIFF per property (a band per depth) under JOB_DIR/output; returns their paths."""
+    manifest = load_manifest(job_dir)
+    partitions, layers, properties = manifest["partitions"], manifest["layers"], manifest["properties"]
+    unfinished = [p["id"] for p in partitions if not os.path.exists(os.path.join(job_dir, DONE_DIR, f"{p['id']}.json"))]
+    if unfinished:
+        raise ValueError(f"{len(unfinished)} of {len(partitions)} partitions are not done yet, e.g. {unfinished[0]}")
+
+    output_dir = os.path.join(job_dir, OUTPUT_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, f"{name}.tif") for name in properties}
+    grid = manifest["grid"]
+    datasets = {}
+    try:
+        for name, path in paths.items():
+            dst = datasets[name] = _create(_temporary(path), grid, grid["width"], grid["height"], len(layers),
+                                           Affine(*grid["transform"]))
+            for band, layer in enumerate(layers, start=1):
+                dst.set_band_description(band, layer["depth"] or name)
+            if name in CATEGORIES:
+                dst.update_tags(categories=json.dumps(CATEGORIES[name]))
+
+        with stage("merge"):
+            for done, partition in enumerate(partitions, start=1):
+                part = os.path.join(job_dir, PART_DIR, f"{partition['id']}.tif")
+                # Partitions without data have no part and stay nodata
+                if os.path.exists(part):
+                    with rasterio.open(part) as src:
+                        data = src.read()
+                    window = Window(*partition["window"])
+                    for i, name in enumerate(properties):
+                        datasets[name].write(data[i * len(layers):(i + 1) * len(layers)], window=window)
+                    count("parts merged")
+                if progress is not None:
+                    progress(done / len(partitions))
+    except BaseException:
+        for name, dst in datasets.items():
+            dst.close()
+            os.remove(_temporary(paths[name]))
+        raise
+    for name, dst in datasets.items():
+        dst.close()
+        os.replace(_temporary(paths[name]), paths[name])
+    return list(paths.values())
+
+
+def run_local(job_dir, workers=None, lease=LEASE_SECONDS):
+    """Run ``workers`` independent worker processes on this machine against a planned job, then merge."""
+    host = socket.gethostname()
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "work", job_dir, "--wait",
+                          "--worker-id", f"{host}-local{i}", "--lease", str(lease)])
+        for i in range(worker_count(workers))
+    ]
+    failed = [process.args for process in processes if process.wait() != 0]
+    if failed:
+        raise ValueError(f"{len(failed)} of {len(processes)} workers failed; rerun to resume")
+    return merge(job_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan_parser = commands.add_parser("plan", help="split the raster stack into partitions")
+    plan_parser.add_argument("job_dir")
+    plan_parser.add_argument("--rasters", nargs="+", required=True, help="GeoTIFFs or folders of them")
+    plan_parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    plan_parser.add_argument("--properties", nargs="+", default=DEFAULT_PROPERTIES)
+    work_parser = commands.add_parser("work", help="process partitions until none is left to claim")
+    work_parser.add_argument("job_dir")
+    work_parser.add_argument("--worker-id", default=None)
+    work_parser.add_argument("--wait", action="store_true", help="keep polling until every partition is done")
+    run_parser = commands.add_parser("run", help="run local worker processes, then merge")
+    run_parser.add_argument("job_dir")
+    run_parser.add_argument("--workers", type=int, default=None)
+    for command_parser in (work_parser, run_parser):
+        command_parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help="claim lease in seconds")
+    for command in ("status", "merge"):
+        commands.add_parser(command).add_argument("job_dir")
+    args = parser.parse_args(argv)
+
+    if args.command == "plan":
+        manifest = plan(args.job_dir, raster_paths(args.rasters), args.properties, args.tile_size)
+        print(f"{len(manifest['partitions'])} partitions over {len(manifest['layers'])} depth layers")
+    elif args.command == "work":
+        processed = work(args.job_dir, args.worker_id, args.lease, args.wait)
+        print(f"Processed {len(processed)} partitions")
+    elif args.command == "status":
+        print(json.dumps(status(args.job_dir), indent=2))
+    elif args.command == "merge":
+        print("\n".join(merge(args.job_dir)))
+    else:
+        print("\n".join(run_local(args.job_dir, args.workers, args.lease)))
+
+
+if __name__ == "__main__":
+    main()
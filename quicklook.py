@@ -0,0 +1,114 @@
+"""Quick-look thumbnails and approximate band statistics at a cost independent of raster size.
+
+A band with internal overviews is read at thumbnail size, which GDAL serves
+from the nearest overview. Without overviews, a raster of at most
+``MAX_PIXELS`` pixels is read decimated (``out_shape``) in one call; a larger
+one is sampled instead. A striped raster (blocks as wide as the raster, up to
+a single strip) gives one raster row per thumbnail row. A tiled one splits the
+thumbnail into a grid of cells, and each cell shows the block under its
+centre, read decimated, with only as many blocks as fit in ``MAX_PIXELS``.
+Statistics (min, max, mean, nodata fraction) are taken over whatever pixels
+were read, so they are estimates.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from instrumentation import count, stage
+
+THUMBNAIL_SIZE = 256  # pixels along the longer side
+MAX_PIXELS = 256 * 256 * 256  # pixels decoded per band at most when there are no overviews
+
+
+def thumbnail_shape(height, width, size=THUMBNAIL_SIZE):
+    scale = min(1.0, size / max(height, width))
+    return max(1, round(height * scale)), max(1, round(width * scale))
+
+
+def _sampled_blocks(src, band, shape, max_blocks):
+    """Thumbnail of ``shape`` built from a grid of blocks, one per cell, each read decimated."""
+    block_height, block_width = src.block_shapes[band - 1]
+    grid = max(1, math.isqrt(max_blocks))
+    rows, cols = min(grid, shape[0]), min(grid, shape[1])
+    row_edges = np.linspace(0, shape[0], rows + 1).round().astype(int)
+    col_edges = np.linspace(0, shape[1], cols + 1).round().astype(int)
+    thumbnail = np.ma.masked_all(shape, dtype=src.dtypes[band - 1])
+    for i in range(rows):
+        # Block holding the raster pixel under the cell centre
+        y = int((row_edges[i] + row_edges[i + 1]) / 2 / shape[0] * src.height)
+        row_off = y // block_height * block_height
+        for j in range(cols):
+            x = int((col_edges[j] + col_edges[j + 1]) / 2 / shape[1] * src.width)
+            col_off = x // block_width * block_width
+            window = Window(col_off, row_off, min(block_width, src.width - col_off),
+                            min(block_height, src.height - row_off))
+            cell = (row_edges[i + 1] - row_edges[i], col_edges[j + 1] - col_edges[j])
+            thumbnail[row_edges[i]:row_edges[i + 1], col_edges[j]:col_edges[j + 1]] = src.read(
+                band, window=window, out_shape=cell, masked=True, resampling=Resampling.nearest)
+    count("blocks sampled", rows * cols)
+    return thumbnail
+
+
+def _sampled_rows(src, band, shape):
+    """Thumbnail of ``shape`` built from the raster row under each thumbnail row, each read decimated."""
+    thumbnail = np.ma.masked_all(shape, dtype=src.dtypes[band - 1])
+    for i in range(shape[0]):
+        y = int((i + 0.5) / shape[0] * src.height)
+        thumbnail[i] = src.read(band, window=Window(0, y, src.width, 1), out_shape=(1, shape[1]), masked=True,
+                                resampling=Resampling.nearest)[0]
+    count("rows sampled", shape[0])
+    return thumbnail
+
+
+def band_preview(src, band, size=THUMBNAIL_SIZE, max_pixels=MAX_PIXELS):
+    """(thumbnail as a masked array, how it was read) for one band of an open dataset."""
+    shape = thumbnail_shape(src.height, src.width, size)
+    block_height, block_width = src.block_shapes[band - 1]
+    with stage("preview read"):
+        if src.overviews(band):
+            source = "overview"
+        elif src.height * src.width <= max_pixels:
+            source = "decimated read"
+        elif block_width >= src.width:
+            return _sampled_rows(src, band, shape), "sampled rows"
+        else:
+            max_blocks = max(1, max_pixels // (block_height * block_width))
+            return _sampled_blocks(src, band, shape, max_blocks), "sampled blocks"
+        return src.read(band, out_shape=shape, masked=True, resampling=Resampling.nearest), source
+
+
+def preview_stats(thumbnail):
+    """Approximate min, max, mean and nodata fraction from a masked thumbnail."""
+    valid = thumbnail.compressed().astype(float)
+    return {
+        "Min": valid.min() if valid.size else np.nan,
+        "Max": valid.max() if valid.size else np.nan,
+        "Mean": valid.mean() if valid.size else np.nan,
+        "Nodata Fraction": 1 - valid.size / thumbnail.size,
+        "Pixels Sampled": thumbnail.size,
+    }
+
+
+def to_image(thumbnail):
+    """8-bit grey RGBA image of a thumbnail, stretched over its 2nd-98th percentiles; nodata is transparent."""
+    valid = thumbnail.compressed().astype(float)
+    low, high = np.percentile(valid, [2, 98]) if valid.size else (0.0, 1.0)
+    scaled = (thumbnail.filled(low).astype(float) - low) / ((high - low) or 1.0)
+    grey = (np.clip(scaled, 0, 1) * 255).astype(np.uint8)
+    alpha = np.where(np.ma.getmaskarray(thumbnail), 0, 255).astype(np.uint8)
+    return np.dstack([grey, grey, grey, alpha])
+
+
+def quicklook(src, size=THUMBNAIL_SIZE, max_pixels=MAX_PIXELS):
+    """Thumbnails (band name -> RGBA image) and a statistics frame for every band of an open dataset."""
+    images, rows = {}, []
+    for band in range(1, src.count + 1):
+        name = src.descriptions[band - 1] or f"Band {band}"
+        thumbnail, source = band_preview(src, band, size, max_pixels)
+        images[name] = to_image(thumbnail)
+        rows.append({"Band": name, **preview_stats(thumbnail), "Source": source})
+    count("bands previewed", src.count)
+    return images, pd.DataFrame(rows)
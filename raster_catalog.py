@@ -0,0 +1,203 @@
+"""Persisted footprint index over a set of rasters.
+
+Each entry holds the header metadata 1.py's check_tiff_files shows (CRS, EPSG,
+resolution) plus the raster's WGS84 footprint. Footprints are bucketed in a
+regular lon/lat grid, so routing points to the rasters covering them is a few
+array operations regardless of how many points or rasters there are.
+"""
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.crs import CRS
+from rasterio.warp import transform_bounds
+
+from instrumentation import count, stage
+
+CATALOG_FILE = "raster_catalog.json"
+CATALOG_VERSION = 1
+CELLS_PER_RASTER = 4  # about the most grid cells per catalogued raster
+
+
+def read_entry(path):
+    """Header metadata and WGS84 footprint of one raster."""
+    with rasterio.open(path) as src:
+        crs = src.crs
+        if crs is None or crs == CRS.from_epsg(4326):
+            footprint = tuple(src.bounds)
+        else:
+            footprint = transform_bounds(crs, CRS.from_epsg(4326), *src.bounds, densify_pts=21)
+        stat = os.stat(path)
+        return {
+            "path": os.path.abspath(path),
+            "name": os.path.basename(path),
+            "crs": str(crs),
+            "epsg": crs.to_epsg() if crs else None,
+            "resolution": list(src.res),
+            "width": src.width,
+            "height": src.height,
+            "count": src.count,
+            "bands": [name or f"Band_{i + 1}" for i, name in enumerate(src.descriptions)],
+            "bounds": list(src.bounds),
+            "footprint": list(footprint),
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+        }
+
+
+class RasterCatalog:
+    """Raster footprints with a grid index for point routing."""
+
+    def __init__(self, entries, cell_size=None):
+        self.entries = list(entries)
+        self._build_index(cell_size)
+
+    @property
+    def paths(self):
+        return [entry["path"] for entry in self.entries]
+
+    @classmethod
+    def build(cls, paths, previous=None):
+        """Index ``paths``, reusing entries of ``previous`` whose file is unchanged."""
+        known = {entry["path"]: entry for entry in (previous.entries if previous else [])}
+        entries = []
+        with stage("catalog build"):
+            for path in paths:
+                path = os.path.abspath(path)
+                entry = known.get(path)
+                stat = os.stat(path)
+                if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+                    entry = read_entry(path)
+                    count("raster headers read")
+                else:
+                    count("catalog cache hits")
+                entries.append(entry)
+        return cls(entries)
+
+    @classmethod
+    def load(cls, catalog_path):
+        with open(catalog_path) as f:
+            data = json.load(f)
+        if data.get("version") != CATALOG_VERSION:
+            raise ValueError(f"Unsupported raster catalog version in {catalog_path}")
+        return cls(data["entries"])
+
+    def save(self, catalog_path):
+        with open(catalog_path, "w") as f:
+            json.dump({"version": CATALOG_VERSION, "entries": self.entries}, f, indent=1)
+
+    @classmethod
+    def for_folder(cls, folder, pattern="*.tif*"):
+        """Load the folder's saved catalog, refresh it against the files present and save it back."""
+        catalog_path = os.path.join(folder, CATALOG_FILE)
+        previous = cls.load(catalog_path) if os.path.exists(catalog_path) else None
+        catalog = cls.build(sorted(glob.glob(os.path.join(folder, pattern))), previous)
+        catalog.save(catalog_path)
+        return catalog
+
+    def to_frame(self):
+        """Catalog table in the layout of 1.py's metadata table, plus footprints."""
+        return pd.DataFrame([
+            {
+                "File Name": e["name"], "CRS": e["crs"], "EPSG": e["epsg"] or "Unknown",
+                "Resolution": tuple(e["resolution"]), "Bands": e["count"],
+                "West": e["footprint"][0], "South": e["footprint"][1],
+                "East": e["footprint"][2], "North": e["footprint"][3],
+            }
+            for e in self.entries
+        ])
+
+    def _build_index(self, cell_size):
+        """Bucket footprints into grid cells, stored CSR-style (cell -> raster ids)."""
+        self.footprints = np.array([e["footprint"] for e in self.entries], dtype=float).reshape(-1, 4)
+        if len(self.entries) == 0:
+            self.origin, self.cell_size, self.shape = (0.0, 0.0), 1.0, (0, 0)
+            self.cell_offsets = np.zeros(1, dtype=np.int64)
+            self.cell_rasters = np.zeros(0, dtype=np.int64)
+            return
+
+        west, south = self.footprints[:, 0].min(), self.footprints[:, 1].min()
+        east, north = self.footprints[:, 2].max(), self.footprints[:, 3].max()
+        if cell_size is None:
+            # About one footprint per cell keeps candidate lists short
+            spans = np.maximum(self.footprints[:, 2] - self.footprints[:, 0],
+                               self.footprints[:, 3] - self.footprints[:, 1])
+            cell_size = float(np.median(spans)) or 1.0
+        # A few tiny footprints far apart must not make a grid of millions of mostly empty cells
+        extent = max(east - west, north - south)
+        cell_size = max(cell_size, float(extent / np.sqrt(CELLS_PER_RASTER * len(self.entries))))
+        nx = max(1, int(np.ceil((east - west) / cell_size)))
+        ny = max(1, int(np.ceil((north - south) / cell_size)))
+        self.origin, self.cell_size, self.shape = (west, south), cell_size, (ny, nx)
+
+        cells, rasters = [], []
+        for raster_id, (w, s, e, n) in enumerate(self.footprints):
+            ix0, iy0 = self._cell_coords(w, s)
+            # An east/north edge lying exactly on a cell boundary does not reach into the next cell
+            ix1, iy1 = self._cell_coords(np.nextafter(e, w), np.nextafter(n, s))
+            iy, ix = np.mgrid[iy0:iy1 + 1, ix0:ix1 + 1]
+            cells.append((iy * nx + ix).ravel())
+            rasters.append(np.full(iy.size, raster_id))
+        cells, rasters = np.concatenate(cells), np.concatenate(rasters)
+
+        # Stable sort keeps catalog order inside each cell
+        order = np.argsort(cells, kind="stable")
+        self.cell_rasters = rasters[order]
+        self.cell_offsets = np.zeros(nx * ny + 1, dtype=np.int64)
+        np.add.at(self.cell_offsets, cells + 1, 1)
+        self.cell_offsets = np.cumsum(self.cell_offsets)
+
+    def _cell_coords(self, lon, lat):
+        ny, nx = self.shape
+        ix = np.clip(np.floor((np.asarray(lon) - self.origin[0]) / self.cell_size), 0, nx - 1).astype(np.int64)
+        iy = np.clip(np.floor((np.asarray(lat) - self.origin[1]) / self.cell_size), 0, ny - 1).astype(np.int64)
+        return ix, iy
+
+    def candidates(self, lon, lat):
+        """All (point index, raster id) pairs whose footprint contains the point."""
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        if len(self.entries) == 0 or lon.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        # NaN/inf coordinates lie in no footprint: look them up at the origin, with no candidates
+        finite = np.isfinite(lon) & np.isfinite(lat)
+        ix, iy = self._cell_coords(np.where(finite, lon, self.origin[0]), np.where(finite, lat, self.origin[1]))
+        cell = iy * self.shape[1] + ix
+        starts = self.cell_offsets[cell]
+        lengths = np.where(finite, self.cell_offsets[cell + 1] - starts, 0)
+
+        # Expand every point into one row per raster registered in its cell
+        point_idx = np.repeat(np.arange(lon.size), lengths)
+        within = np.arange(point_idx.size) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        raster_idx = self.cell_rasters[np.repeat(starts, lengths) + within]
+
+        west, south, east, north = self.footprints.T
+        plon, plat = lon[point_idx], lat[point_idx]
+        inside = ((plon >= west[raster_idx]) & (plon <= east[raster_idx])
+                  & (plat >= south[raster_idx]) & (plat <= north[raster_idx]))
+        return point_idx[inside], raster_idx[inside]
+
+    def route(self, lon, lat):
+        """Map each covering raster path to the indices of the points inside its footprint."""
+        with stage("catalog routing"):
+            point_idx, raster_idx = self.candidates(lon, lat)
+            order = np.argsort(raster_idx, kind="stable")
+            point_idx, raster_idx = point_idx[order], raster_idx[order]
+            bounds = np.searchsorted(raster_idx, np.arange(len(self.entries) + 1))
+            routed = {
+                self.entries[r]["path"]: point_idx[bounds[r]:bounds[r + 1]]
+                for r in range(len(self.entries)) if bounds[r + 1] > bounds[r]
+            }
+        routed_mask = np.zeros(len(lon), dtype=bool)
+        routed_mask[point_idx] = True
+        count("points routed", int(routed_mask.sum()))
+        return routed
+
+    def query_point(self, lon, lat):
+        """Paths of the rasters covering a single point, in catalog order."""
+        _, raster_idx = self.candidates([lon], [lat])
+        return [self.entries[r]["path"] for r in raster_idx]
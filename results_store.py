@@ -0,0 +1,375 @@
+"""Local columnar store for tool results, partitioned by site and run.
+
+Every append writes one new Parquet file, ``<root>/site=<site>/run=<run>.parquet``,
+with rows sorted by texture class, cohesiveness and latitude. A JSON index
+records per file the row span of every (texture, cohesiveness) segment, the
+Longitude/Latitude bounding box and the min/max of every numeric column.
+Queries skip files through the index, pick the matching segments by row span,
+binary-search latitude inside each segment and only then test the remaining
+conditions on the surviving rows. Stored files never change, so the columns
+a query touches are read once (memory-mapped) and kept by the store, least
+recently used first out past COLUMN_CACHE_BYTES. Site, Run and Tool columns
+are added by the store; a frame's own columns of those names are stored as
+Site_input, Run_input and Tool_input.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+from export import scalar_columns
+from instrumentation import count, stage
+
+STORE_DIR = "results_store"
+INDEX_FILE = "_index.json"
+LOCK_FILE = "_index.lock"
+LOCK_TIMEOUT = 30  # seconds after which a leftover lock file is taken as stale
+INDEX_VERSION = 2
+METADATA_KEY = b"soil_results"
+ROW_GROUP_SIZE = 64 * 1024
+SORT_COLUMNS = ["Soil_Texture", "Cohesiveness", "Latitude"]
+AGGREGATIONS = ["mean", "min", "max", "sum", "count", "stddev"]
+STORE_COLUMNS = ["Site", "Run", "Tool"]  # added to every stored row
+COLUMN_CACHE_BYTES = 512 * 1024 * 1024  # loaded columns kept across queries
+
+_OPERATORS = {
+    "<": lambda f, v: f < v, "<=": lambda f, v: f <= v, ">": lambda f, v: f > v,
+    ">=": lambda f, v: f >= v, "==": lambda f, v: f == v, "!=": lambda f, v: f != v,
+}
+# Whether a file whose column spans [low, high] can hold a row passing the condition
+_MAY_MATCH = {
+    "<": lambda low, high, v: low < v, "<=": lambda low, high, v: low <= v,
+    ">": lambda low, high, v: high > v, ">=": lambda low, high, v: high >= v,
+    "==": lambda low, high, v: low <= v <= high, "!=": lambda low, high, v: True,
+}
+
+# One writer at a time updates the index: threads through this lock, processes (each tool
+# is its own Streamlit server) through a lock file created exclusively
+_index_lock = threading.Lock()
+
+
+@contextmanager
+def _locked(root):
+    path = os.path.join(root, LOCK_FILE)
+    with _index_lock:
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > LOCK_TIMEOUT:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.remove(path)
+
+
+def _partition_name(value):
+    """Directory-safe name for ``value``.
+
+    A name that had to be changed gets a short hash of the original, so
+    different values (e.g. "Site A" and "Site_A") never share a partition.
+    """
+    value = str(value)
+    name = re.sub(r"[^\w.-]+", "_", value) or "_"
+    if name == value:
+        return name
+    return f"{name}-{hashlib.sha1(value.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _segments(df):
+    """[texture, cohesiveness, start, stop] for each run of equal keys in a frame sorted by SORT_COLUMNS."""
+    keys = [df[c].astype(object).where(df[c].notna(), None).to_numpy() if c in df else np.full(len(df), None)
+            for c in SORT_COLUMNS[:2]]
+    if not len(df):
+        return []
+    changed = np.zeros(len(df), dtype=bool)
+    changed[0] = True
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(changed).tolist()
+    stops = starts[1:] + [len(df)]
+    return [[keys[0][s], keys[1][s], s, e] for s, e in zip(starts, stops)]
+
+
+def _decoded(table):
+    """``table`` with dictionary-encoded columns turned back into plain ones."""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(field.type.value_type))
+    return table
+
+
+def _file_entry(df, path, site, run, tool):
+    """Index entry for one stored frame: identity plus what queries prune on."""
+    entry = {
+        "path": path, "site": site, "run": run, "tool": tool,
+        "created": datetime.now(timezone.utc).isoformat(), "rows": len(df),
+        "columns": [str(c) for c in df.columns], "textures": [], "cohesiveness": [], "bbox": None, "ranges": {},
+        "segments": _segments(df),
+    }
+    if "Soil_Texture" in df:
+        entry["textures"] = sorted(df["Soil_Texture"].dropna().astype(str).unique().tolist())
+    if "Cohesiveness" in df:
+        entry["cohesiveness"] = sorted(df["Cohesiveness"].dropna().astype(str).unique().tolist())
+    if {"Longitude", "Latitude"}.issubset(df.columns) and df["Longitude"].notna().any():
+        entry["bbox"] = [float(df["Longitude"].min()), float(df["Latitude"].min()),
+                         float(df["Longitude"].max()), float(df["Latitude"].max())]
+    for column in df.columns:
+        if pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column]) and df[column].notna().any():
+            entry["ranges"][str(column)] = [float(df[column].min()), float(df[column].max())]
+    return entry
+
+
+class ResultsStore:
+    """Append-only Parquet results with a pruning index."""
+
+    def __init__(self, root=STORE_DIR, max_cache_bytes=COLUMN_CACHE_BYTES):
+        self.root = root
+        self.max_cache_bytes = max_cache_bytes
+        os.makedirs(root, exist_ok=True)
+        self.entries = self._load_index()
+        self._columns = OrderedDict()
+        self._cached_bytes = 0
+
+    @property
+    def index_path(self):
+        return os.path.join(self.root, INDEX_FILE)
+
+    def _load_index(self):
+        self._index_mtime = os.path.getmtime(self.index_path) if os.path.exists(self.index_path) else None
+        if self._index_mtime is None:
+            return []
+        with open(self.index_path) as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported results store version in {self.index_path}")
+        return data["entries"]
+
+    def _save_index(self):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": INDEX_VERSION, "entries": self.entries}, f)
+        os.replace(temp_path, self.index_path)  # Readers never see a half-written index
+        self._index_mtime = os.path.getmtime(self.index_path)
+
+    def append(self, df, site, run, tool):
+        """Store ``df`` as the results of ``run`` for ``site``; returns the file's index entry."""
+        df = scalar_columns(df)
+        # Object columns holding only numbers and missing values are stored as numbers
+        for column in df.columns[df.dtypes == object]:
+            converted = pd.to_numeric(df[column], errors="coerce")
+            if converted.notna().sum() == df[column].notna().sum():
+                df[column] = converted
+        sort_by = [c for c in SORT_COLUMNS if c in df]
+        if sort_by:
+            df = df.sort_values(sort_by, kind="stable")
+        df = df.reset_index(drop=True).rename(columns={c: f"{c}_input" for c in STORE_COLUMNS})
+        df = df.assign(Site=str(site), Run=str(run), Tool=str(tool))
+
+        path = os.path.join(f"site={_partition_name(site)}", f"run={_partition_name(run)}.parquet")
+        entry = _file_entry(df, path, str(site), str(run), str(tool))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), METADATA_KEY: json.dumps(entry)})
+        with stage("results store write"):
+            os.makedirs(os.path.join(self.root, os.path.dirname(path)), exist_ok=True)
+            pq.write_table(table, os.path.join(self.root, path), row_group_size=ROW_GROUP_SIZE, compression="zstd")
+            with _locked(self.root):
+                self.entries = [e for e in self._load_index() if e["path"] != path] + [entry]
+                self._save_index()
+        count("rows stored", len(df))
+        return entry
+
+    def refresh(self):
+        """Pick up files appended by other processes; cached columns of replaced files are dropped."""
+        mtime = os.path.getmtime(self.index_path) if os.path.exists(self.index_path) else None
+        if mtime == self._index_mtime:
+            return
+        self.entries = self._load_index()
+        current = {(e["path"], e["created"]) for e in self.entries}
+        for key in [key for key in self._columns if key[:2] not in current]:
+            self._cached_bytes -= self._columns.pop(key).nbytes
+
+    def reindex(self):
+        """Rebuild the index from the entries embedded in the stored files."""
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in sorted(files):
+                if name.endswith(".parquet"):
+                    metadata = pq.read_schema(os.path.join(directory, name)).metadata or {}
+                    if METADATA_KEY in metadata:
+                        entries.append(json.loads(metadata[METADATA_KEY]))
+        with _locked(self.root):
+            self.entries = entries
+            self._save_index()
+
+    def runs(self):
+        """One row per stored file: site, run, tool, creation time and row count."""
+        return pd.DataFrame(self.entries, columns=["site", "run", "tool", "created", "rows"])
+
+    def values(self, key):
+        """Distinct index values of ``key`` ("textures", "cohesiveness" or "site") across the store."""
+        found = set()
+        for entry in self.entries:
+            found.update(entry[key] if isinstance(entry[key], list) else [entry[key]])
+        return sorted(found)
+
+    def _matching_entries(self, textures, cohesiveness, bbox, where, sites, runs, tool):
+        for entry in self.entries:
+            if sites and entry["site"] not in sites or runs and entry["run"] not in runs:
+                continue
+            if tool and entry["tool"] != tool:
+                continue
+            if textures and not set(textures) & set(entry["textures"]):
+                continue
+            if cohesiveness and not set(cohesiveness) & set(entry["cohesiveness"]):
+                continue
+            if bbox is not None:
+                if entry["bbox"] is None:
+                    continue
+                w, s, e, n = entry["bbox"]
+                if w > bbox[2] or e < bbox[0] or s > bbox[3] or n < bbox[1]:
+                    continue
+            if any(column not in entry["columns"]
+                   or column in entry["ranges"] and not _MAY_MATCH[op](*entry["ranges"][column], value)
+                   for column, op, value in where):
+                continue
+            yield entry
+
+    def _column(self, entry, column):
+        """One column of a stored file as a pyarrow Array, read on first use.
+
+        Text columns are kept dictionary-encoded: far smaller, and grouping on them is much faster.
+        """
+        key = (entry["path"], entry["created"], column)
+        array = self._cached(key)
+        if array is None:
+            table = pq.read_table(os.path.join(self.root, entry["path"]), columns=[column], memory_map=True,
+                                  read_dictionary=[column])
+            array = self._cache(key, table.column(0).combine_chunks())
+            count("store columns loaded")
+        return array
+
+    def _array(self, entry, column):
+        key = (entry["path"], entry["created"], column, "numpy")
+        array = self._cached(key)
+        if array is None:
+            array = self._column(entry, column)
+            if pa.types.is_dictionary(array.type):
+                array = array.dictionary_decode()
+            array = self._cache(key, array.to_numpy(zero_copy_only=False))
+        return array
+
+    def _cached(self, key):
+        array = self._columns.get(key)
+        if array is not None:
+            self._columns.move_to_end(key)
+        return array
+
+    def _cache(self, key, array):
+        """Keep ``array`` under ``key``, dropping the least recently used columns past max_cache_bytes."""
+        self._columns[key] = array
+        self._cached_bytes += array.nbytes
+        while self._cached_bytes > self.max_cache_bytes and len(self._columns) > 1:
+            _, evicted = self._columns.popitem(last=False)
+            self._cached_bytes -= evicted.nbytes
+        return array
+
+    def _matching_rows(self, entry, textures, cohesiveness, bbox, where):
+        """Row numbers of one stored file passing every filter."""
+        spans = [(start, stop) for texture, cohesive, start, stop in entry["segments"]
+                 if (not textures or texture in textures) and (not cohesiveness or cohesive in cohesiveness)]
+        if bbox is not None:
+            # Latitude is sorted inside each segment (NaN last)
+            latitude = self._array(entry, "Latitude")
+            spans = [(start + np.searchsorted(latitude[start:stop], bbox[1], "left"),
+                      start + np.searchsorted(latitude[start:stop], bbox[3], "right")) for start, stop in spans]
+        rows = np.concatenate([np.arange(start, stop) for start, stop in spans] or [np.array([], dtype=np.int64)])
+        conditions = list(where)
+        if bbox is not None:
+            conditions += [("Longitude", ">=", bbox[0]), ("Longitude", "<=", bbox[2])]
+        for column, op, value in conditions:
+            if not len(rows):
+                break
+            rows = rows[_OPERATORS[op](self._array(entry, column)[rows], value)]
+        return rows
+
+    def scan(self, textures=None, cohesiveness=None, bbox=None, where=(), sites=None, runs=None, tool=None,
+             columns=None, limit=None):
+        """Rows matching every filter as a pyarrow Table, at most ``limit`` of them.
+
+        ``bbox`` is (west, south, east, north) in degrees; ``where`` is a list
+        of (column, operator, value) with operators <, <=, >, >=, ==, !=.
+        """
+        self.refresh()
+        with stage("results store query"):
+            entries = list(self._matching_entries(textures, cohesiveness, bbox, where, sites, runs, tool))
+            count("store files scanned", len(entries))
+            tables = []
+            for entry in entries:
+                if limit is not None and limit <= sum(t.num_rows for t in tables):
+                    break
+                rows = self._matching_rows(entry, textures, cohesiveness, bbox, where)
+                if limit is not None:
+                    rows = rows[:limit - sum(t.num_rows for t in tables)]
+                if len(rows):
+                    names = [c for c in columns if c in entry["columns"]] if columns else entry["columns"]
+                    if len(rows) == entry["rows"]:  # Rows come back in file order, so this is the whole file
+                        tables.append(pa.table({c: self._column(entry, c) for c in names}))
+                    else:
+                        indices = pa.array(rows)
+                        tables.append(pa.table({c: self._column(entry, c).take(indices) for c in names}))
+            if not tables:
+                return pa.table({c: pa.array([], pa.null()) for c in columns or []})
+            table = pa.concat_tables(tables, promote_options="permissive")
+        count("rows matched", table.num_rows)
+        return table
+
+    def count_rows(self, textures=None, cohesiveness=None, bbox=None, where=(), sites=None, runs=None, tool=None):
+        """Number of rows matching the filters of ``scan``, without gathering them."""
+        self.refresh()
+        with stage("results store query"):
+            entries = self._matching_entries(textures, cohesiveness, bbox, where, sites, runs, tool)
+            return sum(len(self._matching_rows(e, textures, cohesiveness, bbox, where)) for e in entries)
+
+    def query(self, **filters):
+        """Matching rows as a DataFrame; takes the filters of ``scan``."""
+        return _decoded(self.scan(**filters)).to_pandas()
+
+    def aggregate(self, by, values, aggregations=("mean", "min", "max", "count"), **filters):
+        """Group matching rows by ``by`` and aggregate ``values`` columns, e.g. mean Adjusted_Cohesion per texture."""
+        table = self.scan(columns=list(dict.fromkeys(list(by) + list(values))), **filters)
+        if table.num_rows == 0:
+            return pd.DataFrame(columns=list(by) + [f"{v}_{a}" for v in values for a in aggregations])
+        with stage("results store aggregation"):
+            result = table.unify_dictionaries().group_by(list(by)).aggregate([(v, a) for v in values for a in aggregations])
+        return _decoded(result).to_pandas().sort_values(list(by)).reset_index(drop=True)
+
+
+@st.cache_resource
+def shared_store(root=STORE_DIR):
+    """One ResultsStore per server, so cached columns survive reruns and sessions."""
+    return ResultsStore(root)
+
+
+def store_option(key="results_store"):
+    """Sidebar switch for saving this tool's results; returns a ResultsStore or None."""
+    if st.sidebar.checkbox("Save results to the local results store", value=False, key=key):
+        return shared_store()
+    return None
@@ -0,0 +1,162 @@
+"""Batched point sampling from rasters: nearest, bilinear and k x k window modes.
+
+Points are grouped by the raster block holding their centre pixel and each
+group is served by a single windowed read, padded by the few pixels its
+neighbourhood needs. Nodata pixels and pixels outside the raster never
+contribute; a point with no valid contributing pixel comes back as NaN.
+"""
+import numpy as np
+from rasterio.windows import Window
+
+from instrumentation import count, stage
+
+SAMPLING_MODES = ["nearest", "bilinear", "window mean", "window median"]
+
+
+def pixel_coords(src, xs, ys):
+    """Fractional (row, col) of map coordinates in the raster's pixel grid."""
+    cols, rows = ~src.transform * (np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+    return np.asarray(rows), np.asarray(cols)
+
+
+def block_groups(src, row_f, col_f):
+    """Split point indices by the block containing their centre pixel; points off the raster are left out."""
+    rows, cols = np.floor(row_f), np.floor(col_f)
+    inside = np.flatnonzero((rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width))
+    if inside.size == 0:
+        return []
+    block_height, block_width = src.block_shapes[0]
+    blocks_across = -(-src.width // block_width)
+    block_ids = (rows[inside] // block_height).astype(np.int64) * blocks_across + (cols[inside] // block_width).astype(np.int64)
+    order = np.argsort(block_ids, kind="stable")
+    inside, block_ids = inside[order], block_ids[order]
+    return np.split(inside, np.flatnonzero(block_ids[1:] != block_ids[:-1]) + 1)
+
+
+def _neighbourhood(row_f, col_f, mode, window_size):
+    """Pixel rows/cols (n, m) each point reads, with their interpolation weights."""
+    if mode == "bilinear":
+        # Weights are measured between pixel centres, which sit at +0.5
+        v, u = row_f - 0.5, col_f - 0.5
+        r0, c0 = np.floor(v), np.floor(u)
+        fy, fx = v - r0, u - c0
+        rows = np.stack([r0, r0, r0 + 1, r0 + 1], axis=1)
+        cols = np.stack([c0, c0 + 1, c0, c0 + 1], axis=1)
+        weights = np.stack([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx], axis=1)
+        return rows.astype(np.int64), cols.astype(np.int64), weights
+
+    centre_rows = np.floor(row_f).astype(np.int64)[:, None]
+    centre_cols = np.floor(col_f).astype(np.int64)[:, None]
+    if mode == "nearest":
+        return centre_rows, centre_cols, None
+    if mode in ("window mean", "window median"):
+        half = window_size // 2
+        dr, dc = np.mgrid[-half:half + 1, -half:half + 1]
+        return centre_rows + dr.ravel(), centre_cols + dc.ravel(), None
+    raise ValueError(f"Unknown sampling mode: {mode}")
+
+
+def sample_window(src, row_f, col_f, mode="nearest", window_size=3):
+    """Sample all bands for points that share one block, using a single windowed read.
+
+    Returns a float array of shape (bands, n).
+    """
+    rows, cols, weights = _neighbourhood(row_f, col_f, mode, window_size)
+
+    row_off = max(0, int(rows.min()))
+    col_off = max(0, int(cols.min()))
+    row_end = min(src.height, int(rows.max()) + 1)
+    col_end = min(src.width, int(cols.max()) + 1)
+    data = src.read(window=Window(col_off, row_off, col_end - col_off, row_end - row_off)).astype(float)
+    block_height, block_width = src.block_shapes[0]
+    blocks_down = (row_end - 1) // block_height - row_off // block_height + 1
+    blocks_across = (col_end - 1) // block_width - col_off // block_width + 1
+    count("tiles decoded", src.count * blocks_down * blocks_across)
+    count("raster bytes decoded", data.size * np.dtype(src.dtypes[0]).itemsize)
+
+    for band, nodata in enumerate(src.nodatavals):
+        if nodata is not None:
+            data[band][data[band] == nodata] = np.nan
+
+    on_raster = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+    local_rows = np.clip(rows - row_off, 0, data.shape[1] - 1)
+    local_cols = np.clip(cols - col_off, 0, data.shape[2] - 1)
+    values = data[:, local_rows, local_cols]  # (bands, n, m)
+    values[:, ~on_raster] = np.nan
+    return _reduce(values, weights, mode)
+
+
+def _reduce(values, weights, mode):
+    """Combine each point's (bands, n, m) neighbourhood values into (bands, n)."""
+    if mode == "nearest":
+        return values[:, :, 0]
+    if mode == "bilinear":
+        # Renormalise over the neighbours that hold data
+        valid = ~np.isnan(values)
+        w = np.where(valid, weights[None, :, :], 0.0)
+        total = w.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, np.nansum(values * w, axis=2) / total, np.nan)
+
+    all_missing = np.isnan(values).all(axis=2)
+    filled = np.where(all_missing[:, :, None], 0.0, values)  # avoids all-NaN slice warnings
+    reduced = np.nanmean(filled, axis=2) if mode == "window mean" else np.nanmedian(filled, axis=2)
+    return np.where(all_missing, np.nan, reduced)
+
+
+def read_block(src, block_row, block_col):
+    """One block of every band as float, with nodata as NaN."""
+    block_height, block_width = src.block_shapes[0]
+    window = Window(block_col * block_width, block_row * block_height, block_width, block_height)
+    data = src.read(window=window.intersection(Window(0, 0, src.width, src.height))).astype(float)
+    for band, nodata in enumerate(src.nodatavals):
+        if nodata is not None:
+            data[band][data[band] == nodata] = np.nan
+    count("tiles decoded", src.count)
+    return data
+
+
+def sample_blocks(src, row_f, col_f, get_block, mode="nearest", window_size=3):
+    """Sample all bands at fractional pixel positions anywhere on the raster, pixels coming from ``get_block``.
+
+    ``get_block(block_row, block_col)`` returns what read_block does, typically
+    from a cache, so points spread thinly over many blocks cost a few array
+    operations per block instead of a read each. Returns (bands, n) like sample_window.
+    """
+    rows, cols, weights = _neighbourhood(row_f, col_f, mode, window_size)
+    block_height, block_width = src.block_shapes[0]
+    blocks_across = -(-src.width // block_width)
+    values = np.full((src.count,) + rows.shape, np.nan)
+
+    on_raster = np.flatnonzero(((rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)).ravel())
+    flat_rows, flat_cols = rows.ravel()[on_raster], cols.ravel()[on_raster]
+    block_ids = flat_rows // block_height * blocks_across + flat_cols // block_width
+    order = np.argsort(block_ids, kind="stable")
+    starts = np.flatnonzero(np.r_[True, block_ids[order][1:] != block_ids[order][:-1]])
+    flat_values = values.reshape(src.count, -1)
+    for group in np.split(order, starts[1:]) if on_raster.size else []:
+        block_row, block_col = divmod(int(block_ids[group[0]]), blocks_across)
+        block = get_block(block_row, block_col)
+        flat_values[:, on_raster[group]] = block[:, flat_rows[group] - block_row * block_height,
+                                                 flat_cols[group] - block_col * block_width]
+    return _reduce(values, weights, mode)
+
+
+def sample_points(src, xs, ys, mode="nearest", window_size=3, progress=None):
+    """Sample every band at map coordinates ``xs``/``ys`` (in the raster's CRS).
+
+    Returns a float array of shape (bands, n); ``progress`` is called with the
+    fraction of points done after each block.
+    """
+    row_f, col_f = pixel_coords(src, xs, ys)
+    result = np.full((src.count, row_f.size), np.nan)
+    groups = block_groups(src, row_f, col_f)
+    done = 0
+    with stage("raster read"):
+        for idx in groups:
+            result[:, idx] = sample_window(src, row_f[idx], col_f[idx], mode, window_size)
+            done += idx.size
+            if progress is not None:
+                progress(done / row_f.size)
+    count("points sampled", row_f.size)
+    return result
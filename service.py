@@ -0,0 +1,297 @@
+"""Local HTTP service for point extraction and soil processing.
+
+    python service.py --rasters /data/soilgrids --port 8765
+
+Endpoints (JSON in, JSON out; missing values come back as null):
+
+    GET  /health    status and request/batch counters
+    GET  /rasters   the raster catalog entries (path, bands, footprint, ...)
+    POST /extract   {"points": [{"Longitude": 14.2, "Latitude": 44.5, ...}, ...],
+                     "mode": "nearest", "window_size": 3, "derive": false}
+                    -> the points with one field per band; with "derive" and
+                    bands named like the raw SoilGrids columns, also every
+                    property process_soil_data in 4.py derives
+    POST /soil      {"rows": [{"bulk_density": 140, "clay_content": 250, ...}, ...]}
+                    -> the rows with the derived properties
+
+Raster datasets stay open in a RasterPool for the life of the server, along
+with their CRS handling and an LRU cache of decoded blocks, so a warm request
+is a few array lookups per block it touches rather than a windowed read per
+point group. All reads happen on one batching thread: whatever extraction
+requests arrived while it was busy are merged, and each (mode, window size)
+group is served by a single routing and sampling pass.
+"""
+import argparse
+import json
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.crs import CRS
+from rasterio.warp import transform
+
+import soil_model as sm
+from raster_catalog import RasterCatalog
+from instrumentation import count
+from sampling import SAMPLING_MODES, pixel_coords, read_block, sample_blocks
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BATCH_POINTS = 200_000  # points merged into one read pass at most
+TILE_CACHE_BYTES = 1024 * 1024 * 1024  # decoded blocks kept across requests
+
+
+class TileCache:
+    """Least-recently-used decoded raster blocks, keyed by (path, block row, block col)."""
+
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self._blocks = OrderedDict()
+
+    def get(self, src, block_row, block_col):
+        key = (src.name, block_row, block_col)
+        block = self._blocks.get(key)
+        if block is not None:
+            self._blocks.move_to_end(key)
+            self.hits += 1
+            return block
+        self.misses += 1
+        block = read_block(src, block_row, block_col)
+        self._blocks[key] = block
+        self.bytes += block.nbytes
+        while self.bytes > self.max_bytes and len(self._blocks) > 1:
+            _, evicted = self._blocks.popitem(last=False)
+            self.bytes -= evicted.nbytes
+        return block
+
+
+class RasterPool:
+    """Open raster handles, their CRS handling and a cache of decoded blocks, kept for the life of the service.
+
+    Not thread-safe: only the batching thread reads through it.
+    """
+
+    def __init__(self, catalog, tile_cache_bytes=TILE_CACHE_BYTES):
+        self.catalog = catalog
+        self.tiles = TileCache(tile_cache_bytes)
+        self._handles = {}
+        self._geographic = {}
+
+    def _open(self, path):
+        if path not in self._handles:
+            src = rasterio.open(path)
+            self._handles[path] = src
+            self._geographic[path] = src.crs is None or src.crs == CRS.from_epsg(4326)
+        return self._handles[path]
+
+    def bands(self):
+        return list(dict.fromkeys(name for entry in self.catalog.entries for name in entry["bands"]))
+
+    def sample(self, lon, lat, mode="nearest", window_size=3):
+        """Band name -> values at the points; where rasters overlap the first in the catalog with data wins."""
+        columns = {name: np.full(len(lon), np.nan) for name in self.bands()}
+        bands = {entry["path"]: entry["bands"] for entry in self.catalog.entries}
+        for path, idx in self.catalog.route(lon, lat).items():
+            src = self._open(path)
+            if self._geographic[path]:
+                xs, ys = lon[idx], lat[idx]
+            else:
+                xs, ys = transform(CRS.from_epsg(4326), src.crs, lon[idx].tolist(), lat[idx].tolist())
+            row_f, col_f = pixel_coords(src, xs, ys)
+            values = sample_blocks(src, row_f, col_f, lambda row, col: self.tiles.get(src, row, col), mode, window_size)
+            for band, name in enumerate(bands[path]):
+                free = np.isnan(columns[name][idx])
+                columns[name][idx[free]] = values[band][free]
+        count("points sampled", len(lon))
+        return columns
+
+    def close(self):
+        for src in self._handles.values():
+            src.close()
+        self._handles.clear()
+
+
+class _Request:
+    def __init__(self, lon, lat, mode, window_size):
+        self.lon, self.lat = lon, lat
+        self.mode, self.window_size = mode, window_size
+        self.future = Future()
+
+
+class ExtractionBatcher:
+    """Serves extraction requests from one thread, merging those that queue up into one read pass."""
+
+    def __init__(self, pool, max_points=MAX_BATCH_POINTS):
+        self.pool = pool
+        self.max_points = max_points
+        self.stats = {"requests": 0, "batches": 0, "points": 0}
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="extraction-batcher", daemon=True)
+        self._thread.start()
+
+    def extract(self, lon, lat, mode="nearest", window_size=3):
+        """Band name -> values for these points; blocks until the batch holding them is read."""
+        request = _Request(np.asarray(lon, dtype=float), np.asarray(lat, dtype=float), mode, window_size)
+        self._queue.put(request)
+        return request.future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            points = len(batch[0].lon)
+            while points < self.max_points:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                points += len(request.lon)
+
+            groups = {}
+            for request in batch:
+                groups.setdefault((request.mode, request.window_size), []).append(request)
+            for (mode, window_size), requests in groups.items():
+                self._serve(requests, mode, window_size)
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["points"] += points
+
+    def _serve(self, requests, mode, window_size):
+        try:
+            lon = np.concatenate([r.lon for r in requests])
+            lat = np.concatenate([r.lat for r in requests])
+            # Points asked for by several requests are read once
+            coords, inverse = np.unique(np.column_stack([lon, lat]), axis=0, return_inverse=True)
+            columns = self.pool.sample(coords[:, 0], coords[:, 1], mode, window_size)
+            columns = {name: values[inverse.ravel()] for name, values in columns.items()}
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        start = 0
+        for request in requests:
+            end = start + len(request.lon)
+            request.future.set_result({name: values[start:end] for name, values in columns.items()})
+            start = end
+
+
+def derive_frame(raw):
+    """Frame of every derived soil property for a frame holding the raw SoilGrids columns."""
+    missing = [name for name in sm.RAW_COLUMNS if name not in raw]
+    if missing:
+        raise ValueError(f"Missing raw soil columns: {', '.join(missing)}")
+    derived = sm.derive_properties({name: pd.to_numeric(raw[name], errors="coerce").to_numpy(dtype=float)
+                                    for name in sm.RAW_COLUMNS})
+    derived = {name: values for name, values in derived.items() if name not in raw}
+    return pd.DataFrame(derived, index=raw.index)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "SoilService/1.0"
+
+    def _send(self, status, body):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({"error": message}))
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            pool = self.server.pool
+            self._send(200, json.dumps({"status": "ok", "rasters": len(pool.catalog.entries), **self.server.batcher.stats,
+                                        "tile_cache_hits": pool.tiles.hits, "tile_cache_misses": pool.tiles.misses,
+                                        "tile_cache_bytes": pool.tiles.bytes}))
+        elif self.path == "/rasters":
+            self._send(200, json.dumps(self.server.pool.catalog.entries))
+        else:
+            self._error(404, f"Unknown endpoint {self.path}")
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+            if self.path == "/extract":
+                result = self._extract(body)
+            elif self.path == "/soil":
+                rows = pd.DataFrame(body.get("rows", []))
+                result = pd.concat([rows, derive_frame(rows)], axis=1)
+            else:
+                self._error(404, f"Unknown endpoint {self.path}")
+                return
+        except (ValueError, KeyError, TypeError) as e:
+            self._error(400, str(e))
+            return
+        except Exception as e:
+            self._error(500, str(e))
+            return
+        self._send(200, result.to_json(orient="records"))
+
+    def _extract(self, body):
+        points = pd.DataFrame(body.get("points", []))
+        if points.empty:
+            return points
+        if "Longitude" not in points or "Latitude" not in points:
+            raise ValueError("Every point needs Longitude and Latitude.")
+        mode = body.get("mode", "nearest")
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode {mode}; use one of {', '.join(SAMPLING_MODES)}")
+        columns = self.server.batcher.extract(points["Longitude"].to_numpy(dtype=float),
+                                              points["Latitude"].to_numpy(dtype=float),
+                                              mode, int(body.get("window_size", 3)))
+        result = pd.concat([points, pd.DataFrame(columns, index=points.index)], axis=1)
+        if body.get("derive"):
+            result = pd.concat([result, derive_frame(result)], axis=1)
+        return result
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(catalog, host=DEFAULT_HOST, port=DEFAULT_PORT, verbose=False):
+    """A ThreadingHTTPServer serving ``catalog``; call serve_forever() on it (port 0 picks a free port)."""
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.pool = RasterPool(catalog)
+    server.batcher = ExtractionBatcher(server.pool)
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rasters", required=True, help="folder of GeoTIFFs (its catalog is kept on disk)")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    catalog = RasterCatalog.for_folder(args.rasters)
+    server = make_server(catalog, args.host, args.port, args.verbose)
+    print(f"Serving {len(catalog.entries)} rasters on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Cross-run memo table of derived soil properties, keyed by the raw SoilGrids tuple.
+
+SoilGrids values are quantized integers, so the same raw tuple recurs within
+and across extracts. process_soil_data in 4.py derives each unique tuple of a
+run once; with a SoilMemo it also skips the tuples earlier runs derived. The
+table is kept as Parquet parts in a local cache folder: each update writes
+only its new rows as one more part, and past MAX_PARTS parts they are
+compacted into one. Friction_Bounds is rebuilt from Soil_Texture rather than
+stored. Parts of an older MEMO_VERSION are ignored. Several processes may add
+parts to the same folder; a tuple found in more than one part is kept once.
+"""
+import glob
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import soil_model as sm
+from instrumentation import count
+
+MEMO_DIR = "soil_memo"
+MEMO_VERSION = 2  # bump whenever the derivations in 4.py change
+MAX_ROWS = 2_000_000  # the oldest tuples are dropped past this many
+MAX_PARTS = 16  # parts are compacted into one past this many
+
+
+class SoilMemo:
+    """Derived rows (raw columns plus every process_soil_data column) of every raw tuple seen so far."""
+
+    def __init__(self, path=MEMO_DIR, max_rows=MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._folder = os.path.join(path, f"v{MEMO_VERSION}")
+        self._parts = []
+        self.table = self._load()
+
+    def _load(self):
+        self._parts = sorted(glob.glob(os.path.join(self._folder, "part-*.parquet")))
+        frames = []
+        for part in self._parts:
+            try:
+                frames.append(pd.read_parquet(part))
+            except Exception:
+                continue
+        if not frames:
+            return pd.DataFrame(columns=list(sm.RAW_COLUMNS))
+        table = pd.concat(frames, ignore_index=True)
+        table = table.drop_duplicates(subset=list(sm.RAW_COLUMNS), keep="last").tail(self.max_rows)
+        return table.reset_index(drop=True)
+
+    def __len__(self):
+        return len(self.table)
+
+    def lookup(self, raw):
+        """Memo rows of the ``raw`` tuples (unique rows) found, indexed by their position in ``raw``, and a found mask."""
+        found = np.zeros(len(raw), dtype=bool)
+        table = self.table
+        if not len(table):
+            return table, found
+        positions = raw.reset_index(drop=True).rename_axis("_position").reset_index()
+        known = positions.merge(table, on=list(sm.RAW_COLUMNS)).set_index("_position").rename_axis(None).sort_index()
+        known.insert(known.columns.get_loc("pp_min"), "Friction_Bounds", sm.friction_bounds(known["Soil_Texture"]))
+        found[known.index] = True
+        return known, found
+
+    def _write_part(self, rows):
+        """Save ``rows`` as a new part; part names sort by time, so later parts win on load."""
+        os.makedirs(self._folder, exist_ok=True)
+        path = os.path.join(self._folder, f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet")
+        temporary = f"{path}.{os.getpid()}.tmp"
+        rows.to_parquet(temporary, index=False)
+        os.replace(temporary, path)
+        return path
+
+    def update(self, derived):
+        """Add newly derived rows; only tuples not in the table yet are saved, as one new part."""
+        with self._lock:
+            new = derived.drop(columns="Friction_Bounds", errors="ignore")
+            new = new.drop_duplicates(subset=list(sm.RAW_COLUMNS), keep="last")
+            if len(self.table):
+                merged = new.merge(self.table[list(sm.RAW_COLUMNS)], on=list(sm.RAW_COLUMNS), how="left",
+                                   indicator=True)
+                new = new[(merged["_merge"] == "left_only").to_numpy()]
+            if not len(new):
+                return
+            new = new.reset_index(drop=True)
+            self._parts.append(self._write_part(new))
+            table = pd.concat([self.table, new], ignore_index=True) if len(self.table) else new
+            self.table = table.tail(self.max_rows).reset_index(drop=True)
+            if len(self._parts) > MAX_PARTS or len(table) > self.max_rows:
+                self._compact()
+        count("memo rows", len(self.table))
+
+    def _compact(self):
+        """Replace the parts this memo has read or written by one part holding the whole table."""
+        compacted = self._write_part(self.table)
+        for part in self._parts:
+            try:
+                os.remove(part)
+            except FileNotFoundError:
+                pass
+        self._parts = [compacted]
+        count("memo compactions")
+
+
+@st.cache_resource
+def shared_memo(path=MEMO_DIR):
+    """One SoilMemo per server, so the table is loaded once and shared by every job."""
+    return SoilMemo(path)
+
+
+def memo_option(key="soil_memo"):
+    """Sidebar switch for reusing derived properties across runs; returns a SoilMemo or None."""
+    if st.sidebar.checkbox("Reuse properties derived in earlier runs", value=False, key=key,
+                           help=f"Keeps every derived raw tuple in the {MEMO_DIR} folder."):
+        return shared_memo()
+    return None
@@ -0,0 +1,332 @@
+"""The soil property derivations of 4.py, in array form.
+
+The lookup tables keep the keys of the original row-by-row functions: a
+texture missing from a table (e.g. "Silt Loam" in the Atterberg tables, which
+list "Silty Loam") gives NaN. Every function takes arrays of any shape that
+broadcast together, so the same code evaluates one value per row, per row and
+depth, or a whole (rows x samples) block.
+"""
+import numpy as np
+
+TEXTURES = [
+    "Sand", "Loamy Sand", "Sandy Loam", "Loam", "Silt Loam", "Silt", "Sandy Clay Loam",
+    "Clay Loam", "Silty Clay Loam", "Sandy Clay", "Silty Clay", "Clay", "Gravelly Soil",
+]
+
+# (cmin, cmax) in kPa
+COHESION_VALUES = {
+    "Clay": (50, 100), "Silty Clay": (40, 80), "Sandy Clay": (35, 70), "Clay Loam": (25, 50),
+    "Silty Clay Loam": (30, 60), "Sandy Clay Loam": (20, 40), "Loam": (10, 25), "Silty Loam": (12, 30),
+    "Sandy Loam": (5, 15), "Silt": (15, 35), "Sand": (0, 10), "Loamy Sand": (5, 15), "Gravelly Soil": (0, 5),
+}
+
+# (pdmin, pdmax) in g/cm3
+DRY_DENSITY_VALUES = {
+    "Sand": (1.30, 1.80), "Loamy Sand": (1.25, 1.75), "Sandy Loam": (1.20, 1.70), "Loam": (1.10, 1.65),
+    "Silt Loam": (1.05, 1.60), "Silt": (1.00, 1.55), "Clay Loam": (0.95, 1.50), "Silty Clay Loam": (0.90, 1.45),
+    "Sandy Clay Loam": (0.85, 1.40), "Clay": (0.80, 1.35), "Silty Clay": (0.75, 1.30), "Sandy Clay": (0.70, 1.25),
+    "Gravelly Soil": (1.40, 2.00),
+}
+
+# (b, clay, silt, sand, coarse fragments, SOC, water content at 33 kPa)
+LIQUID_LIMIT_COEFFICIENTS = {
+    "Clay": (50, 1.10, 0.50, -0.20, -0.15, 0.50, 0.25),
+    "Silty Clay": (48, 1.00, 0.55, -0.18, -0.12, 0.45, 0.22),
+    "Sandy Clay": (46, 0.95, 0.45, -0.15, -0.10, 0.40, 0.20),
+    "Clay Loam": (42, 0.85, 0.50, -0.22, -0.08, 0.38, 0.18),
+    "Silty Clay Loam": (40, 0.75, 0.55, -0.20, -0.07, 0.36, 0.16),
+    "Sandy Clay Loam": (38, 0.70, 0.45, -0.18, -0.06, 0.34, 0.15),
+    "Loam": (36, 0.55, 0.50, -0.25, -0.05, 0.30, 0.12),
+    "Silty Loam": (34, 0.50, 0.55, -0.28, -0.04, 0.28, 0.10),
+    "Sandy Loam": (30, 0.40, 0.45, -0.30, -0.03, 0.25, 0.08),
+    "Silt": (28, 0.30, 0.65, -0.32, -0.02, 0.22, 0.07),
+    "Sand": (26, 0.15, 0.35, -0.35, -0.01, 0.18, 0.08),
+    "Loamy Sand": (24, 0.10, 0.30, -0.40, 0.00, 0.15, 0.06),
+    "Gravelly Soil": (22, 0.60, 0.40, -0.30, -0.25, 0.30, 0.10),
+}
+
+# Same layout
+PLASTIC_LIMIT_COEFFICIENTS = {
+    "Clay": (24, 0.70, 0.30, -0.15, -0.10, 0.40, 0.18),
+    "Silty Clay": (23, 0.65, 0.35, -0.12, -0.08, 0.35, 0.16),
+    "Sandy Clay": (22, 0.60, 0.25, -0.10, -0.07, 0.30, 0.15),
+    "Clay Loam": (21, 0.50, 0.35, -0.18, -0.06, 0.28, 0.14),
+    "Silty Clay Loam": (20, 0.45, 0.40, -0.16, -0.05, 0.26, 0.13),
+    "Sandy Clay Loam": (19, 0.40, 0.30, -0.14, -0.04, 0.24, 0.12),
+    "Loam": (18, 0.30, 0.35, -0.20, -0.03, 0.22, 0.10),
+    "Silty Loam": (17, 0.25, 0.40, -0.22, -0.02, 0.20, 0.08),
+    "Sandy Loam": (16, 0.20, 0.30, -0.25, -0.02, 0.18, 0.06),
+    "Silt": (15, 0.10, 0.50, -0.28, -0.01, 0.15, 0.05),
+    "Sand": (14, 0.05, 0.25, -0.30, -0.01, 0.12, 0.06),
+    "Loamy Sand": (13, 0.02, 0.20, -0.35, 0.00, 0.10, 0.04),
+    "Gravelly Soil": (12, 0.40, 0.30, -0.25, -0.20, 0.20, 0.09),
+}
+
+# αPI
+ALPHA_PI_VALUES = {
+    "Clay": 0.0075, "Silty Clay": 0.006, "Sandy Clay": 0.005, "Clay Loam": 0.0045, "Silty Clay Loam": 0.004,
+    "Sandy Clay Loam": 0.0035, "Loam": 0.00275, "Silty Loam": 0.002, "Sandy Loam": 0.00165, "Silt": 0.00125,
+    "Sand": 0, "Loamy Sand": 0, "Gravelly Soil": 0,
+}
+
+# (pp_min, pp_max) in g/cm3
+PARTICLE_DENSITY_BOUNDS = {
+    "Sand": (2.65, 2.75), "Loamy Sand": (2.65, 2.70), "Sandy Loam": (2.65, 2.70), "Loam": (2.65, 2.65),
+    "Silt Loam": (2.65, 2.68), "Silt": (2.65, 2.68), "Clay Loam": (2.65, 2.72), "Silty Clay Loam": (2.65, 2.75),
+    "Sandy Clay Loam": (2.65, 2.75), "Clay": (2.65, 2.78), "Silty Clay": (2.65, 2.75), "Sandy Clay": (2.65, 2.75),
+    "Gravelly Soil": (2.70, 2.80),
+}
+
+# (phi_min, phi_max) reported as Friction_Bounds; unlike the table below it has Sandy Clay
+FRICTION_ANGLE_BOUNDS = {
+    "Sand": (30, 35), "Loamy Sand": (28, 33), "Sandy Loam": (28, 32), "Loam": (25, 30), "Silt Loam": (22, 27),
+    "Silt": (18, 24), "Sandy Clay Loam": (27, 32), "Clay Loam": (22, 27), "Silty Clay Loam": (20, 26),
+    "Sandy Clay": (25, 30), "Silty Clay": (18, 23), "Clay": (15, 20), "Gravelly Soil": (32, 38),
+}
+
+# (phi_min, phi_max) in degrees; "SandyClay" is spelled as in the original table, so Sandy Clay gets no phi
+FRICTION_ANGLE_VALUES = {
+    "Sand": (30, 35), "Loamy Sand": (28, 33), "Sandy Loam": (28, 32), "Loam": (25, 30), "Silt Loam": (22, 27),
+    "Silt": (18, 24), "Sandy Clay Loam": (27, 32), "Clay Loam": (22, 27), "Silty Clay Loam": (20, 26),
+    "SandyClay": (25, 30), "Silty Clay": (18, 23), "Clay": (15, 20), "Gravelly Soil": (32, 38),
+}
+
+# Δϕ for SOC < 1, 1-5, 5-10 and > 10 %
+DELTA_PHI_VALUES = {
+    "Sand": (0, 0.1, 0.2, 0.3), "Loamy Sand": (0, 0.2, 0.4, 0.6), "Sandy Loam": (0, 0.3, 0.6, 0.9),
+    "Loam": (0, 0.4, 0.8, 1.2), "Silt Loam": (0, 0.5, 1.0, 1.5), "Silt": (0, 0.5, 1.0, 1.5),
+    "Sandy Clay Loam": (0, 0.4, 0.8, 1.2), "Clay Loam": (0, 0.5, 1.0, 1.5), "Silty Clay Loam": (0, 0.5, 1.0, 1.5),
+    "Sandy Clay": (0, 0.3, 0.6, 0.9), "Silty Clay": (0, 0.5, 1.0, 1.5), "Clay": (0, 0.6, 1.2, 1.8),
+    "Gravelly Soil": (0, 0.2, 0.4, 0.6),
+}
+
+# SPT N = coefficient * (bulk density / divisor)
+N_VALUE_COEFFICIENTS = {
+    "Sand": (12.5, 10000000000), "Loamy Sand": (10.8, 100000000), "Sandy Loam": (9.6, 1000000),
+    "Loam": (8.5, 100000), "Silt Loam": (7.2, 10000), "Silt": (6.8, 1000), "Clay Loam": (5.5, 100),
+    "Silty Clay Loam": (4.8, 10), "Sandy Clay Loam": (4.0, 10), "Clay": (3.5, 10), "Silty Clay": (3.2, 10),
+    "Sandy Clay": (2.8, 10), "Gravelly Soil": (15, 1000000000000),
+}
+
+# (n_max, n_min)
+POROSITY_VALUES = {
+    "Clay": (0.45, 0.25), "Silty Clay": (0.48, 0.28), "Sandy Clay": (0.50, 0.30), "Silty Clay Loam": (0.50, 0.30),
+    "Clay Loam": (0.52, 0.32), "Sandy Clay Loam": (0.53, 0.33), "Silt": (0.55, 0.35), "Silt Loam": (0.53, 0.33),
+    "Loam": (0.52, 0.32), "Sandy Loam": (0.50, 0.30), "Loamy Sand": (0.47, 0.28), "Sand": (0.44, 0.26),
+    "Gravelly Soil": (0.42, 0.24),
+}
+
+# (texture, sand, silt, clay ranges in %) in the order they are tested
+TEXTURE_CLASSES = [
+    ("Sand", (85, 100), (0, 15), (0, 10)),
+    ("Loamy Sand", (70, 90), (0, 30), (0, 15)),
+    ("Sandy Loam", (43, 85), (0, 50), (0, 20)),
+    ("Loam", (23, 52), (28, 50), (7, 28)),
+    ("Silt Loam", (0, 50), (50, 86), (0, 28)),
+    ("Silt", (0, 20), (80, 100), (0, 12)),
+    ("Sandy Clay Loam", (45, 80), (0, 28), (20, 35)),
+    ("Clay Loam", (20, 45), (15, 52), (28, 40)),
+    ("Silty Clay Loam", (0, 20), (40, 72), (28, 40)),
+    ("Sandy Clay", (45, 65), (0, 20), (35, 55)),
+    ("Silty Clay", (0, 20), (40, 60), (40, 60)),
+    ("Clay", (0, 45), (0, 40), (40, 100)),
+]
+
+COHESIVE_TEXTURES = [
+    "Clay", "Silty Clay", "Sandy Clay", "Silty Clay Loam", "Clay Loam", "Sandy Clay Loam", "Silt", "Silt Loam", "Loam",
+]
+NON_COHESIVE_TEXTURES = ["Sandy Loam", "Loamy Sand", "Sand"]
+
+# Raw SoilGrids columns and the scale process_soil_data divides them by
+RAW_COLUMNS = {
+    "bulk_density": ("Bulk_Density", 100), "cation_exchange_capacity": ("Cation_Exchange_Capacity", 10),
+    "clay_content": ("Clay_Content", 10), "coarse_fragments": ("Coarse_Fragments_Percentage", 10),
+    "nitrogen": ("Nitrogen", 1), "organic_carbon_density": ("Organic_Carbon_Density", 10000),
+    "pH_water": ("pH_Water", 10), "sand": ("Sand", 10), "silt": ("Silt", 10),
+    "organic_carbon_stock": ("Organic_Carbon_Stock", 1), "soil_organic_carbon": ("Soil_Organic_Carbon", 100),
+    "vol_water_content_10kPa": ("Vol_Water_Content_10kPa", 10),
+    "vol_water_content_33kPa": ("Vol_Water_Content_33kPa", 10),
+    "vol_water_content_1500kPa": ("Vol_Water_Content_1500kPa", 10),
+}
+
+TOTAL_VOLUME_OF_SOIL = 1000
+GS_CLAY, GS_SAND, GS_SILT, GS_COARSE_FRAGMENTS = 2.75, 2.675, 2.70, 2.70
+
+
+def texture_codes(textures):
+    """Index of each texture in TEXTURES; anything else (e.g. "Unclassified") maps past the end."""
+    index = {texture: code for code, texture in enumerate(TEXTURES)}
+    return np.array([index.get(texture, len(TEXTURES)) for texture in textures], dtype=np.int64)
+
+
+def lookup(table, codes):
+    """Table values per texture code, NaN where the table has no entry; shape codes.shape + (width,)."""
+    width = np.size(next(iter(table.values())))
+    values = np.full((len(TEXTURES) + 1, width), np.nan)
+    for code, texture in enumerate(TEXTURES):
+        if texture in table:
+            values[code] = table[texture]
+    return values[codes]
+
+
+def cohesion_soc_factor(soc_percent):
+    """delta_c for the band of soil organic carbon (%)."""
+    return np.select(
+        [soc_percent <= 1, soc_percent <= 2, soc_percent <= 4, soc_percent <= 8, soc_percent <= 12],
+        [1.00, 0.965, 0.925, 0.85, 0.725], default=0.575,
+    )
+
+
+def coarse_fragment_factor(coarse_fragments_percentage):
+    """Coarse fragment factor beta_cf of the adjusted cohesion."""
+    cf = coarse_fragments_percentage
+    return np.select(
+        [cf < 0, cf <= 10, cf <= 20, cf <= 30, cf <= 40, cf <= 50, cf <= 60, cf <= 70],
+        [0.40, 1.00, 0.965, 0.925, 0.875, 0.80, 0.70, 0.575], default=0.40,
+    )
+
+
+def delta_phi(delta_phi_table, soc_percent):
+    """Pick the Δϕ column for the SOC band; ``delta_phi_table`` is lookup(DELTA_PHI_VALUES, codes)."""
+    band = np.select([soc_percent < 1, soc_percent <= 5, soc_percent <= 10], [0, 1, 2], default=3)
+    return np.choose(band, np.moveaxis(delta_phi_table, -1, 0))
+
+
+def atterberg_limit(coefficients, clay, silt, sand, coarse_fragments, soc, water_33kpa):
+    """Liquid or plastic limit for ``coefficients`` = lookup(LIQUID/PLASTIC_LIMIT_COEFFICIENTS, codes)."""
+    c = np.moveaxis(coefficients, -1, 0)
+    return (c[0] + c[1] * clay + c[2] * silt + c[3] * sand + c[4] * coarse_fragments
+            + c[5] * soc + c[6] * water_33kpa)
+
+
+def cohesion(dry_density, pdmin, pdmax, cmin, cmax, soc_percent):
+    """Initial cohesion c'; NaN where pdmax equals pdmin."""
+    span = np.where(pdmax != pdmin, pdmax - pdmin, np.nan)
+    return cmin + ((dry_density - pdmin) / span) * (cmax - cmin) - soc_percent * cohesion_soc_factor(soc_percent)
+
+
+def adjusted_cohesion(cohesion_initial, alpha_pi, plasticity_index, coarse_fragments_percentage):
+    return (cohesion_initial * (1 + alpha_pi * plasticity_index)
+            * (1 - coarse_fragment_factor(coarse_fragments_percentage) * coarse_fragments_percentage / 100))
+
+
+def friction_angle(bulk_density, rho_b_min, rho_b_max, phi_min, phi_max, soc_percent, delta_phi_value):
+    """Angle of friction φ; NaN where rho_b_max equals rho_b_min."""
+    span = np.where(rho_b_max != rho_b_min, rho_b_max - rho_b_min, np.nan)
+    return phi_min + ((bulk_density - rho_b_min) / span) * (phi_max - phi_min) - soc_percent * delta_phi_value
+
+
+def classify_texture(sand, silt, clay):
+    """Texture codes (see texture_codes) by TEXTURE_CLASSES' ordered, inclusive ranges."""
+    conditions = [
+        (lo_sand <= sand) & (sand <= hi_sand) & (lo_silt <= silt) & (silt <= hi_silt)
+        & (lo_clay <= clay) & (clay <= hi_clay)
+        for _, (lo_sand, hi_sand), (lo_silt, hi_silt), (lo_clay, hi_clay) in TEXTURE_CLASSES
+    ]
+    choices = [TEXTURES.index(texture) for texture, *_ in TEXTURE_CLASSES]
+    return np.select(conditions, choices, default=len(TEXTURES))
+
+
+def texture_names(codes):
+    return np.array(TEXTURES + ["Unclassified"], dtype=object)[codes]
+
+
+def friction_bounds(textures):
+    """Friction_Bounds per texture name: a (phi_min, phi_max) tuple, (None, None) where the table has none."""
+    bounds = np.empty(len(TEXTURES) + 1, dtype=object)
+    bounds[:] = [FRICTION_ANGLE_BOUNDS.get(texture, (None, None)) for texture in TEXTURES + ["Unclassified"]]
+    return bounds[texture_codes(textures)]
+
+
+def with_friction_bounds(derived):
+    """One-dimensional ``derived`` arrays with Friction_Bounds added before pp_min, in process_soil_data's order."""
+    columns = list(derived)
+    columns.insert(columns.index("pp_min"), "Friction_Bounds")
+    derived = {**derived, "Friction_Bounds": friction_bounds(derived["Soil_Texture"])}
+    return {column: derived[column] for column in columns}
+
+
+def spt_n_value(coefficients, bulk_density):
+    """SPT N for ``coefficients`` = lookup(N_VALUE_COEFFICIENTS, codes)."""
+    return coefficients[..., 0] * (bulk_density / coefficients[..., 1])
+
+
+def cohesiveness(codes, coarse_fragments_percentage):
+    """Cohesiveness class per texture code; gravelly (over 15 % coarse fragments) comes first."""
+    names = texture_names(codes)
+    return np.select(
+        [coarse_fragments_percentage > 15, np.isin(names, COHESIVE_TEXTURES), np.isin(names, NON_COHESIVE_TEXTURES)],
+        ["Gravelly, Non-Cohesive", "Non-Gravelly, Cohesive", "Non-Gravelly, Non-Cohesive"],
+        default="Unclassified",
+    ).astype(object)
+
+
+def _ratio(numerator, denominator, scale=1):
+    """numerator / denominator * scale, and 0 (not inf or NaN) where the denominator is 0."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator != 0, numerator / denominator * scale, 0)
+
+
+def derive_properties(raw):
+    """Every column process_soil_data adds (Friction_Bounds aside, see with_friction_bounds) from raw arrays.
+
+    ``raw`` maps the RAW_COLUMNS names to arrays of one shape, e.g. (points,)
+    or (points, depths). Returns a dict of arrays in process_soil_data's column order.
+    """
+    p = {scaled: np.asarray(raw[name], dtype=float) / scale for name, (scaled, scale) in RAW_COLUMNS.items()}
+    codes = classify_texture(p["Sand"], p["Silt"], p["Clay_Content"])
+    p["Soil_Texture"] = texture_names(codes)
+
+    # Mass, volume fractions and void ratio
+    p["Total_Mass_Of_Soil"] = TOTAL_VOLUME_OF_SOIL * p["Bulk_Density"]
+    p["Mass_of_Coarse_Fragments"] = np.asarray(raw["coarse_fragments"], dtype=float) * GS_COARSE_FRAGMENTS
+    p["Mass_of_Fine_Fragments"] = p["Total_Mass_Of_Soil"] - p["Mass_of_Coarse_Fragments"]
+    for fraction, column in (("Clay", "Clay_Content"), ("Sand", "Sand"), ("Silt", "Silt")):
+        p[f"Mass_of_{fraction}"] = p["Mass_of_Fine_Fragments"] * p[column] / 100
+    for fraction in ("Clay", "Sand", "Silt", "Coarse_Fragments"):
+        p[f"%_of_{fraction}"] = _ratio(p[f"Mass_of_{fraction}"], p["Total_Mass_Of_Soil"], 100)
+    p["Volume_Fraction_Clay"] = p["Mass_of_Clay"] / GS_CLAY
+    p["Volume_Fraction_Sand"] = p["Mass_of_Sand"] / GS_SAND
+    p["Volume_Fraction_Silt"] = p["Mass_of_Silt"] / GS_SILT
+    p["Fine_Fraction_Volume(%)"] = 100 - p["Coarse_Fragments_Percentage"]
+    fine_sum = p["Volume_Fraction_Clay"] + p["Volume_Fraction_Sand"] + p["Volume_Fraction_Silt"]
+    p["Sum_of_Fine_Fraction_Volume(%)"] = fine_sum
+    for adjusted, fraction in (("Adjusted_Clay_Content", "Clay"), ("Adjusted_Sand", "Sand"), ("Adjusted_Silt", "Silt")):
+        p[adjusted] = _ratio(p["Fine_Fraction_Volume(%)"] * p[f"Volume_Fraction_{fraction}"], fine_sum)
+    p["Volume_of_Solids"] = fine_sum + p["Coarse_Fragments_Percentage"]
+    p["Volume_of_Voids"] = TOTAL_VOLUME_OF_SOIL - p["Volume_of_Solids"]
+    p["Void_Ratio"] = _ratio(p["Volume_of_Voids"], p["Volume_of_Solids"])
+
+    # Porosity, density and relative density
+    n_max, n_min = np.moveaxis(lookup(POROSITY_VALUES, codes), -1, 0)
+    p["e_max"], p["e_min"] = n_max / (1 - n_max), n_min / (1 - n_min)
+    p["pdmin"], p["pdmax"] = np.moveaxis(lookup(DRY_DENSITY_VALUES, codes), -1, 0)
+    p["pd"] = p["Bulk_Density"] / (1 + p["Vol_Water_Content_33kPa"] / 100)
+    p["Relative_Density"] = _ratio(p["pd"] - p["pdmin"], p["pdmax"] - p["pdmin"], 100)
+
+    # Atterberg limits and cohesion
+    limit_inputs = (p["Clay_Content"], p["Silt"], p["Sand"], p["Coarse_Fragments_Percentage"],
+                    p["Soil_Organic_Carbon"], p["Vol_Water_Content_33kPa"])
+    p["Liquid_Limit"] = atterberg_limit(lookup(LIQUID_LIMIT_COEFFICIENTS, codes), *limit_inputs)
+    p["Plastic_Limit"] = atterberg_limit(lookup(PLASTIC_LIMIT_COEFFICIENTS, codes), *limit_inputs)
+    p["Plasticity_Index"] = p["Liquid_Limit"] - p["Plastic_Limit"]
+    soc_percent = p["Soil_Organic_Carbon"] * 100
+    cmin, cmax = np.moveaxis(lookup(COHESION_VALUES, codes), -1, 0)
+    p["Cohesion"] = cohesion(p["pd"], p["pdmin"], p["pdmax"], cmin, cmax, soc_percent)
+    p["Adjusted_Cohesion"] = adjusted_cohesion(p["Cohesion"], lookup(ALPHA_PI_VALUES, codes)[..., 0],
+                                               p["Plasticity_Index"], p["Coarse_Fragments_Percentage"])
+
+    # Friction angle
+    p["pp_min"], p["pp_max"] = np.moveaxis(lookup(PARTICLE_DENSITY_BOUNDS, codes), -1, 0)
+    p["n_min"] = (1 - p["Bulk_Density"] / p["pp_min"]) * 100
+    p["n_max"] = (1 - p["Bulk_Density"] / p["pp_max"]) * 100
+    p["phi_min"], p["phi_max"] = np.moveaxis(lookup(FRICTION_ANGLE_VALUES, codes), -1, 0)
+    p["delta_phi"] = delta_phi(lookup(DELTA_PHI_VALUES, codes), soc_percent)
+    p["rho_b_min"] = (1 - p["n_max"] / 100) * p["pp_max"]
+    p["rho_b_max"] = (1 - p["n_min"] / 100) * p["pp_min"]
+    p["phi"] = friction_angle(p["Bulk_Density"], p["rho_b_min"], p["rho_b_max"], p["phi_min"], p["phi_max"],
+                              soc_percent, p["delta_phi"])
+
+    p["SPT_N_Values"] = spt_n_value(lookup(N_VALUE_COEFFICIENTS, codes), p["Bulk_Density"])
+    p["Cohesiveness"] = cohesiveness(codes, p["Coarse_Fragments_Percentage"])
+    return p
@@ -0,0 +1,148 @@
+"""Regionated super-overlay KMZ for large point sets.
+
+Points are split into a quadtree of tiles. Each tile holds at most
+``max_placemarks`` points, drawn evenly (in a fixed random order) from its
+part of the quadtree, and passes the rest on to its four children. Every tile
+is its own KML file with a Region, so Google Earth shows a tile's points once
+it covers ``MIN_LOD_PIXELS`` on screen and only fetches a child (through a
+NetworkLink with viewRefreshMode onRegion) when the child's region comes into
+view. Each point is written exactly once. Tile files are rendered in worker
+processes and packaged with the root doc.kml into one KMZ.
+"""
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from instrumentation import count, stage
+from parallel import chunk_size, process_pool
+
+MAX_PLACEMARKS = 500  # per tile
+MAX_DEPTH = 24
+MIN_LOD_PIXELS = 128
+MIN_EXTENT = 1e-5  # degrees; keeps regions around coincident points visible
+TILE_DIR = "tiles"
+PARALLEL_MIN_TILES = 64  # fewer tiles render faster than a process pool starts
+
+_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+_FOOTER = "</Document></kml>\n"
+
+
+def build_quadtree(lon, lat, max_placemarks=MAX_PLACEMARKS, max_depth=MAX_DEPTH, seed=0):
+    """Tiles of the super-overlay as dicts with key, bbox, points (indices) and children (keys).
+
+    Keys are quadkeys: "0" is the root and "0" + "0".."3" its children. The
+    bbox (west, south, east, north) covers every point of the tile's subtree.
+    """
+    order = np.random.default_rng(seed).permutation(len(lon))
+    tiles = []
+    stack = [("0", order)]
+    while stack:
+        key, points = stack.pop()
+        x, y = lon[points], lat[points]
+        bbox = _padded(x.min(), y.min(), x.max(), y.max())
+        tile = {"key": key, "bbox": bbox, "points": points[:max_placemarks], "children": []}
+        tiles.append(tile)
+        rest = points[max_placemarks:]
+        if not len(rest):
+            continue
+        if len(key) >= max_depth:
+            tile["points"] = points
+            continue
+        mid_x, mid_y = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+        east, north = lon[rest] >= mid_x, lat[rest] >= mid_y
+        for quadrant, mask in enumerate([~east & north, east & north, ~east & ~north, east & ~north]):
+            if mask.any():
+                child = key + str(quadrant)
+                tile["children"].append(child)
+                stack.append((child, rest[mask]))
+    return tiles
+
+
+def _padded(west, south, east, north):
+    pad_x, pad_y = max(0.0, MIN_EXTENT - (east - west)) / 2, max(0.0, MIN_EXTENT - (north - south)) / 2
+    return (float(west - pad_x), float(south - pad_y), float(east + pad_x), float(north + pad_y))
+
+
+def _region(bbox, min_lod_pixels):
+    west, south, east, north = bbox
+    return (f"<Region><LatLonAltBox><north>{north!r}</north><south>{south!r}</south>"
+            f"<east>{east!r}</east><west>{west!r}</west></LatLonAltBox>"
+            f"<Lod><minLodPixels>{min_lod_pixels}</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod></Region>")
+
+
+def _network_link(name, href, bbox, min_lod_pixels=MIN_LOD_PIXELS):
+    return (f"<NetworkLink><name>{name}</name>{_region(bbox, min_lod_pixels)}"
+            f"<Link><href>{href}</href><viewRefreshMode>onRegion</viewRefreshMode></Link></NetworkLink>")
+
+
+def _render_tile(task):
+    """KML text of one tile: its region, its placemarks and links to its children."""
+    key, bbox, names, lon, lat, children = task
+    # The root stays visible at any zoom so the overview shows from afar
+    parts = [_HEADER, f"<name>{key}</name>", _region(bbox, 0 if key == "0" else MIN_LOD_PIXELS)]
+    parts.extend(f"<Placemark><name>{escape(name)}</name><Point><coordinates>{x!r},{y!r}</coordinates></Point></Placemark>"
+                 for name, x, y in zip(names, lon.tolist(), lat.tolist()))
+    parts.extend(_network_link(child, f"{child}.kml", child_bbox) for child, child_bbox in children)
+    parts.append(_FOOTER)
+    return f"{TILE_DIR}/{key}.kml", "".join(parts).encode("utf-8")
+
+
+def _render_tiles(tasks):
+    return [_render_tile(task) for task in tasks]
+
+
+def regionated_kmz(data, name="Points", max_placemarks=MAX_PLACEMARKS, max_workers=None, progress=None):
+    """KMZ (BytesIO) of the Longitude/Latitude points of ``data`` as a regionated super-overlay.
+
+    Placemarks are named from a ``Name`` column where it has a value, else
+    numbered. Rows without coordinates are skipped. ``progress`` gets the fraction of tiles written.
+    """
+    data = data[data["Longitude"].notna() & data["Latitude"].notna()]
+    lon = data["Longitude"].to_numpy(dtype=float)
+    lat = data["Latitude"].to_numpy(dtype=float)
+    names = np.array([f"Point {i + 1}" for i in range(len(data))], dtype=object)
+    if "Name" in data:
+        named = data["Name"].notna().to_numpy()
+        names[named] = data["Name"][named].astype(str).to_numpy()
+
+    kmz_data = io.BytesIO()
+    with zipfile.ZipFile(kmz_data, "w", zipfile.ZIP_DEFLATED) as kmz:
+        if not len(data):
+            kmz.writestr("doc.kml", f"{_HEADER}<name>{escape(name)}</name>{_FOOTER}")
+            kmz_data.seek(0)
+            return kmz_data
+
+        with stage("quadtree build"):
+            tiles = build_quadtree(lon, lat, max_placemarks)
+            bboxes = {tile["key"]: tile["bbox"] for tile in tiles}
+            tasks = [(tile["key"], tile["bbox"], names[tile["points"]].tolist(), lon[tile["points"]],
+                      lat[tile["points"]], [(child, bboxes[child]) for child in tile["children"]]) for tile in tiles]
+        count("tiles written", len(tiles))
+
+        kmz.writestr("doc.kml", f"{_HEADER}<name>{escape(name)}</name>"
+                                f"{_network_link('0', f'{TILE_DIR}/0.kml', bboxes['0'], 0)}{_FOOTER}")
+        with stage("tile render"):
+            size = chunk_size(len(tasks), max_workers)
+            batches = [tasks[start:start + size] for start in range(0, len(tasks), size)]
+            if max_workers == 1 or len(tasks) < PARALLEL_MIN_TILES:
+                results = map(_render_tiles, batches)
+                executor = None
+            else:
+                executor = process_pool(max_workers, preload=[__name__])
+                results = executor.map(_render_tiles, batches)
+            try:
+                done = 0
+                for rendered in results:
+                    for path, kml in rendered:
+                        kmz.writestr(path, kml)
+                    done += len(rendered)
+                    if progress is not None:
+                        progress(done / len(tasks))
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+    count("placemarks written", len(data))
+    kmz_data.seek(0)
+    return kmz_data
@@ -0,0 +1,154 @@
+"""Deterministic synthetic inputs for benchmarking the soil feasibility tools.
+
+Every generator takes a ``size`` (rows, points or pixels) and a ``seed`` so the
+same call always produces the same data. Coordinates default to a 2 x 2 degree
+box inside UTM zone 33N so borehole sets, KML files and GeoTIFFs overlap.
+"""
+import io
+import math
+import zipfile
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import from_bounds
+from rasterio.warp import transform
+
+from depth_layers import SOILGRIDS_DEPTHS
+
+# Default study area (lon_min, lat_min, lon_max, lat_max) and its UTM zone
+DEFAULT_BOUNDS = (14.0, 44.0, 16.0, 46.0)
+DEFAULT_UTM_ZONE = 33
+
+# Raw SoilGrids columns read by process_soil_data in 4.py
+SOIL_COLUMNS = [
+    "bulk_density", "cation_exchange_capacity", "clay_content", "coarse_fragments",
+    "nitrogen", "organic_carbon_density", "pH_water", "sand", "silt",
+    "organic_carbon_stock", "soil_organic_carbon", "vol_water_content_10kPa",
+    "vol_water_content_33kPa", "vol_water_content_1500kPa",
+]
+
+
+def soil_table(size, seed=0):
+    """Raw soil property table in SoilGrids integer units (g/kg, cg/cm³, ...)."""
+    rng = np.random.default_rng(seed)
+
+    # Sand, silt and clay always add up to 1000 g/kg
+    fractions = rng.dirichlet([2.0, 1.5, 1.0], size=size)
+    sand = np.round(fractions[:, 0] * 1000)
+    clay = np.round(fractions[:, 2] * 1000)
+    silt = 1000 - sand - clay
+
+    wv1500 = rng.integers(50, 250, size)
+    wv33 = wv1500 + rng.integers(50, 150, size)
+    wv10 = wv33 + rng.integers(20, 100, size)
+
+    data = {
+        "bulk_density": rng.integers(100, 175, size),
+        "cation_exchange_capacity": rng.integers(50, 400, size),
+        "clay_content": clay.astype(int),
+        "coarse_fragments": rng.integers(0, 300, size),
+        "nitrogen": rng.integers(50, 500, size),
+        "organic_carbon_density": rng.integers(50, 600, size),
+        "pH_water": rng.integers(45, 85, size),
+        "sand": sand.astype(int),
+        "silt": silt.astype(int),
+        "organic_carbon_stock": rng.integers(10, 80, size),
+        "soil_organic_carbon": rng.integers(10, 400, size),
+        "vol_water_content_10kPa": wv10,
+        "vol_water_content_33kPa": wv33,
+        "vol_water_content_1500kPa": wv1500,
+    }
+    return pd.DataFrame(data, columns=SOIL_COLUMNS)
+
+
+def layered_soil_table(size, seed=0, depths=SOILGRIDS_DEPTHS):
+    """Point table with one raw column per property and depth, e.g. clay_content_0-5cm."""
+    points = lonlat_points(size, seed)
+    layers = [
+        soil_table(size, seed + i).add_suffix(f"_{top}-{bottom}cm")
+        for i, (top, bottom) in enumerate(depths)
+    ]
+    return pd.concat([points] + layers, axis=1)
+
+
+def lonlat_points(size, seed=0, bounds=DEFAULT_BOUNDS):
+    """Uniformly scattered WGS84 points with generated names."""
+    rng = np.random.default_rng(seed)
+    lon_min, lat_min, lon_max, lat_max = bounds
+    return pd.DataFrame({
+        "Name": [f"BH-{i + 1}" for i in range(size)],
+        "Longitude": rng.uniform(lon_min, lon_max, size),
+        "Latitude": rng.uniform(lat_min, lat_max, size),
+    })
+
+
+def borehole_coordinates(size, seed=0, bounds=DEFAULT_BOUNDS, zone=DEFAULT_UTM_ZONE):
+    """Borehole table in the layout 2.py expects (UTM Northing/Easting)."""
+    points = lonlat_points(size, seed, bounds)
+    easting, northing = transform(
+        CRS.from_epsg(4326), CRS.from_epsg(32600 + zone),
+        points["Longitude"].tolist(), points["Latitude"].tolist()
+    )
+    return pd.DataFrame({
+        "sr.no": np.arange(1, size + 1),
+        "Test_location_2": points["Name"],
+        "Northing": northing,
+        "Easting": easting,
+    })
+
+
+def kml_document(size, seed=0, bounds=DEFAULT_BOUNDS):
+    """KML bytes with one Placemark per point."""
+    points = lonlat_points(size, seed, bounds)
+    buffer = io.StringIO()
+    buffer.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    buffer.write('<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n')
+    for name, lon, lat in points.itertuples(index=False):
+        buffer.write(
+            f"<Placemark><name>{name}</name><Point><coordinates>"
+            f"{lon:.8f},{lat:.8f},0</coordinates></Point></Placemark>\n"
+        )
+    buffer.write("</Document></kml>\n")
+    return buffer.getvalue().encode("utf-8")
+
+
+def kmz_document(size, seed=0, bounds=DEFAULT_BOUNDS):
+    """KMZ bytes wrapping kml_document as doc.kml."""
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as kmz:
+        kmz.writestr("doc.kml", kml_document(size, seed, bounds))
+    return output.getvalue()
+
+
+def geotiff(path, size, bands=1, seed=0, bounds=DEFAULT_BOUNDS, dtype="int16",
+            descriptions=None):
+    """Write a square EPSG:4326 GeoTIFF holding roughly ``size`` pixels per band."""
+    rng = np.random.default_rng(seed)
+    side = max(1, math.isqrt(size))
+    with rasterio.open(
+        path, "w",
+        driver="GTiff",
+        height=side,
+        width=side,
+        count=bands,
+        crs=CRS.from_epsg(4326),
+        transform=from_bounds(*bounds, side, side),
+        dtype=dtype,
+        tiled=side >= 256,
+    ) as dst:
+        for band in range(1, bands + 1):
+            dst.write(rng.integers(0, 1000, (side, side)).astype(dtype), band)
+            if descriptions:
+                dst.set_band_description(band, descriptions[band - 1])
+    return path
+
+
+def geotiff_stack(directory, size, count, seed=0, bounds=DEFAULT_BOUNDS):
+    """Write ``count`` aligned single-band GeoTIFFs, one per soil property, each band named after it."""
+    paths = []
+    for i in range(count):
+        name = SOIL_COLUMNS[i] if i < len(SOIL_COLUMNS) else f"band_{i + 1}"
+        paths.append(geotiff(f"{directory}/{name}.tif", size, seed=seed + i, bounds=bounds, descriptions=[name]))
+    return paths
@@ -0,0 +1,20 @@
+import io
+
+import soil_model as sm
+import synthetic_data
+from depth_layers import process_layered_soil_data
+from tools import load_tool
+
+
+def test_layered_outputs_share_the_flat_schema():
+    df = synthetic_data.soil_table(8)
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    flat = load_tool("soil_processor").process_soil_data([("soil.xlsx", output.getvalue())])
+    derived = [column for column in flat.columns if column not in [*df.columns, "Source", "Sheet"]]
+
+    layers, aggregates = process_layered_soil_data(synthetic_data.layered_soil_table(8))
+    for frame in (layers, aggregates):
+        assert [column for column in frame.columns if column in derived] == derived
+        for texture, bounds in zip(frame["Soil_Texture"], frame["Friction_Bounds"]):
+            assert bounds == sm.FRICTION_ANGLE_BOUNDS.get(texture, (None, None))
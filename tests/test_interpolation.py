@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from interpolation import build_trees
+
+
+def _boreholes():
+    return pd.DataFrame({"Longitude": [14.1, np.nan, 14.3, 14.4], "Latitude": [44.1, 44.2, np.inf, 44.4],
+                         "phi": [30.0, 31.0, 32.0, np.nan], "Cohesion": [10.0, 11.0, 12.0, 13.0]})
+
+
+def test_trees_leave_out_non_finite_coordinates_and_values():
+    (phi_tree, phi), (cohesion_tree, cohesion) = build_trees(_boreholes(), ["phi", "Cohesion"], None)
+    assert phi_tree.n == 1 and phi.ravel().tolist() == [30.0]
+    assert cohesion_tree.n == 2 and cohesion.ravel().tolist() == [10.0, 13.0]
+
+
+def test_no_usable_borehole_is_an_error():
+    with pytest.raises(ValueError, match="Longitude and Latitude"):
+        build_trees(_boreholes().assign(Latitude=np.nan), ["phi"], None)
+    with pytest.raises(ValueError, match="value for phi"):
+        build_trees(_boreholes().assign(phi=np.nan), ["phi"], None)
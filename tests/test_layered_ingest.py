@@ -0,0 +1,36 @@
+import io
+
+import pandas as pd
+
+import synthetic_data
+from tools import load_tool
+
+
+class _Job:
+    id = "test"
+    tool = "soil_processor"
+
+    def report(self, fraction, message=None):
+        pass
+
+
+def _workbook(sheets):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output) as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    return output.getvalue()
+
+
+def test_layered_path_skips_sheets_without_layer_columns():
+    data = synthetic_data.layered_soil_table(4)
+    legend = pd.DataFrame({"Name": ["BH-1", "BH-2"], "Site": ["North", "South"]})
+    notes = pd.DataFrame({"Notes": ["values from SoilGrids"]})
+    workbook = ("site.xlsx", _workbook({"notes": notes, "data": data, "legend": legend}))
+
+    layers, aggregates = load_tool("soil_processor").processing_job(_Job(), [workbook])
+
+    assert set(layers["Sheet"]) == {"data"}
+    assert len(layers) == len(data) * len(synthetic_data.SOILGRIDS_DEPTHS)
+    assert layers["Bulk_Density"].notna().all()
+    assert set(aggregates["Sheet"]) == {"data"}
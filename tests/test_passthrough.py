@@ -0,0 +1,28 @@
+import io
+
+import pandas as pd
+
+import synthetic_data
+from ingest import NUMERIC, read_workbooks
+from tools import load_tool
+
+
+def _xlsx(df):
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    return output.getvalue()
+
+
+def test_keep_other_passes_user_columns_through():
+    df = pd.DataFrame({"sr.no": [1, 2], "Northing": [5000000.0, 5000100.0], "Easting": [500000, 500100],
+                       "Borehole": ["BH-A", "BH-B"]})
+    data = read_workbooks([("points.xlsx", _xlsx(df))], {"Northing": NUMERIC, "Easting": NUMERIC}, keep_other=True)
+    assert data["sr.no"].tolist() == [1, 2]
+    assert data["Borehole"].tolist() == ["BH-A", "BH-B"]
+
+
+def test_soil_processor_keeps_user_columns():
+    df = synthetic_data.lonlat_points(5).join(synthetic_data.soil_table(5)).assign(Borehole=list("ABCDE"))
+    result = load_tool("soil_processor").process_soil_data([("soil.xlsx", _xlsx(df))])
+    assert result["Borehole"].tolist() == list("ABCDE")
+    assert result["Bulk_Density"].notna().all()
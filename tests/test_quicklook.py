@@ -0,0 +1,36 @@
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+
+from instrumentation import track_run
+from quicklook import band_preview
+
+
+def _geotiff(path, height, width, **profile):
+    data = np.arange(height * width, dtype="int32").reshape(height, width)
+    with rasterio.open(path, "w", driver="GTiff", height=height, width=width, count=1, dtype="int32",
+                       crs="EPSG:4326", transform=from_bounds(0, 0, 1, 1, width, height), **profile) as dst:
+        dst.write(data, 1)
+    return data
+
+
+def test_single_strip_raster_is_sampled_by_rows(tmp_path):
+    path = tmp_path / "strip.tif"
+    data = _geotiff(path, 600, 500, blockysize=600, compress="deflate")
+    with rasterio.open(path) as src:
+        assert src.block_shapes[0] == (600, 500)
+        thumbnail, source = band_preview(src, 1, size=50, max_pixels=10_000)
+    assert source == "sampled rows"
+    assert thumbnail.shape == (50, 42)
+    assert thumbnail[0, 0] in data[6]  # the raster row under the first thumbnail row's centre
+
+
+def test_large_tiles_are_sampled_within_the_pixel_budget(tmp_path):
+    path = tmp_path / "tiled.tif"
+    _geotiff(path, 1024, 1024, tiled=True, blockxsize=256, blockysize=256)
+    with track_run("quicklook") as stats:
+        with rasterio.open(path) as src:
+            thumbnail, source = band_preview(src, 1, size=64, max_pixels=4 * 256 * 256)
+    assert source == "sampled blocks"
+    assert thumbnail.shape == (64, 64)
+    assert stats.counters["blocks sampled"] == 4
@@ -0,0 +1,16 @@
+import numpy as np
+
+from raster_catalog import CELLS_PER_RASTER, RasterCatalog
+
+
+def _entry(west, south, size):
+    return {"path": f"{west}_{south}.tif", "footprint": [west, south, west + size, south + size]}
+
+
+def test_grid_stays_small_for_tiny_footprints_far_apart():
+    entries = [_entry(-170, -80, 1e-4), _entry(170, 80, 1e-4), _entry(0, 0, 1e-4)]
+    catalog = RasterCatalog(entries)
+    assert catalog.shape[0] * catalog.shape[1] <= (np.sqrt(CELLS_PER_RASTER * len(entries)) + 1) ** 2
+    point, raster = catalog.candidates([-170 + 5e-5, 0 + 5e-5, 50], [-80 + 5e-5, 0 + 5e-5, 50])
+    assert point.tolist() == [0, 1]
+    assert raster.tolist() == [0, 2]
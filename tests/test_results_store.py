@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from results_store import ResultsStore
+
+
+def _frame(n=100):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"Site": ["BH"] * n, "Longitude": rng.uniform(0, 1, n), "Latitude": rng.uniform(0, 1, n),
+                         "Soil_Texture": ["Loam"] * n, "Cohesiveness": ["Cohesive"] * n,
+                         "Clay": rng.uniform(0, 50, n)})
+
+
+def test_user_site_column_is_kept(tmp_path):
+    store = ResultsStore(str(tmp_path))
+    store.append(_frame(), "North", "run1", "soil_processor")
+    table = store.scan(columns=["Site", "Site_input"]).to_pandas()
+    assert set(table["Site"]) == {"North"}
+    assert set(table["Site_input"]) == {"BH"}
+
+
+def test_column_cache_is_bounded(tmp_path):
+    store = ResultsStore(str(tmp_path), max_cache_bytes=2000)
+    for run in range(4):
+        store.append(_frame(), "North", f"run{run}", "soil_processor")
+    for bbox in [(0, 0, 1, 0.5), (0, 0.5, 1, 1)]:
+        assert store.scan(bbox=bbox, where=[("Clay", ">", 10)]).num_rows
+    assert 0 < store._cached_bytes <= 2000 or len(store._columns) == 1
+    assert store._cached_bytes == sum(array.nbytes for array in store._columns.values())
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+import soil_model as sm
+import synthetic_data
+from uncertainty import TARGETS, monte_carlo
+
+
+def test_percentiles_are_nan_exactly_where_the_derivation_is():
+    raw = synthetic_data.soil_table(300, seed=7)
+    derived = pd.DataFrame(sm.derive_properties({name: raw[name].to_numpy() for name in sm.RAW_COLUMNS}))
+    df = pd.concat([raw, derived], axis=1)
+
+    percentiles = monte_carlo(df, n_samples=200, seed=0)
+
+    for target in TARGETS:
+        missing = np.isnan(derived[target].to_numpy(dtype=float))
+        for q in (5, 50, 95):
+            np.testing.assert_array_equal(percentiles[f"{target}_P{q}"].isna().to_numpy(), missing)
+        low, mid, high = (percentiles[f"{target}_P{q}"].to_numpy() for q in (5, 50, 95))
+        assert np.all(low[~missing] <= mid[~missing]) and np.all(mid[~missing] <= high[~missing])
@@ -0,0 +1,33 @@
+"""Import the Streamlit tool scripts (1.py ... 4.py) as ordinary modules.
+
+The scripts build their UI at import time, which is harmless outside
+``streamlit run``: widgets return their defaults and nothing is rendered.
+"""
+import importlib.util
+import logging
+import os
+
+TOOL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOOL_SCRIPTS = {
+    "tiff_processor": "1.py",
+    "kmz_generator": "2.py",
+    "kmz_extractor": "3.py",
+    "soil_processor": "4.py",
+}
+
+_loaded = {}
+
+
+def load_tool(name):
+    """Return the module for one of TOOL_SCRIPTS, importing it once per process."""
+    if name not in _loaded:
+        # Bare-mode Streamlit warns on every widget call; that noise is expected here
+        logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(lambda record: False)
+
+        path = os.path.join(TOOL_DIR, TOOL_SCRIPTS[name])
+        spec = importlib.util.spec_from_file_location(f"tool_{name}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded[name] = module
+    return _loaded[name]
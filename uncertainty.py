@@ -0,0 +1,126 @@
+"""Monte Carlo uncertainty for the derived soil properties of 4.py.
+
+For every row the measured inputs (bulk density, SOC, water content at 33 kPa,
+coarse fragments) are drawn from normal distributions around their values, and
+each table bound pair (cmin/cmax, pdmin/pdmax, phi_min/phi_max, n_min/n_max) is
+scaled by one random factor shared by both bounds, so min stays below max.
+Texture class, and with it the table row, is kept fixed. The derivations of
+soil_model then run once on a whole (rows x samples) block; rows are processed
+in blocks so memory stays bounded whatever the number of rows. Where the
+deterministic value of a target is NaN (e.g. no table entry for the texture)
+its percentiles are NaN too.
+"""
+import numpy as np
+import pandas as pd
+
+import soil_model as sm
+from instrumentation import count, stage
+
+PERCENTILES = (5, 50, 95)
+TARGETS = ("Adjusted_Cohesion", "phi", "SPT_N_Values")
+
+# Coefficient of variation of each sampled input, and of the table bounds
+INPUT_CV = {
+    "Bulk_Density": 0.05,
+    "Soil_Organic_Carbon": 0.15,
+    "Vol_Water_Content_33kPa": 0.10,
+    "Coarse_Fragments_Percentage": 0.10,
+}
+BOUND_CV = 0.05
+
+BLOCK_ELEMENTS = 250_000  # rows x samples evaluated at once
+
+
+def _percentiles(values, q):
+    """Percentiles along axis 1, ignoring NaN; one sort instead of nanpercentile's per-row loop."""
+    values = np.sort(values, axis=1)  # NaN sorts last
+    valid = (~np.isnan(values)).sum(axis=1)
+    position = np.asarray(q, dtype=float)[:, None] / 100 * np.maximum(valid - 1, 0)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, np.maximum(valid - 1, 0))
+    rows = np.arange(values.shape[0])
+    result = values[rows, low] + (position - low) * (values[rows, high] - values[rows, low])
+    return np.where(valid > 0, result, np.nan)  # (len(q), rows)
+
+
+def _simulate_block(df, rng, n_samples, input_cv, bound_cv):
+    """Sampled Adjusted_Cohesion, phi and SPT N for a block of rows, each of shape (rows, samples)."""
+    shape = (len(df), n_samples)
+    codes = sm.texture_codes(df["Soil_Texture"])[:, None]
+
+    def sample_input(column, upper=None):
+        value = df[column].to_numpy(dtype=float)[:, None]
+        sampled = value * (1 + input_cv.get(column, 0) * rng.standard_normal(shape))
+        return np.clip(sampled, 0, upper)
+
+    def bound_factor():
+        # One non-negative factor per (min, max) pair keeps min <= max
+        return np.maximum(1 + bound_cv * rng.standard_normal(shape), 0)
+
+    def sample_bounds(table):
+        bounds, factor = sm.lookup(table, codes), bound_factor()
+        return [bounds[..., i] * factor for i in range(bounds.shape[-1])]
+
+    bulk_density = np.maximum(sample_input("Bulk_Density"), 1e-6)
+    soc_percent = sample_input("Soil_Organic_Carbon") * 100
+    water_33kpa = sample_input("Vol_Water_Content_33kPa")
+    coarse_fragments = sample_input("Coarse_Fragments_Percentage", 100)
+    clay, silt, sand = (df[c].to_numpy(dtype=float)[:, None] for c in ("Clay_Content", "Silt", "Sand"))
+
+    # Cohesion
+    dry_density = bulk_density / (1 + water_33kpa / 100)
+    pdmin, pdmax = sample_bounds(sm.DRY_DENSITY_VALUES)
+    cmin, cmax = sample_bounds(sm.COHESION_VALUES)
+    cohesion = sm.cohesion(dry_density, pdmin, pdmax, cmin, cmax, soc_percent)
+    limits = [
+        sm.atterberg_limit(sm.lookup(table, codes), clay, silt, sand, coarse_fragments, soc_percent / 100, water_33kpa)
+        for table in (sm.LIQUID_LIMIT_COEFFICIENTS, sm.PLASTIC_LIMIT_COEFFICIENTS)
+    ]
+    alpha_pi = sm.lookup(sm.ALPHA_PI_VALUES, codes)[..., 0]
+    adjusted_cohesion = sm.adjusted_cohesion(cohesion, alpha_pi, limits[0] - limits[1], coarse_fragments)
+
+    # Friction angle
+    pp_min, pp_max = np.moveaxis(sm.lookup(sm.PARTICLE_DENSITY_BOUNDS, codes), -1, 0)
+    factor = bound_factor()
+    n_min = (1 - bulk_density / pp_min) * 100 * factor
+    n_max = (1 - bulk_density / pp_max) * 100 * factor
+    phi_min, phi_max = sample_bounds(sm.FRICTION_ANGLE_VALUES)
+    delta_phi = sm.delta_phi(sm.lookup(sm.DELTA_PHI_VALUES, codes), soc_percent)
+    phi = sm.friction_angle(bulk_density, (1 - n_max / 100) * pp_max, (1 - n_min / 100) * pp_min,
+                            phi_min, phi_max, soc_percent, delta_phi)
+
+    spt_n = sm.spt_n_value(sm.lookup(sm.N_VALUE_COEFFICIENTS, codes), bulk_density)
+    samples = {"Adjusted_Cohesion": adjusted_cohesion, "phi": phi, "SPT_N_Values": spt_n}
+    # No samples where the deterministic derivation has no value
+    return {target: np.where(np.isnan(df[target].to_numpy(dtype=float))[:, None], np.nan, values)
+            for target, values in samples.items()}
+
+
+def monte_carlo(df, n_samples=1000, percentiles=PERCENTILES, input_cv=None, bound_cv=BOUND_CV,
+                seed=None, progress=None):
+    """Percentiles of Adjusted_Cohesion, phi and SPT_N_Values over ``n_samples`` draws per row.
+
+    ``df`` is the frame returned by process_soil_data; targets that are NaN
+    there get NaN percentiles. Returns a frame on the
+    same index with one column per target and percentile, e.g.
+    ``Adjusted_Cohesion_P50``. ``progress`` gets the fraction of rows done.
+    """
+    input_cv = INPUT_CV if input_cv is None else input_cv
+    rng = np.random.default_rng(seed)
+    block_rows = max(1, BLOCK_ELEMENTS // n_samples)
+    results = {target: np.full((len(percentiles), len(df)), np.nan) for target in TARGETS}
+
+    with stage("Monte Carlo"):
+        for start in range(0, len(df), block_rows):
+            block = df.iloc[start:start + block_rows]
+            samples = _simulate_block(block, rng, n_samples, input_cv, bound_cv)
+            for target in TARGETS:
+                results[target][:, start:start + len(block)] = _percentiles(samples[target], percentiles)
+            if progress is not None:
+                progress(min(start + block_rows, len(df)) / len(df))
+    count("Monte Carlo samples", len(df) * n_samples)
+
+    return pd.DataFrame(
+        {f"{target}_P{q:g}": results[target][i] for target in TARGETS for i, q in enumerate(percentiles)},
+        index=df.index,
+    )